@@ -0,0 +1,179 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+import extraction_planner
+from low_memory_abridge import download_to_file
+from make_abridged_ipo import make_abridged_ipo
+from output_store import store_results
+
+PDF_URL_TEMPLATE = "https://anns.sgp1.cdn.digitaloceanspaces.com/{}.pdf"
+STATE_PATH = os.path.join("json", "watcher_state.json")
+POLL_INTERVAL = 60  # seconds
+MAX_WORKERS = 2
+MAX_IN_FLIGHT = 8  # announcements downloading/abridging/extracting at once, the rest wait for the next poll
+
+PDF_LINK = re.compile(r"""(https?://[^\s"'<>]+?/)?(\d+)\.pdf""")
+
+
+def fetch_listing(listing_url):
+    """
+    Return {announcement id: pdf url} for every PDF linked from the listing.
+
+    Any page that links to <id>.pdf works (HTML, JSON or plain text), so a
+    local HTTP server serving a file is enough to test against.
+    """
+    response = httpx.get(listing_url, follow_redirects=True, timeout=30)
+    response.raise_for_status()
+
+    announcements = {}
+    for base, announcement_id in PDF_LINK.findall(response.text):
+        if base:
+            announcements[int(announcement_id)] = f"{base}{announcement_id}.pdf"
+        else:
+            announcements.setdefault(int(announcement_id), PDF_URL_TEMPLATE.format(announcement_id))
+    return announcements
+
+
+def load_state(state_path=STATE_PATH):
+    """
+    The watcher's progress. Every announcement id <= high_water_mark is finished,
+    done_above holds finished ids above it (workers finish out of order).
+    """
+    state = {"high_water_mark": 0, "done_above": [], "failed": []}
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state.update(json.load(f))
+        except Exception as e:
+            print(f"ERROR: Failed to read watcher state {state_path}: {e}")
+            sys.exit(1)
+    return state
+
+
+def save_state(state, state_path=STATE_PATH):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    temp_path = state_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=4)
+    os.replace(temp_path, state_path)  # atomic, a crash never leaves a half-written state
+
+
+def process_announcement(announcement_id, pdf_url, ocr=False):
+    """Download, abridge and extract one announcement, then store the results."""
+    os.makedirs("pdf", exist_ok=True)
+    pdf_name = f"{announcement_id}.pdf"
+    download_to_file(pdf_url, os.path.join("pdf", pdf_name))
+    make_abridged_ipo(pdf_name, writer="insert", ocr=ocr)
+
+    abridged_path = os.path.join("pdf", f"{announcement_id}_abridged.pdf")
+    results = extraction_planner.extract_targets(abridged_path)
+    store_results(str(announcement_id), financials=results.get("financials"), business=results.get("proceeds"))
+
+    output_path = os.path.join("json", f"{announcement_id}_ipo.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"✅ {announcement_id} saved to {output_path}")
+
+
+class AnnouncementWatcher:
+    """Polls a listing and feeds new announcements through a bounded worker pool."""
+
+    def __init__(self, listing_url, state_path=STATE_PATH, max_workers=MAX_WORKERS,
+                 max_in_flight=MAX_IN_FLIGHT, process=process_announcement):
+        self.listing_url = listing_url
+        self.state_path = state_path
+        self.max_in_flight = max_in_flight
+        self.process = process
+        self.state = load_state(state_path)
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def is_done(self, announcement_id):
+        return announcement_id <= self.state["high_water_mark"] or announcement_id in self.state["done_above"]
+
+    def poll(self):
+        """Check the listing once and queue new announcements. Returns the ids queued."""
+        try:
+            announcements = fetch_listing(self.listing_url)
+        except Exception as e:
+            print(f"ERROR: Failed to fetch listing {self.listing_url}: {e}")
+            return []
+
+        queued = []
+        with self.lock:
+            for announcement_id in sorted(announcements):
+                if self.is_done(announcement_id) or announcement_id in self.in_flight:
+                    continue
+                if len(self.in_flight) >= self.max_in_flight:
+                    break  # back-pressure, picked up again on the next poll
+                self.in_flight.add(announcement_id)
+                queued.append(announcement_id)
+                self.executor.submit(self.run, announcement_id, announcements[announcement_id])
+
+        if queued:
+            print(f"Queued {len(queued)} new announcements: {queued}")
+        return queued
+
+    def run(self, announcement_id, pdf_url):
+        failed = False
+        try:
+            self.process(announcement_id, pdf_url)
+        except Exception as e:
+            # A failed document is not retried forever, it is recorded for a manual re-run
+            print(f"ERROR: Failed to process announcement {announcement_id}: {e}")
+            failed = True
+        finally:
+            self.finish(announcement_id, failed)
+
+    def finish(self, announcement_id, failed):
+        with self.lock:
+            self.in_flight.discard(announcement_id)
+            done = set(self.state["done_above"])
+            done.add(announcement_id)
+            if failed:
+                self.state["failed"] = sorted(set(self.state["failed"]) | {announcement_id})
+
+            # Advance the high-water mark past everything finished below the oldest in-flight id
+            lowest_in_flight = min(self.in_flight) if self.in_flight else None
+            for finished_id in sorted(done):
+                if lowest_in_flight is not None and finished_id > lowest_in_flight:
+                    break
+                self.state["high_water_mark"] = max(self.state["high_water_mark"], finished_id)
+                done.discard(finished_id)
+
+            self.state["done_above"] = sorted(done)
+            save_state(self.state, self.state_path)
+
+    def watch(self, poll_interval=POLL_INTERVAL):
+        print(f"Watching {self.listing_url} every {poll_interval}s "
+              f"(high-water mark {self.state['high_water_mark']})")
+        try:
+            while True:
+                self.poll()
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for in-flight announcements to finish...")
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch an announcement listing and extract new IPO PDFs.")
+    parser.add_argument("listing_url", help="Page listing the announcement PDFs")
+    parser.add_argument("--interval", type=int, default=POLL_INTERVAL, help="Seconds between polls")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Announcements processed at once")
+    parser.add_argument("--state", default=STATE_PATH, help="Where the high-water mark is kept")
+    parser.add_argument("--ocr", action="store_true", help="OCR the titles of scanned pages (needs Tesseract)")
+    args = parser.parse_args()
+
+    process = partial(process_announcement, ocr=args.ocr)
+    AnnouncementWatcher(args.listing_url, args.state, args.workers, process=process).watch(args.interval)
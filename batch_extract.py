@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+from google.genai import types
+
+import extraction_planner
+import listed_companies
+import prompt_registry
+import sector_classifier
+import validation
+from output_store import store_results
+from tracing import span
+
+BATCH_DIR = os.path.join("json", "batches")
+# The batch API caps the requests of one job, a big archive goes out as several jobs
+MAX_REQUESTS_PER_JOB = 500
+POLL_INTERVAL = 60  # seconds, batch jobs take minutes to hours
+DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED", "JOB_STATE_FAILED",
+               "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+
+def build_requests(documents, targets=("financials", "proceeds"), client=None, merged=True, tickers=None):
+    """
+    Upload the abridged PDFs and build one batch request per document.
+
+    Latency does not matter in a batch, so by default every document is one
+    merged request (the pages are paid for once). The sector and peers are
+    answered locally first, as in extraction_planner.extract_targets.
+
+    Args:
+        documents (dict): {document id: abridged PDF path}.
+        tickers (dict): {document id: stock ticker} where known, stored with the results.
+
+    Returns:
+        tuple: (request lines, manifest) where the manifest keeps what is needed
+               to fan the answers back out per document.
+    """
+    client = client or extraction_planner.client
+    base_prompts = {target: prompt_registry.get_prompt(target) for target in targets}
+    lines = []
+    manifest = {"targets": list(targets), "merged": merged, "documents": {}}
+
+    for document_id, pdf_path in documents.items():
+        with open(pdf_path, "rb") as f:
+            pdf_data = f.read()
+        prompts, classification = sector_classifier.prepare_prompts(pdf_data, base_prompts)
+        prompts, peers = listed_companies.prepare_prompts(pdf_data, prompts)
+
+        with span("upload_file", document_id=document_id, bytes=len(pdf_data)):
+            uploaded = client.files.upload(file=pdf_path, config={"mime_type": "application/pdf"})
+
+        calls = {document_id: extraction_planner.merged_prompt(targets, prompts)} if merged else \
+            {f"{document_id}:{target}": prompts[target] for target in targets}
+        for key, prompt in calls.items():
+            lines.append({
+                "key": key,
+                "request": {
+                    "contents": [{"role": "user", "parts": [
+                        {"file_data": {"file_uri": uploaded.uri, "mime_type": "application/pdf"}},
+                        {"text": prompt},
+                    ]}],
+                    "generation_config": {"temperature": 0.5},
+                },
+            })
+
+        manifest["documents"][document_id] = {
+            "pdf_path": pdf_path,
+            "file": uploaded.name,
+            "keys": list(calls),
+            "prompt_hashes": {key: prompt_registry.content_hash(prompt) for key, prompt in calls.items()},
+            "classification": classification,
+            "peers": peers,
+            "ticker": (tickers or {}).get(document_id),
+        }
+    return lines, manifest
+
+
+def write_jsonl(lines, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def save_manifest(manifest, path):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    os.replace(temp_path, path)  # a crash while polling never loses the job name
+
+
+def submit(input_path, display_name, model=extraction_planner.MODEL, client=None):
+    """Upload the request file and create the batch job. Returns the job name."""
+    client = client or extraction_planner.client
+    with span("submit_batch", batch=display_name):
+        uploaded = client.files.upload(file=input_path, config={"mime_type": "jsonl", "display_name": display_name})
+        job = client.batches.create(model=model, src=uploaded.name, config={"display_name": display_name})
+    print(f"Submitted batch {display_name} as {job.name}")
+    return job.name
+
+
+def wait(job_name, client=None, poll_interval=POLL_INTERVAL):
+    """Poll the job until it is finished. Returns the final job."""
+    client = client or extraction_planner.client
+    with span("wait_batch", job=job_name) as attrs:
+        while True:
+            job = client.batches.get(name=job_name)
+            state = job.state.name if hasattr(job.state, "name") else str(job.state)
+            if state in DONE_STATES:
+                attrs["state"] = state
+                return job
+            print(f"Batch {job_name}: {state}")
+            time.sleep(poll_interval)
+
+
+def response_text(response):
+    """The text of a batch response line, which is a GenerateContentResponse as JSON."""
+    parts = (response.get("candidates") or [{}])[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+def collect(job, client=None):
+    """{request key: parsed JSON answer} from a finished job, failed requests are left out."""
+    client = client or extraction_planner.client
+    if job.dest is None or not job.dest.file_name:
+        print(f"ERROR: Batch {job.name} has no results ({job.state}): {job.error}")
+        return {}
+
+    answers = {}
+    content = client.files.download(file=job.dest.file_name)
+    for line in content.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "error" in record:
+            print(f"ERROR: Batch request {record.get('key')} failed: {record['error']}")
+            continue
+        answers[record["key"]] = extraction_planner.parse_json_response(response_text(record.get("response", {})))
+    return answers
+
+
+def output_file(document_id, targets, results):
+    """
+    (file name, data) the interactive scripts write for these targets:
+    <id>_financial.json as ipo_financials, <id>_extracted.json as ipo_proceeds,
+    <id>_ipo.json with both as ipo.py.
+    """
+    if list(targets) == ["financials"]:
+        return f"{document_id}_financial.json", results["financials"]
+    if list(targets) == ["proceeds"]:
+        return f"{document_id}_extracted.json", results["proceeds"]
+    return f"{document_id}_ipo.json", results
+
+
+def fan_out(answers, manifest, output_dir="json"):
+    """
+    Write every answered document's results to the store and to the same
+    per-document JSON file the interactive scripts write (see output_file).
+    Documents without an answer are skipped, so the next backfill picks them
+    up again.
+    """
+    targets = manifest["targets"]
+    written = []
+    for document_id, document in manifest["documents"].items():
+        if not any(key in answers for key in document["keys"]):
+            print(f"ERROR: No answer for {document_id} in batch {manifest.get('job')}, not saved")
+            continue
+        if manifest["merged"]:
+            data = answers.get(document_id, {})
+            results = {target: data.get(target, {}) for target in targets}
+        else:
+            results = {target: answers.get(f"{document_id}:{target}", {}) for target in targets}
+
+        results = sector_classifier.apply_classification(results, document["classification"])
+        results = listed_companies.apply_peers(results, document["peers"])
+        results, issues = validation.validate_document(results)
+        for item in issues:
+            if item["rule"] != "unit_normalised":
+                print(f"WARNING: {document_id} [{item['target']}] {item['path']}: {item['message']}")
+
+        store_results(document_id, ticker=document.get("ticker"), financials=results.get("financials"),
+                      business=results.get("proceeds"))
+        file_name, data = output_file(document_id, targets, results)
+        output_path = os.path.join(output_dir, file_name)
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+            written.append(output_path)
+        except Exception as e:
+            print(f"ERROR: Failed to write {output_path}: {e}")
+    return written
+
+
+def run_batch(documents, targets=("financials", "proceeds"), model=extraction_planner.MODEL, client=None,
+              poll_interval=POLL_INTERVAL, batch_dir=BATCH_DIR, merged=True, tickers=None):
+    """
+    Extract many abridged PDFs through batch jobs of at most MAX_REQUESTS_PER_JOB
+    requests each, then write the per-document outputs. Every job is
+    submitted before any is waited for, so the jobs run at the same time.
+
+    Args:
+        documents (dict): {document id: abridged PDF path}.
+        tickers (dict): {document id: stock ticker} where known.
+        client: anything with the genai Client's files and batches, e.g. LocalBatchClient.
+
+    Returns:
+        list: The output JSON paths written.
+    """
+    client = client or extraction_planner.client
+    per_job = MAX_REQUESTS_PER_JOB if merged else MAX_REQUESTS_PER_JOB // len(targets)
+    document_ids = list(documents)
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    manifests = []
+
+    for chunk_start in range(0, len(document_ids), per_job):
+        chunk = {document_id: documents[document_id] for document_id in document_ids[chunk_start:chunk_start + per_job]}
+        name = f"ipo_{stamp}_{chunk_start // per_job}"
+        lines, manifest = build_requests(chunk, targets, client, merged, tickers)
+        input_path = os.path.join(batch_dir, f"{name}_input.jsonl")
+        manifest_path = os.path.join(batch_dir, f"{name}_manifest.json")
+        write_jsonl(lines, input_path)
+
+        manifest["job"] = submit(input_path, name, model, client)
+        save_manifest(manifest, manifest_path)
+        manifests.append(manifest)
+
+    written = []
+    for manifest in manifests:
+        # The jobs run side by side, waiting on the first still lets the others progress
+        job = wait(manifest["job"], client, poll_interval)
+        written += fan_out(collect(job, client), manifest)
+    return written
+
+
+def resume(manifest_path, client=None, poll_interval=POLL_INTERVAL):
+    """Pick up a submitted job after a restart, from its manifest."""
+    client = client or extraction_planner.client
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    job = wait(manifest["job"], client, poll_interval)
+    return fan_out(collect(job, client), manifest)
+
+
+class _LocalFiles:
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self.paths = {}
+
+    def upload(self, file, config=None):
+        name = f"files/{len(self.paths)}"
+        self.paths[name] = file
+        return types.File(name=name, uri=f"local://{name}")
+
+    def download(self, file):
+        with open(self.paths[file], "rb") as f:
+            return f.read()
+
+
+class _LocalBatches:
+    def __init__(self, files, generate):
+        self.files = files
+        self.generate = generate
+        self.jobs = {}
+
+    def create(self, model, src, config=None):
+        """Run every request of the input file right away and write the output file."""
+        output_lines = []
+        with open(self.files.paths[src], "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                parts = record["request"]["contents"][0]["parts"]
+                pdf_path = self.files.paths[parts[0]["file_data"]["file_uri"].replace("local://", "")]
+                try:
+                    text = self.generate(model, pdf_path, parts[1]["text"])
+                    output_lines.append({"key": record["key"], "response": {
+                        "candidates": [{"content": {"parts": [{"text": text}]}}]}})
+                except Exception as e:
+                    output_lines.append({"key": record["key"], "error": {"message": str(e)}})
+
+        name = f"batches/{len(self.jobs)}"
+        output_path = os.path.join(self.files.work_dir, f"{name.replace('/', '_')}_output.jsonl")
+        write_jsonl(output_lines, output_path)
+        self.files.paths[output_path] = output_path
+        self.jobs[name] = types.BatchJob(name=name, state=types.JobState.JOB_STATE_SUCCEEDED,
+                                         dest=types.BatchJobDestination(file_name=output_path))
+        return self.jobs[name]
+
+    def get(self, name):
+        return self.jobs[name]
+
+
+class LocalBatchClient:
+    """
+    Stands in for the genai Client's files and batches, answering each batch
+    request with generate(model, pdf_path, prompt) -> response text. Without a
+    generate function the requests go to generate_content one by one, which is
+    handy to check a small batch before paying for a real one.
+    """
+
+    def __init__(self, generate=None, work_dir=BATCH_DIR):
+        os.makedirs(work_dir, exist_ok=True)
+        self.files = _LocalFiles(work_dir)
+        self.batches = _LocalBatches(self.files, generate or self.generate_content)
+
+    @staticmethod
+    def generate_content(model, pdf_path, prompt):
+        with open(pdf_path, "rb") as f:
+            pdf_data = f.read()
+        response = extraction_planner.client.models.generate_content(
+            model=model,
+            config=types.GenerateContentConfig(temperature=0.5),
+            contents=[types.Part.from_bytes(data=pdf_data, mime_type='application/pdf'), prompt],
+        )
+        return response.text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract many abridged IPO PDFs through the batch API.")
+    parser.add_argument("pdf_paths", nargs="*", help="Abridged PDFs, the document id is the file name")
+    parser.add_argument("--resume", help="Manifest of a submitted job to wait for and fan out")
+    parser.add_argument("--local", action="store_true", help="Run the requests one by one instead of as a batch job")
+    parser.add_argument("--poll-interval", type=int, default=POLL_INTERVAL)
+    args = parser.parse_args()
+
+    client = LocalBatchClient() if args.local else None
+    if args.resume:
+        written = resume(args.resume, client, args.poll_interval)
+    else:
+        documents = {os.path.splitext(os.path.basename(path))[0]: path for path in args.pdf_paths}
+        if not documents:
+            parser.error("no PDFs given")
+        written = run_batch(documents, client=client, poll_interval=args.poll_interval)
+    print(f"✅ Batch complete, {len(written)} documents saved")
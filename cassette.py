@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+import fitz  # pymupdf is imported as fitz
+from google.genai import types
+
+import prompt_registry
+from page_index import EMPTY_TEXT_HASH, text_hash
+from tracing import span
+
+CASSETTE_DIR = os.path.join("json", "cassettes")
+# record: answer from the cassette, call the model and record when there is none
+# replay: answer from the cassette only, a missing answer is an error (no API calls at all)
+MODES = ["record", "replay"]
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def image_page_hash(doc, page):
+    """Hash of a page's content streams and image data, independent of the file it is in."""
+    digest = hashlib.sha1(page.read_contents())
+    for image in page.get_images(full=False):
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+def page_hashes(pdf_data):
+    """
+    Text hash of every page. Equal for re-abridged copies with the same page set, whatever their bytes.
+    Pages without text (scans) all have the same text hash, they are hashed by their content and images.
+    """
+    doc = fitz.open(stream=pdf_data, filetype="pdf")
+    try:
+        hashes = []
+        for page in doc:
+            page_text_hash = text_hash(page)
+            if page_text_hash == EMPTY_TEXT_HASH:
+                page_text_hash = "image:" + image_page_hash(doc, page)
+            hashes.append(page_text_hash)
+        return hashes
+    finally:
+        doc.close()
+
+
+def request_key(model, pages, prompt, temperature):
+    """
+    Key of one model request: the model, its settings, the prompt text and the
+    pages sent. An abridger change that selects other pages, or a prompt change,
+    gives a new key and so a new recording.
+    """
+    request = json.dumps({"model": model, "temperature": temperature, "prompt": prompt_registry.content_hash(prompt),
+                          "pages": pages})
+    return prompt_registry.content_hash(request)
+
+
+def split_contents(contents):
+    """(PDF bytes, prompt text) of a generate_content contents list."""
+    pdf_data = b""
+    texts = []
+    for part in contents:
+        if isinstance(part, str):
+            texts.append(part)
+        elif getattr(part, "inline_data", None) is not None:
+            pdf_data += part.inline_data.data
+        elif getattr(part, "text", None):
+            texts.append(part.text)
+    return pdf_data, "\n".join(texts)
+
+
+def make_response(text, usage):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(**usage),
+    )
+
+
+class CassetteModels:
+    """Stands in for client.models, answering generate_content from recordings."""
+
+    def __init__(self, models, mode, cassette_dir):
+        self.models = models
+        self.mode = mode
+        self.cassette_dir = cassette_dir
+        self.calls = []  # one record per request: key, hit, tokens, recorded seconds
+        self.lock = threading.Lock()
+
+    def generate_content(self, model, contents, config=None):
+        pdf_data, prompt = split_contents(contents)
+        pages = page_hashes(pdf_data) if pdf_data else []
+        temperature = getattr(config, "temperature", None)
+        key = request_key(model, pages, prompt, temperature)
+        path = os.path.join(self.cassette_dir, f"{key}.json")
+
+        hit = os.path.exists(path)
+        if hit:
+            with open(path, "r", encoding="utf-8") as f:
+                recording = json.load(f)
+        elif self.mode == "replay":
+            self.log(key, False, {}, 0.0)
+            raise CassetteMiss(f"No recording {key} for {model} ({len(pages)} pages), run with record first")
+        else:
+            with span("record_request", key=key, model=model):
+                start = time.perf_counter()
+                response = self.models.generate_content(model=model, contents=contents, config=config)
+                seconds = time.perf_counter() - start
+            usage = response.usage_metadata
+            recording = {
+                "key": key,
+                "model": model,
+                "temperature": temperature,
+                "prompt_hash": prompt_registry.content_hash(prompt),
+                "pages": pages,
+                "text": response.text,
+                "usage": {
+                    "prompt_token_count": usage.prompt_token_count if usage else None,
+                    "candidates_token_count": usage.candidates_token_count if usage else None,
+                },
+                "seconds": round(seconds, 3),
+                "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            os.makedirs(self.cassette_dir, exist_ok=True)
+            temp_path = path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(recording, f, indent=4, ensure_ascii=False)
+            os.replace(temp_path, path)
+
+        self.log(key, hit, recording["usage"], recording["seconds"])
+        return make_response(recording["text"], recording["usage"])
+
+    def log(self, key, hit, usage, seconds):
+        with self.lock:
+            self.calls.append({"key": key, "hit": hit, "prompt_tokens": usage.get("prompt_token_count") or 0,
+                               "output_tokens": usage.get("candidates_token_count") or 0, "seconds": seconds})
+
+    def __getattr__(self, name):
+        return getattr(self.models, name)
+
+
+class CassetteClient:
+    """A genai Client whose models.generate_content goes through a cassette, everything else is passed on."""
+
+    def __init__(self, client, mode="replay", cassette_dir=CASSETTE_DIR):
+        if mode not in MODES:
+            print(f"ERROR: Unknown cassette mode '{mode}', expected one of {MODES}")
+            sys.exit(1)
+        self.client = client
+        self.models = CassetteModels(client.models, mode, cassette_dir)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def install(mode="replay", cassette_dir=CASSETTE_DIR):
+    """Route extraction_planner's model calls through a cassette. Returns the CassetteClient."""
+    import extraction_planner
+
+    if isinstance(extraction_planner.client, CassetteClient):
+        extraction_planner.client = extraction_planner.client.client
+    extraction_planner.client = CassetteClient(extraction_planner.client, mode, cassette_dir)
+    return extraction_planner.client
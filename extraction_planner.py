@@ -0,0 +1,363 @@
+import os
+import json
+import sys
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import fitz  # pymupdf is imported as fitz
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+from tracing import span, add_token_counts
+import validation
+import prompt_registry
+import sector_classifier
+import listed_companies
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.expanduser("~"), ".passkey", ".env"))
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+if not GOOGLE_API_KEY:
+    print("Error: Missing GOOGLE_API_KEY in .env file")
+    sys.exit(1)
+
+# Configure Gemini API
+try:
+    client = genai.Client(api_key=GOOGLE_API_KEY)
+except Exception as e:
+    print(f"Error configuring Gemini API: {e}")
+    sys.exit(1)
+
+
+MODEL = "gemini-2.0-flash"
+
+# Rough size of the JSON answer for every target we know how to extract (prompts are in prompt_registry).
+# Output sizes are taken from the example outputs in the prompt files (~4 chars per token).
+TARGETS = {
+    "financials": {"expected_output_tokens": 2200},
+    "proceeds": {"expected_output_tokens": 1200},
+}
+
+# Gemini bills every PDF page as a fixed number of input tokens
+TOKENS_PER_PAGE = 258
+CHARS_PER_TOKEN = 4
+
+# Rough throughput of the model, used to estimate latency
+INPUT_TOKENS_PER_SECOND = 20000
+OUTPUT_TOKENS_PER_SECOND = 150
+
+# USD per 1M tokens for gemini-2.0-flash
+INPUT_PRICE = 0.10
+OUTPUT_PRICE = 0.40
+
+# What one second of waiting is worth in USD, used to trade latency against cost
+SECOND_PRICE = 0.0005
+
+PLAN_LOG = os.path.join("json", "plans.jsonl")
+BENCHMARK_LOG = os.path.join("json", "plan_benchmarks.jsonl")
+
+
+def read_target_prompt(target):
+    return prompt_registry.get_prompt(target)
+
+
+def load_pdf(source):
+    """Return the PDF bytes for a URL or a local path."""
+    with span("load_pdf", document=source) as attrs:
+        if source.startswith("http://") or source.startswith("https://"):
+            response = httpx.get(source)
+            response.raise_for_status()
+            pdf_data = response.content
+        else:
+            with open(source, "rb") as f:
+                pdf_data = f.read()
+        attrs["bytes"] = len(pdf_data)
+    return pdf_data
+
+
+def count_pages(pdf_data):
+    doc = fitz.open(stream=pdf_data, filetype="pdf")
+    num_pages = len(doc)
+    doc.close()
+    return num_pages
+
+
+def merged_prompt(targets, prompts):
+    """Combine several target prompts into one, asking for one key per target."""
+    return prompt_registry.compose(targets, prompts)
+
+
+def estimate_call(num_pages, prompt_tokens, output_tokens):
+    """Estimate (latency seconds, cost USD) of one generate_content call."""
+    input_tokens = num_pages * TOKENS_PER_PAGE + prompt_tokens
+    latency = input_tokens / INPUT_TOKENS_PER_SECOND + output_tokens / OUTPUT_TOKENS_PER_SECOND
+    cost = (input_tokens * INPUT_PRICE + output_tokens * OUTPUT_PRICE) / 1_000_000
+    return latency, cost
+
+
+def plan_extraction(num_pages, targets, prompts, document_id=None, log=True):
+    """
+    Decide whether to run the targets as one merged call or as parallel calls.
+
+    A merged call pays for the document pages once but generates every answer
+    sequentially, parallel calls pay for the pages once per target but their
+    answers are generated at the same time. The strategy with the lower
+    cost + latency * SECOND_PRICE wins.
+
+    Returns:
+        dict: The plan, with the chosen "strategy" and the estimates behind it.
+    """
+    prompt_tokens = {target: len(prompts[target]) // CHARS_PER_TOKEN for target in targets}
+    output_tokens = {target: TARGETS[target]["expected_output_tokens"] for target in targets}
+
+    merged_latency, merged_cost = estimate_call(
+        num_pages, sum(prompt_tokens.values()), sum(output_tokens.values())
+    )
+
+    parallel_latency = 0.0
+    parallel_cost = 0.0
+    for target in targets:
+        latency, cost = estimate_call(num_pages, prompt_tokens[target], output_tokens[target])
+        parallel_latency = max(parallel_latency, latency)
+        parallel_cost += cost
+
+    estimates = {
+        "merged": {"latency": round(merged_latency, 2), "cost": round(merged_cost, 6)},
+        "parallel": {"latency": round(parallel_latency, 2), "cost": round(parallel_cost, 6)},
+    }
+
+    if len(targets) > 1 and score(estimates["merged"]) < score(estimates["parallel"]):
+        strategy = "merged"
+    else:
+        strategy = "parallel"
+
+    plan = {
+        "document_id": document_id,
+        "targets": list(targets),
+        "num_pages": num_pages,
+        "strategy": strategy,
+        "estimates": estimates,
+        "prompt_hashes": {target: prompt_registry.content_hash(prompts[target]) for target in targets},
+        "planned_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    if log:
+        append_jsonl(PLAN_LOG, plan)
+
+    return plan
+
+
+def score(estimate):
+    return estimate["cost"] + estimate["latency"] * SECOND_PRICE
+
+
+def append_jsonl(path, record):
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"ERROR: Failed to record to {path}: {e}")
+
+
+def parse_json_response(text):
+    """Pull the JSON object out of a model response, {} if there is none."""
+    match = re.search(r"\{.*}", text or "", re.DOTALL)
+    if not match:
+        print("ERROR: Could not extract JSON from Gemini response.")
+        return {}
+
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        print(f"ERROR: JSON decoding error: {e}")
+        return {}
+
+
+def generate_json(pdf_data, prompt, model=MODEL, temperature=0.5):
+    """
+    Send one PDF and prompt to Gemini and parse the JSON in the response.
+
+    Returns:
+        tuple: (data, usage) where data is the parsed JSON ({} on failure) and
+               usage is the response usage_metadata (None on failure).
+    """
+    try:
+        with span("generate_content", model=model, bytes=len(pdf_data)) as attrs:
+            response = client.models.generate_content(
+                model=model,
+                config=types.GenerateContentConfig(temperature=temperature),
+                contents=[
+                    types.Part.from_bytes(data=pdf_data, mime_type='application/pdf'),
+                    prompt
+                ]
+            )
+            add_token_counts(attrs, response)
+
+        return parse_json_response(response.text), getattr(response, "usage_metadata", None)
+
+    except Exception as e:
+        print(f"ERROR: Gemini processing failed: {e}")
+        return {}, None
+
+
+def run_merged(pdf_data, targets, prompts, model=MODEL):
+    data, usage = generate_json(pdf_data, merged_prompt(targets, prompts), model)
+    results = {target: data.get(target, {}) for target in targets}
+    return results, [usage]
+
+
+def run_parallel(pdf_data, targets, prompts, model=MODEL):
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        futures = {target: executor.submit(generate_json, pdf_data, prompts[target], model) for target in targets}
+        outputs = {target: future.result() for target, future in futures.items()}
+
+    results = {target: outputs[target][0] for target in targets}
+    return results, [outputs[target][1] for target in targets]
+
+
+def run_plan(pdf_data, plan, prompts, model=MODEL):
+    """Execute a plan returned by plan_extraction. Returns {target: data}."""
+    if plan["strategy"] == "merged":
+        results, _ = run_merged(pdf_data, plan["targets"], prompts, model)
+    else:
+        results, _ = run_parallel(pdf_data, plan["targets"], prompts, model)
+    return results
+
+
+def extract_targets(source, targets=("financials", "proceeds"), validate=True):
+    """
+    Plan and run the extraction of targets from a PDF URL or path.
+
+    The sector is classified locally and only left to the model when the
+    classifier is not confident, the Bursa peers are always found locally.
+    With validate, units are normalised and only the fields failing
+    validation are re-extracted, once.
+
+    Documents over windowed_extract.MAX_PAGES_PER_REQUEST pages are extracted
+    in overlapping windows and merged, the results then carry a "provenance"
+    key with the pages every field came from.
+    """
+    print(f"Processing PDF: {source}")
+    pdf_data = load_pdf(source)
+    prompts = {target: read_target_prompt(target) for target in targets}
+    document_id = os.path.splitext(os.path.basename(source))[0]
+    prompts, classification = sector_classifier.prepare_prompts(pdf_data, prompts)
+    prompts, peers = listed_companies.prepare_prompts(pdf_data, prompts)
+
+    import windowed_extract  # imports this module, so not at the top
+
+    num_pages = count_pages(pdf_data)
+    provenance = None
+    if num_pages > windowed_extract.MAX_PAGES_PER_REQUEST:
+        results, provenance = windowed_extract.extract_windowed(pdf_data, targets, prompts, document_id)
+    else:
+        plan = plan_extraction(num_pages, targets, prompts, document_id)
+        print(f"Plan for {document_id}: {plan['strategy']} {plan['estimates']}")
+        results = run_plan(pdf_data, plan, prompts)
+    results = sector_classifier.apply_classification(results, classification)
+    results = listed_companies.apply_peers(results, peers)
+    if provenance is not None:
+        results["provenance"] = provenance
+    if not validate:
+        return results
+
+    results, issues = validation.validate_document(results)
+    fields = validation.failing_fields(issues)
+    if fields and provenance is not None:
+        # Re-extracting would send the whole oversized document again
+        print(f"Not re-extracting {fields} for {document_id}, the document is too long for one request")
+    elif fields:
+        print(f"Re-extracting {fields} for {document_id}")
+        with span("reextract", document_id=document_id, fields=json.dumps(fields)):
+            results, issues = validation.reextract(pdf_data, results, issues, prompts)
+    for item in issues:
+        if item["rule"] != "unit_normalised":
+            print(f"WARNING: {document_id} [{item['target']}] {item['path']}: {item['message']}")
+    return results
+
+
+def measured_cost(usages):
+    input_tokens = 0
+    output_tokens = 0
+    for usage in usages:
+        if usage is None:
+            continue
+        input_tokens += usage.prompt_token_count or 0
+        output_tokens += usage.candidates_token_count or 0
+    cost = (input_tokens * INPUT_PRICE + output_tokens * OUTPUT_PRICE) / 1_000_000
+    return input_tokens, output_tokens, cost
+
+
+def benchmark_plans(source, targets=("financials", "proceeds"), runs=1):
+    """
+    Run every strategy against a real document and check the planner's choice.
+
+    Each strategy is timed over `runs` runs and its token usage is converted
+    to cost. The strategy the planner would have picked is compared with the
+    measured winner (scored the same way as the planner) and the
+    result is appended to json/plan_benchmarks.jsonl.
+    """
+    pdf_data = load_pdf(source)
+    prompts = {target: read_target_prompt(target) for target in targets}
+    document_id = os.path.splitext(os.path.basename(source))[0]
+    plan = plan_extraction(count_pages(pdf_data), targets, prompts, document_id, log=False)
+
+    measured = {}
+    for strategy, runner in (("merged", run_merged), ("parallel", run_parallel)):
+        latencies = []
+        usages = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            _, run_usages = runner(pdf_data, targets, prompts)
+            latencies.append(time.perf_counter() - start)
+            usages.extend(run_usages)
+
+        input_tokens, output_tokens, cost = measured_cost(usages)
+        measured[strategy] = {
+            "latency": round(sum(latencies) / runs, 2),
+            "cost": round(cost / runs, 6),
+            "input_tokens": input_tokens // runs,
+            "output_tokens": output_tokens // runs,
+        }
+
+    if score(measured["merged"]) < score(measured["parallel"]):
+        winner = "merged"
+    else:
+        winner = "parallel"
+
+    result = {
+        "document_id": document_id,
+        "targets": list(targets),
+        "num_pages": plan["num_pages"],
+        "planned": plan["strategy"],
+        "measured_winner": winner,
+        "planner_correct": plan["strategy"] == winner,
+        "estimates": plan["estimates"],
+        "measured": measured,
+        "runs": runs,
+    }
+    append_jsonl(BENCHMARK_LOG, result)
+    return result
+
+
+if __name__ == "__main__":
+    # Usage: python extraction_planner.py <pdf url or path> [--benchmark]
+    source = sys.argv[1] if len(sys.argv) > 1 else "https://anns.sgp1.cdn.digitaloceanspaces.com/3542085.pdf"
+
+    if "--benchmark" in sys.argv:
+        print(json.dumps(benchmark_plans(source), indent=4))
+    else:
+        results = extract_targets(source)
+        filename = os.path.splitext(os.path.basename(source))[0]
+        output_path = os.path.join("json", f"{filename}_ipo.json")
+        try:
+            os.makedirs("json", exist_ok=True)
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=4, ensure_ascii=False)
+            print(f"✅ Extraction complete! Data saved to {output_path}")
+        except Exception as e:
+            print(f"ERROR: Failed to write JSON: {e}")
@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import httpx
+
+import extraction_planner
+import listed_companies
+import prompt_registry
+import sector_classifier
+from low_memory_abridge import ABRIDGERS, DOWNLOAD_CHUNK_SIZE
+from output_store import store_results
+from staged_pipeline import abridge_to_bytes
+from tracing import span
+
+DEFAULT_PORT = 8080
+MAX_WORKERS = 4  # jobs downloading/abridging/extracting at once, match the API quota
+MAX_CACHED_RESULTS = 256  # finished jobs kept for instant answers, the oldest are dropped
+LATENCY_WINDOW = 500  # jobs the latency percentiles are computed over
+MAX_UPLOAD_MB = 200
+WORK_DIR = "pdf"
+# document_id ends up in file names and the results store, nothing that can leave the directory
+DOCUMENT_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,99}$")
+
+
+def job_key(source, targets, mode, abridge, image_dpi=None):
+    """
+    Identical requests share a key: same URL (or same uploaded bytes), targets,
+    abridger, image DPI and prompt versions. A prompt change gives new keys, so cached
+    results of the old prompts are never served.
+    """
+    prompts = prompt_registry.versions()
+    request = json.dumps([source, sorted(targets), mode, abridge, image_dpi, [prompts[target] for target in sorted(targets)]])
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()[:16]
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * share))], 3)
+
+
+class Job:
+    def __init__(self, key, document_id, targets, mode, abridge, url=None, pdf_path=None, image_dpi=None):
+        self.key = key
+        self.document_id = document_id
+        self.targets = targets
+        self.mode = mode
+        self.abridge = abridge
+        self.url = url
+        self.pdf_path = pdf_path
+        self.image_dpi = image_dpi
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.event = threading.Event()
+
+    def to_dict(self, with_result=True):
+        data = {
+            "job_id": self.key,
+            "document_id": self.document_id,
+            "status": self.status,
+            "targets": list(self.targets),
+            "queue_seconds": round(self.started - self.submitted, 3) if self.started else None,
+            "run_seconds": round(self.finished - self.started, 3) if self.finished and self.started else None,
+        }
+        if self.error:
+            data["error"] = self.error
+        if with_result and self.status == "done":
+            data["result"] = self.result
+        return data
+
+
+class ExtractionService:
+    """
+    Runs extraction jobs in a warm process: the Gemini client, the httpx
+    connection pool, the prompts and the local sector and company indexes are
+    set up once instead of on every invocation.
+
+    Concurrent identical requests are coalesced onto the one in-flight job and
+    finished results are answered from memory.
+
+    process(job) -> results can be swapped out, e.g. to test the service
+    without calling the model.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, work_dir=WORK_DIR, process=None,
+                 max_cached=MAX_CACHED_RESULTS):
+        self.work_dir = work_dir
+        self.process = process or self.extract
+        self.max_cached = max_cached
+        self.http = httpx.Client(follow_redirects=True, timeout=120)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = OrderedDict()  # key -> Job, in-flight and cached
+        self.lock = threading.Lock()
+        self.counts = {"submitted": 0, "cache_hits": 0, "coalesced": 0, "done": 0, "failed": 0}
+        self.queue_latencies = deque(maxlen=LATENCY_WINDOW)
+        self.run_latencies = deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+
+    def warm_up(self, targets=("financials", "proceeds")):
+        """Load everything a first job would otherwise wait for."""
+        with span("warm_up"):
+            for target in targets:
+                prompt_registry.load(target)
+            sector_classifier.get_index()
+            listed_companies.get_index()
+
+    def submit(self, targets=("financials", "proceeds"), mode="ipo", abridge=True, url=None,
+               pdf_data=None, document_id=None, image_dpi=None):
+        """
+        Queue a job for a PDF URL or uploaded PDF bytes.
+
+        Returns:
+            tuple: (job, how) where how is "queued", "coalesced" (an identical
+                   job is in flight) or "cached" (an identical job is done).
+        """
+        if mode not in ABRIDGERS:
+            raise ValueError(f"mode must be one of {sorted(ABRIDGERS)}")
+        unknown = [target for target in targets if target not in extraction_planner.TARGETS]
+        if unknown:
+            raise ValueError(f"unknown targets {unknown}, expected {sorted(extraction_planner.TARGETS)}")
+        if (url is None) == (pdf_data is None):
+            raise ValueError("give either a url or a PDF upload")
+        if url is not None and not isinstance(url, str):
+            raise ValueError("url must be a string")
+        if document_id is not None and (not isinstance(document_id, str) or not DOCUMENT_ID.match(document_id)):
+            raise ValueError("document_id may only hold letters, digits, '_', '-' and '.' (up to 100)")
+
+        source = url if url is not None else hashlib.sha256(pdf_data).hexdigest()
+        key = job_key(source, targets, mode, abridge, image_dpi)
+        with self.lock:
+            self.counts["submitted"] += 1
+            job = self.jobs.get(key)
+            if job is not None and job.status != "failed":
+                self.jobs.move_to_end(key)
+                how = "cached" if job.status == "done" else "coalesced"
+                self.counts["cache_hits" if how == "cached" else "coalesced"] += 1
+                return job, how
+
+            if document_id is None and url:
+                document_id = os.path.splitext(os.path.basename(urlparse(url).path))[0]
+            if not document_id or not DOCUMENT_ID.match(document_id):
+                document_id = key
+            job = Job(key, document_id, tuple(targets), mode, abridge, url=url, image_dpi=image_dpi)
+            if pdf_data is not None:
+                os.makedirs(self.work_dir, exist_ok=True)
+                job.pdf_path = os.path.join(self.work_dir, f"{key}.pdf")
+                with open(job.pdf_path, "wb") as f:
+                    f.write(pdf_data)
+            self.jobs[key] = job
+            self.evict()
+        self.executor.submit(self.run, job)
+        return job, "queued"
+
+    def evict(self):
+        """Drop the oldest finished jobs past max_cached, in-flight jobs always stay."""
+        finished = [key for key, job in self.jobs.items() if job.status in ("done", "failed")]
+        for key in finished[:max(0, len(finished) - self.max_cached)]:
+            del self.jobs[key]
+
+    def run(self, job):
+        job.started = time.time()
+        job.status = "running"
+        try:
+            with span("service_job", document_id=job.document_id, job_id=job.key):
+                result = self.process(job)
+            with self.lock:
+                job.result = result
+                job.status = "done"
+                self.counts["done"] += 1
+        except Exception as e:
+            print(f"ERROR: Job {job.key} ({job.document_id}) failed: {e}")
+            with self.lock:
+                job.error = str(e)
+                job.status = "failed"
+                self.counts["failed"] += 1
+        finally:
+            job.finished = time.time()
+            with self.lock:
+                self.queue_latencies.append(job.started - job.submitted)
+                self.run_latencies.append(job.finished - job.started)
+            job.event.set()
+
+    def download(self, url, output_path):
+        """Stream a PDF to disk over the service's pooled connections."""
+        with span("download", document=url) as attrs:
+            with self.http.stream("GET", url) as response:
+                response.raise_for_status()
+                with open(output_path, "wb") as f:
+                    for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            attrs["bytes"] = os.path.getsize(output_path)
+        return output_path
+
+    def extract(self, job):
+        """
+        Download, abridge and extract one job, then store the results as the other entry points do.
+        Files are named by the job key, so jobs for one document with other targets or modes never share them.
+        """
+        if job.pdf_path is None:
+            os.makedirs(self.work_dir, exist_ok=True)
+            job.pdf_path = self.download(job.url, os.path.join(self.work_dir, f"{job.key}.pdf"))
+
+        source = job.pdf_path
+        if job.abridge:
+            pdf_data, num_pages = abridge_to_bytes(job.pdf_path, job.mode, job.image_dpi)
+            suffix = "_abridged.pdf" if job.mode == "ipo" else "_financial.pdf"
+            source = job.pdf_path.replace(".pdf", suffix)
+            with open(source, "wb") as f:
+                f.write(pdf_data)
+            print(f"Abridged {job.document_id} to {num_pages} pages")
+
+        results = extraction_planner.extract_targets(source, job.targets)
+        store_results(job.document_id, financials=results.get("financials"), business=results.get("proceeds"))
+        os.makedirs("json", exist_ok=True)
+        with open(os.path.join("json", f"{job.document_id}_{job.key}_ipo.json"), "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        return results
+
+    def get(self, key):
+        with self.lock:
+            return self.jobs.get(key)
+
+    def metrics(self):
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+            queue_latencies = list(self.queue_latencies)
+            run_latencies = list(self.run_latencies)
+            counts = dict(self.counts)
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "cached_results": statuses.count("done"),
+            **counts,
+            "queue_seconds": {"p50": percentile(queue_latencies, 0.5), "p95": percentile(queue_latencies, 0.95)},
+            "run_seconds": {"p50": percentile(run_latencies, 0.5), "p95": percentile(run_latencies, 0.95)},
+            "prompt_versions": prompt_registry.versions(),
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.http.close()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs             JSON {"url": ..., "targets": [...], "mode": "ipo", "abridge": true, "image_dpi": 150, "wait": seconds}
+    POST /jobs?wait=30     a PDF body (application/pdf), options in the query string
+    GET  /jobs/<job id>    status, and the result once done
+    GET  /metrics          queue depths, counts and latency percentiles
+    GET  /health
+    """
+
+    service = None  # set by serve()
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif path == "/metrics":
+            self.send_json(200, self.service.metrics())
+        elif path.startswith("/jobs/"):
+            job = self.service.get(path[len("/jobs/"):])
+            if job is None:
+                self.send_json(404, {"error": "unknown job"})
+            else:
+                self.send_json(200, job.to_dict())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if parsed.path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = self.headers.get("Content-Length") or "0"
+            if not length.isdigit():
+                raise ValueError("Content-Length must be a number of bytes")
+            if int(length) > MAX_UPLOAD_MB * 1024 * 1024:
+                self.send_json(413, {"error": f"uploads are limited to {MAX_UPLOAD_MB} MB"})
+                return
+            body = self.rfile.read(int(length))
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+            if self.headers.get("Content-Type", "").startswith("application/pdf"):
+                options = query
+                pdf_data, url = body, None
+            else:
+                options = json.loads(body or b"{}")
+                if not isinstance(options, dict):
+                    raise ValueError("the JSON body must be an object")
+                options = dict(query, **options)
+                pdf_data, url = None, options.get("url")
+            targets = options.get("targets") or ["financials", "proceeds"]
+            if isinstance(targets, str):
+                targets = targets.split(",")
+            if not isinstance(targets, list) or not all(isinstance(target, str) for target in targets):
+                raise ValueError("targets must be a list of names")
+            abridge = options.get("abridge", True) not in (False, "0", "false")
+            wait = float(options.get("wait") or 0)
+            image_dpi = int(options["image_dpi"]) if options.get("image_dpi") else None
+            job, how = self.service.submit(targets, options.get("mode", "ipo"), abridge, url, pdf_data,
+                                           options.get("document_id"), image_dpi)
+        except (ValueError, TypeError) as e:  # also bad JSON
+            self.send_json(400, {"error": str(e)})
+            return
+
+        if wait:
+            job.event.wait(wait)
+        data = job.to_dict()
+        data["how"] = how
+        self.send_json(200 if job.status in ("done", "failed") else 202, data)
+
+    def log_message(self, format, *args):
+        pass  # jobs print their own progress
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, service=None):
+    service = service or ExtractionService()
+    service.warm_up()
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Extraction service on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping, waiting for running jobs to finish...")
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve IPO PDF extraction over HTTP from a warm process.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Jobs processed at once")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, ExtractionService(max_workers=args.workers))
@@ -1,12 +1,25 @@
+import os
+import sys
 from make_abridged_ipo_financial import make_abridged_financial
-from ipo_g_pdf_financial import extract_pdf_financial
+from ipo_financials import extract_pdf_financial
+from batch_extract import run_batch
 
 
 def main():
     ##  financial versions of pdf
     # stocks  = ["3ren" , "dengkil" , "HI" , "msbpdf" , "panda" , "cuckoo"]
     stocks = ["WTEC"]
-    for stock in stocks:  
+
+    if "--batch" in sys.argv:
+        # Nightly backfills: one batch job for every stock instead of a call each, see batch_extract.py
+        documents = {}
+        for stock in stocks:
+            make_abridged_financial(f"{stock}.pdf")
+            documents[stock] = os.path.join("pdf", f"{stock}_financial.pdf")
+        run_batch(documents, targets=("financials",), tickers={stock: stock for stock in stocks})
+        return
+
+    for stock in stocks:
         stock_name = stock
         pdf_name = f"{stock_name}.pdf"
         financial_name = f"{stock_name}_financial.pdf"
@@ -14,7 +27,7 @@ def main():
         # make_abridged_financial(pdf_name)
 
         # extrac data
-        extract_pdf_financial(pdf_name)
+        extract_pdf_financial(pdf_name, ticker=stock_name)
 
 
 
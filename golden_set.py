@@ -0,0 +1,172 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+import cassette
+from output_store import to_number
+from validation import item_key
+
+# <id>.pdf (the full prospectus) next to <id>.expected.json ({"financials": ..., "proceeds": ...}, labelled by hand)
+GOLDEN_DIR = "golden"
+REPORT_PATH = os.path.join("json", "golden_report.json")
+NUMBER_TOLERANCE = 0.005  # relative, rounding in the prospectus tables
+NUMERIC = re.compile(r"^[\sRM,.\d%()\-]*\d[\sRM,.\d%()\-]*$")
+
+
+def golden_documents(golden_dir=GOLDEN_DIR):
+    """{document id: (pdf path, expected JSON path)} of the golden set."""
+    documents = {}
+    for name in sorted(os.listdir(golden_dir)):
+        if name.endswith(".expected.json"):
+            document_id = name[:-len(".expected.json")]
+            pdf_path = os.path.join(golden_dir, f"{document_id}.pdf")
+            if os.path.exists(pdf_path):
+                documents[document_id] = (pdf_path, os.path.join(golden_dir, name))
+            else:
+                print(f"ERROR: {name} has no {document_id}.pdf next to it, skipped")
+    return documents
+
+
+def leaves(value, path=""):
+    """
+    (path, value) of every leaf. List items are addressed by name where they
+    have one and strings (e.g. bursa_peers) by themselves, so order does not matter.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from leaves(item, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            key = item_key(item)
+            if isinstance(key, tuple):
+                key = key[1]
+            elif not isinstance(item, str):
+                key = index
+            yield from leaves(item, f"{path}[{key}]")
+    else:
+        yield path, value
+
+
+def same_value(expected, actual):
+    if isinstance(expected, (int, float)) or (isinstance(expected, str) and NUMERIC.match(expected)):
+        expected_number, actual_number = to_number(expected), to_number(actual)
+        if expected_number is None or actual_number is None:
+            return expected_number == actual_number
+        return abs(expected_number - actual_number) <= max(abs(expected_number) * NUMBER_TOLERANCE, 0.01)
+    if isinstance(expected, str) and isinstance(actual, str):
+        return " ".join(expected.lower().split()) == " ".join(actual.lower().split())
+    return expected == actual
+
+
+def score_fields(expected, actual):
+    """Field-level accuracy: every labelled leaf must be in the results with the same value."""
+    actual_leaves = dict(leaves(actual))
+    wrong = []
+    total = 0
+    for path, value in leaves(expected):
+        total += 1
+        if path not in actual_leaves or not same_value(value, actual_leaves[path]):
+            wrong.append({"field": path, "expected": value, "actual": actual_leaves.get(path)})
+    return {"fields": total, "correct": total - len(wrong),
+            "accuracy": round((total - len(wrong)) / total, 4) if total else None, "wrong": wrong}
+
+
+def run_document(document_id, pdf_path, expected, client, work_dir):
+    """Abridge and extract one golden document as the pipeline does, timing every stage."""
+    # Both build the model client, which cassette.install has already wrapped by now
+    import extraction_planner
+    from staged_pipeline import abridge_to_bytes
+
+    calls_before = len(client.models.calls)
+    start = time.perf_counter()
+    pdf_data, num_pages = abridge_to_bytes(pdf_path, "ipo")
+    abridged_path = os.path.join(work_dir, f"{document_id}_abridged.pdf")
+    with open(abridged_path, "wb") as f:
+        f.write(pdf_data)
+    abridge_seconds = time.perf_counter() - start
+
+    results = extraction_planner.extract_targets(abridged_path)
+    wall_seconds = time.perf_counter() - start
+    calls = client.models.calls[calls_before:]
+
+    report = {
+        "document_id": document_id,
+        "pages_sent": num_pages,
+        "wall_seconds": round(wall_seconds, 3),
+        "abridge_seconds": round(abridge_seconds, 3),
+        "model_calls": len(calls),
+        # Requests not in the cassettes: errors when replaying, new recordings when recording
+        "cassette_misses": sum(1 for call in calls if not call["hit"]) if client.models.mode == "replay" else 0,
+        "recorded": sum(1 for call in calls if not call["hit"]) if client.models.mode == "record" else 0,
+        "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+        "output_tokens": sum(call["output_tokens"] for call in calls),
+        # What the model took when recorded, replays do not wait for it
+        "recorded_model_seconds": round(sum(call["seconds"] for call in calls), 3),
+    }
+    report.update(score_fields(expected, {key: value for key, value in results.items() if key != "provenance"}))
+    return report
+
+
+def totals(documents):
+    fields = sum(document["fields"] for document in documents)
+    correct = sum(document["correct"] for document in documents)
+    summary = {key: round(sum(document[key] for document in documents), 3)
+               for key in ["wall_seconds", "abridge_seconds", "pages_sent", "model_calls", "cassette_misses", "recorded",
+                           "prompt_tokens", "output_tokens", "recorded_model_seconds", "fields", "correct"]}
+    summary["accuracy"] = round(correct / fields, 4) if fields else None
+    return summary
+
+
+def run_golden_set(golden_dir=GOLDEN_DIR, mode="replay", cassette_dir=cassette.CASSETTE_DIR, work_dir=None):
+    """
+    Run the whole pipeline over the golden set with model calls recorded or
+    replayed, and report time, tokens and field-level accuracy.
+    """
+    client = cassette.install(mode, cassette_dir)
+    work_dir = work_dir or os.path.join(golden_dir, "abridged")
+    os.makedirs(work_dir, exist_ok=True)
+
+    documents = []
+    for document_id, (pdf_path, expected_path) in golden_documents(golden_dir).items():
+        with open(expected_path, "r", encoding="utf-8") as f:
+            expected = json.load(f)
+        documents.append(run_document(document_id, pdf_path, expected, client, work_dir))
+    return {"mode": mode, "totals": totals(documents), "documents": documents}
+
+
+def compare(report, baseline):
+    """Print how the totals moved against an earlier report."""
+    for key, value in report["totals"].items():
+        before = baseline["totals"].get(key)
+        if isinstance(value, (int, float)) and isinstance(before, (int, float)) and value != before:
+            print(f"  {key}: {before} -> {value} ({value - before:+.4g})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the golden set and report time, tokens and accuracy.")
+    parser.add_argument("--golden-dir", default=GOLDEN_DIR)
+    parser.add_argument("--record", action="store_true", help="Call the model for requests not recorded yet")
+    parser.add_argument("--cassettes", default=cassette.CASSETTE_DIR)
+    parser.add_argument("--baseline", help="An earlier report to compare against")
+    parser.add_argument("--output", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    report = run_golden_set(args.golden_dir, "record" if args.record else "replay", args.cassettes)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+
+    for document in report["documents"]:
+        print(f"{document['document_id']}: {document['correct']}/{document['fields']} fields, "
+              f"{document['wall_seconds']}s, {document['prompt_tokens']} tokens sent"
+              + (f", {document['cassette_misses']} not recorded" if document["cassette_misses"] else ""))
+    print(f"Total: {json.dumps(report['totals'])}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print(f"Against {args.baseline}:")
+            compare(report, json.load(f))
+    if report["totals"]["cassette_misses"]:
+        sys.exit(1)
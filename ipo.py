@@ -6,6 +6,9 @@ import httpx
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from output_store import store_results
+import prompt_registry
+from tracing import span, run_profiled, add_token_counts
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.expanduser("~"), ".passkey", ".env"))
@@ -23,46 +26,30 @@ except Exception as e:
     sys.exit(1)
 
 
-def read_prompt_file(relative_path):
-    try:
-        base_dir = os.path.dirname(__file__)
-        # Go up one level from extractor/
-        full_path = os.path.join(base_dir, "..", relative_path)
-        with open(full_path, "r", encoding="utf-8") as f:
-            return f.read()
-    except Exception as e:
-        print(f"ERROR: Failed to read prompt file {relative_path}: {e}")
-        sys.exit(1)
-
-
 def analyze_pdf_with_gemini(pdf_url):
     """Analyze PDF with Gemini AI using both prompts."""
     try:
-        # Read both prompts
-        financial_prompt = read_prompt_file("prompts/ipo_financials.txt")
-        proceeds_prompt = read_prompt_file("prompts/ipo_proceeds.txt")
+        document_id = os.path.splitext(os.path.basename(pdf_url))[0]
 
         # Download the PDF from the URL
-        pdf_data = httpx.get(pdf_url).content
+        with span("httpx.get", document_id=document_id) as attrs:
+            pdf_data = httpx.get(pdf_url).content
+            attrs["bytes"] = len(pdf_data)
 
-        # Combined prompt
-        full_prompt = (
-            "Please extract the following information from the IPO document. "
-            "Respond with a single JSON object containing two main keys: "
-            "`financials` and `proceeds`.\n\n"
-            f"---\n\n[FINANCIALS PROMPT]\n{financial_prompt}\n\n"
-            f"[PROCEEDS PROMPT]\n{proceeds_prompt}"
-        )
+        # Combined prompt, built from both prompts by the registry
+        full_prompt = prompt_registry.compose(["financials", "proceeds"])
 
         # Generate content
-        response = client.models.generate_content(
-            model="gemini-2.5-pro-exp-03-25",
-            config=types.GenerateContentConfig(temperature=0.5),
-            contents=[
-                types.Part.from_bytes(data=pdf_data, mime_type='application/pdf'),
-                full_prompt
-            ]
-        )
+        with span("generate_content", document_id=document_id, model="gemini-2.5-pro-exp-03-25", bytes=len(pdf_data)) as attrs:
+            response = client.models.generate_content(
+                model="gemini-2.5-pro-exp-03-25",
+                config=types.GenerateContentConfig(temperature=0.5),
+                contents=[
+                    types.Part.from_bytes(data=pdf_data, mime_type='application/pdf'),
+                    full_prompt
+                ]
+            )
+            add_token_counts(attrs, response)
 
         print(response.usage_metadata)
 
@@ -100,12 +87,24 @@ def save_combined_json(combined_data, pdf_url):
 
 
 
-def extract_pdf_combined(pdf_url):
+def extract_pdf_combined(pdf_url, export_json=True):
     print(f"Processing PDF from URL: {pdf_url}")
     combined_data = analyze_pdf_with_gemini(pdf_url)
-    save_combined_json(combined_data, pdf_url)
+    store_results(
+        os.path.splitext(os.path.basename(pdf_url))[0],
+        financials=combined_data.get("financials"),
+        business=combined_data.get("proceeds"),
+    )
+    if export_json:
+        save_combined_json(combined_data, pdf_url)
 
 
 if __name__ == "__main__":
     test_url = "https://anns.sgp1.cdn.digitaloceanspaces.com/3542085.pdf"
-    extract_pdf_combined(test_url)
+    if "--profile" in sys.argv:
+        filename = os.path.splitext(os.path.basename(test_url))[0]
+        output_dir = os.path.join(os.path.dirname(__file__), "..", "json")
+        run_profiled(extract_pdf_combined, test_url, output_base=os.path.join(output_dir, f"{filename}_ipo"),
+                     otlp="--otlp" in sys.argv)
+    else:
+        extract_pdf_combined(test_url)
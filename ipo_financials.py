@@ -6,6 +6,9 @@ import httpx
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from output_store import store_results
+import prompt_registry
+from tracing import span, run_profiled, add_token_counts
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.expanduser("~"), ".passkey", ".env"))
@@ -23,33 +26,30 @@ except Exception as e:
     sys.exit(1)
 
 
-def read_prompt():
-    try:
-        with open("ipo_financials.txt", "r", encoding="utf-8") as f:
-            return f.read()
-    except Exception as e:
-        print(f"ERROR: Failed to read prompt file: {e}")
-        sys.exit(1)
-
-
 def analyze_pdf_with_gemini(pdf_url):
     """Download and analyze PDF from URL with Gemini AI."""
     try:
         # Read prompt
-        prompt = read_prompt()
+        prompt = prompt_registry.get_prompt("financials")
+
+        document_id = os.path.splitext(os.path.basename(pdf_url))[0]
 
         # Download the PDF from the URL
-        pdf_data = httpx.get(pdf_url).content
+        with span("httpx.get", document_id=document_id) as attrs:
+            pdf_data = httpx.get(pdf_url).content
+            attrs["bytes"] = len(pdf_data)
 
         # Generate content using Gemini AI
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(temperature=0.5),
-            contents=[
-                types.Part.from_bytes(data=pdf_data, mime_type='application/pdf'),
-                prompt
-            ]
-        )
+        with span("generate_content", document_id=document_id, model="gemini-2.0-flash", bytes=len(pdf_data)) as attrs:
+            response = client.models.generate_content(
+                model="gemini-2.0-flash",
+                config=types.GenerateContentConfig(temperature=0.5),
+                contents=[
+                    types.Part.from_bytes(data=pdf_data, mime_type='application/pdf'),
+                    prompt
+                ]
+            )
+            add_token_counts(attrs, response)
 
         print(response.usage_metadata)
 
@@ -83,13 +83,20 @@ def save_json(data, pdf_url):
         print(f"ERROR: Failed to write JSON: {e}")
 
 
-def extract_pdf_financial(pdf_url):
+def extract_pdf_financial(pdf_url, export_json=True, ticker=None):
     print(f"Processing PDF: {pdf_url}")
     extracted_data = analyze_pdf_with_gemini(pdf_url)
-    save_json(extracted_data, pdf_url)
+    store_results(os.path.splitext(os.path.basename(pdf_url))[0], ticker=ticker, financials=extracted_data)
+    if export_json:
+        save_json(extracted_data, pdf_url)
 
 
 if __name__ == "__main__":
     # Example test URL
     test_url = "https://anns.sgp1.cdn.digitaloceanspaces.com/3443412.pdf"
-    extract_pdf_financial(test_url)
+    if "--profile" in sys.argv:
+        filename = os.path.splitext(os.path.basename(test_url))[0]
+        run_profiled(extract_pdf_financial, test_url, output_base=os.path.join("json", f"{filename}_financial"),
+                     otlp="--otlp" in sys.argv)
+    else:
+        extract_pdf_financial(test_url)
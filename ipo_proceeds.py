@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 import httpx
+from output_store import store_results
+import prompt_registry
+from tracing import span, run_profiled, add_token_counts
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.expanduser("~"), ".passkey", ".env"))
@@ -23,34 +26,30 @@ except Exception as e:
     sys.exit(1)
 
 
-def read_prompt(prompt_file="ipo_proceeds.txt"):
-    try:
-        with open(prompt_file, "r", encoding="utf-8") as f:
-            return f.read()
-    except Exception as e:
-        print(f"ERROR: Failed to read prompt file '{prompt_file}': {e}")
-        sys.exit(1)
-
-
 def analyze_text_with_gemini(pdf_url):
     """Send extracted text to Gemini AI and get structured JSON data."""
     try:
-        response = httpx.get(pdf_url)
-        response.raise_for_status()
-        pdf_data = response.content
-        prompt = read_prompt()
-
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            config=types.GenerateContentConfig(temperature=0.3),
-            contents=[
-                types.Part.from_bytes(
-                    data=pdf_data,
-                    mime_type='application/pdf',
-                ),
-                prompt
-            ]
-        )
+        document_id = os.path.splitext(os.path.basename(pdf_url))[0]
+        with span("httpx.get", document_id=document_id) as attrs:
+            response = httpx.get(pdf_url)
+            response.raise_for_status()
+            pdf_data = response.content
+            attrs["bytes"] = len(pdf_data)
+        prompt = prompt_registry.get_prompt("proceeds")
+
+        with span("generate_content", document_id=document_id, model="gemini-2.0-flash", bytes=len(pdf_data)) as attrs:
+            response = client.models.generate_content(
+                model="gemini-2.0-flash",
+                config=types.GenerateContentConfig(temperature=0.3),
+                contents=[
+                    types.Part.from_bytes(
+                        data=pdf_data,
+                        mime_type='application/pdf',
+                    ),
+                    prompt
+                ]
+            )
+            add_token_counts(attrs, response)
 
         print(response.usage_metadata)
 
@@ -76,9 +75,15 @@ if __name__ == "__main__":
     pdf_url = "https://anns.sgp1.cdn.digitaloceanspaces.com/3510670.pdf"
 
     print(f"Processing PDF: {pdf_url}")
-    structured_data = analyze_text_with_gemini(pdf_url)
-
     pdf_file_name = os.path.splitext(os.path.basename(pdf_url))[0]
+    if "--profile" in sys.argv:
+        structured_data = run_profiled(analyze_text_with_gemini, pdf_url,
+                                       output_base=os.path.join("json", f"{pdf_file_name}_extracted"),
+                                       otlp="--otlp" in sys.argv)
+    else:
+        structured_data = analyze_text_with_gemini(pdf_url)
+
+    store_results(pdf_file_name, business=structured_data)
     output_file = f"json/{pdf_file_name}_extracted.json"
 
     try:
@@ -0,0 +1,312 @@
+import os
+import re
+import sys
+import csv
+import json
+from collections import Counter
+from datetime import date
+import fitz  # pymupdf is imported as fitz
+
+import running_headers
+from tracing import span
+
+# Listed companies, their aliases and listed parents of known subsidiaries. Refresh offline with
+# python listed_companies.py update <csv>
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "listed_companies.json")
+
+# Pages with the industry players table and its notes, plus the pages the table runs on to
+COMPETITOR_KEYWORDS = ["industry player", "competitive overview", "competitive landscape", "competitors"]
+FOLLOWING_PAGES = 2
+TITLE_LINES = 6
+# The next numbered section ("7.4 Industry outlook") ends the table and its notes
+TABLE_END = re.compile(r"^\s*\d+\.\d+(?:\.\d+)*\.?\s+[A-Z][a-z]")
+
+# A word of a company name, never Berhad/Bhd itself, so "ABC Berhad and DEF Berhad" is two names
+NAME_WORD = r"(?:(?!(?:Berhad|Bhd|BERHAD|BHD)\b)[A-Z0-9(][\w&'’.\-()/]*|of|and|&)"
+# A company name ending in Berhad/Bhd on one line, "Sdn Bhd" and "S/B" are filtered out afterwards
+BERHAD_NAME = re.compile(rf"((?:{NAME_WORD}[ \t]+){{1,8}})(Berhad|Bhd|BERHAD|BHD)\b")
+SUBSIDIARY_NOTE = re.compile(
+    rf"subsidiary\s+of\s+((?:{NAME_WORD}\s+){{1,8}}?(?:Berhad|Bhd|BERHAD|BHD))\b", re.IGNORECASE
+)
+WORD = re.compile(r"[a-z0-9&]+(?:['’][a-z0-9&]+)*")
+LEADING_NOISE = re.compile(r"^(?:\(\w{1,3}\)\s*|Notes?:?\s+|Sources?:?\s+|The\s+|Our\s+|and\s+|of\s+|&\s+)+")
+CONNECTORS = {"of", "and", "&"}
+
+
+def words_of(text):
+    """Lower-cased words of the text with their offsets, "Bhd" read as "Berhad"."""
+    words = []
+    for match in WORD.finditer(text.lower()):
+        word = re.sub(r"['’]", "", match.group(0))
+        words.append(("berhad" if word == "bhd" else word, match.start()))
+    return words
+
+
+def normalise_name(name):
+    """ "Top Glove Corporation Bhd." -> ("top", "glove", "corporation", "berhad") """
+    return tuple(word for word, _ in words_of(name))
+
+
+def trim_name(text):
+    """
+    The proper noun a "... Berhad" match ends with: "Our Group (ABC Holdings" -> "ABC Holdings".
+    Text before an unclosed "(" and the lower-case words leading up to the name are dropped.
+    """
+    opened = []
+    for position, char in enumerate(text):
+        if char == "(":
+            opened.append(position)
+        elif char == ")" and opened:
+            opened.pop()
+    if opened:
+        text = text[opened[-1] + 1:]
+
+    words = text.split()
+    start = len(words)
+    while start > 0 and (words[start - 1][0].isupper() or words[start - 1][0].isdigit()
+                         or words[start - 1][0] == "(" or words[start - 1] in CONNECTORS):
+        start -= 1
+    return LEADING_NOISE.sub("", " ".join(words[start:])).strip()
+
+
+def berhad_names(text):
+    """(offset, name) of every "... Berhad" name in the text, "Sdn Bhd" and "S/B" names left out."""
+    names = []
+    for match in BERHAD_NAME.finditer(text):
+        name = trim_name(match.group(1))
+        if not name or name.split()[-1].lower() == "sdn" or "S/B" in name:
+            continue
+        names.append((match.start(), f"{name} {match.group(2)}"))
+    return names
+
+
+def load_index(index_path=INDEX_PATH):
+    if not os.path.exists(index_path):
+        print(f"WARNING: No listed company index at {index_path}, peers are not checked against Bursa listings")
+        return {"updated": None, "companies": []}
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"ERROR: Failed to read listed company index '{index_path}': {e}")
+        sys.exit(1)
+
+
+class CompanyIndex:
+    """
+    Looks up listed companies by any of their names in a single pass over the
+    text: every run of up to max_words words is looked up in a dict of
+    normalised aliases, so the cost grows with the text, not with the index.
+    """
+
+    def __init__(self, companies):
+        self.names = {}  # normalised alias -> listed company name
+        self.parents = {}  # normalised subsidiary name -> listed parent name
+        for company in companies:
+            name = company["name"]
+            aliases = [name] + company.get("aliases", [])
+            if normalise_name(name)[-1:] == ("berhad",) and len(normalise_name(name)) > 2:
+                aliases.append(" ".join(normalise_name(name)[:-1]))  # "Top Glove Corporation"
+            for alias in aliases:
+                self.names[normalise_name(alias)] = name
+            for subsidiary in company.get("subsidiaries", []):
+                self.parents[normalise_name(subsidiary)] = name
+        self.max_words = max((len(alias) for alias in list(self.names) + list(self.parents)), default=0)
+
+    def __len__(self):
+        return len(set(self.names.values()))
+
+    def match(self, text):
+        """
+        (offset, name) of the listed companies and subsidiaries of listed
+        companies named in the text, in order of appearance.
+        """
+        words = words_of(text)
+        keys = [word for word, _ in words]
+        found = []
+        position = 0
+        while position < len(keys):
+            for length in range(min(self.max_words, len(keys) - position), 0, -1):
+                key = tuple(keys[position:position + length])
+                name = self.names.get(key) or self.parents.get(key)
+                if name:
+                    found.append((words[position][1], name))
+                    position += length
+                    break
+            else:
+                position += 1
+        return found
+
+    def resolve(self, name):
+        """A subsidiary's listed parent, or the listed company's own name, or None if unknown."""
+        key = normalise_name(name)
+        return self.parents.get(key) or self.names.get(key)
+
+
+_index = None
+
+
+def get_index():
+    """The index is loaded once per process."""
+    global _index
+    if _index is None:
+        _index = CompanyIndex(load_index()["companies"])
+    return _index
+
+
+def issuer_name(pages_lines):
+    """The Berhad named most often in the prospectus (at least twice), normalised, or None."""
+    counts = Counter()
+    for lines in pages_lines:
+        for _, name in berhad_names("\n".join(lines)):
+            counts[normalise_name(name)] += 1
+    if not counts:
+        return None
+    name, count = counts.most_common(1)[0]
+    return name if count >= 2 else None
+
+
+def competitor_text(pages_lines):
+    """
+    Lines of the industry players table and its notes: from the competitor
+    heading to the next numbered section, over at most FOLLOWING_PAGES more pages.
+    """
+    selected = []
+    following = -1  # pages left after the heading page, -1 outside the table
+    for lines in pages_lines:
+        title = " ".join(lines[:TITLE_LINES]).lower()
+        heading = next((line_num for line_num, line in enumerate(lines[:TITLE_LINES])
+                        if any(keyword in line.lower() for keyword in COMPETITOR_KEYWORDS)), None)
+        if heading is None and any(keyword in title for keyword in COMPETITOR_KEYWORDS):
+            heading = 0  # keyword split over title lines
+        if heading is not None:
+            following = FOLLOWING_PAGES
+            lines = lines[heading + 1:]
+        elif following > 0:
+            following -= 1
+        else:
+            following = -1
+            continue
+
+        for line in lines:
+            if TABLE_END.match(line):
+                following = -1
+                break
+            selected.append(line)
+    return "\n".join(selected)
+
+
+def competitor_pages_text(doc):
+    """Text of the industry players table, empty if the document has none. Running headers are left out."""
+    pages_lines, _ = running_headers.document_lines(doc)
+    return competitor_text(pages_lines)
+
+
+def find_peers(text, index, issuer=None):
+    """
+    The Bursa peers named in the industry players table and its notes.
+
+    Every "... Berhad" name counts except the issuer's (normalised, see
+    issuer_name), "Sdn Bhd" and "S/B" names do not. When a note says a
+    company is a subsidiary of a Berhad, or the index knows its listed
+    parent, the parent is taken instead.
+    """
+    candidates = []
+    for match in SUBSIDIARY_NOTE.finditer(text):
+        candidates.append((match.start(), trim_name(match.group(1))))
+    candidates += berhad_names(text)
+    candidates += index.match(text)
+
+    issuers = {issuer, normalise_name(index.resolve(" ".join(issuer)) or "")} if issuer else set()
+    peers = []
+    seen = set()
+    for _, name in sorted(candidates, key=lambda item: item[0]):
+        name = index.resolve(name) or re.sub(r"\s+", " ", name)
+        key = normalise_name(name)
+        if key and key not in seen and key not in issuers:
+            seen.add(key)
+            peers.append(name)
+    return peers
+
+
+def extract_peers(source, index=None):
+    """Bursa peers of an abridged PDF (path or bytes), None when it has no industry players table."""
+    with span("extract_peers", document=source if isinstance(source, str) else "bytes") as attrs:
+        doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+        try:
+            pages_lines, _ = running_headers.document_lines(doc)
+        finally:
+            doc.close()
+        text = competitor_text(pages_lines)
+        if not text.strip():
+            attrs["peers"] = None
+            return None
+        peers = find_peers(text, index or get_index(), issuer_name(pages_lines))
+        attrs["peers"] = len(peers)
+    return peers
+
+
+def strip_peers_section(prompt):
+    """Replace the Bursa Peers section of a prompt, the peers are found locally."""
+    return re.sub(
+        r"(\d+\.\s+\*\*Bursa Peers\*\*).*?(?=\n\s*\d+\.\s+\*\*)",
+        r"\1\n    * Already extracted, return an empty list for this field.\n",
+        prompt, count=1, flags=re.DOTALL,
+    )
+
+
+def prepare_prompts(pdf_data, prompts, target="proceeds"):
+    """
+    Find the peers locally and drop their section from the target's prompt.
+    Returns (prompts, peers), peers None and the prompt untouched when there is no industry players table.
+    """
+    if target not in prompts:
+        return prompts, None
+    peers = extract_peers(pdf_data)
+    if peers is None:
+        return prompts, None
+    return dict(prompts, **{target: strip_peers_section(prompts[target])}), peers
+
+
+def apply_peers(results, peers, target="proceeds"):
+    if peers is not None and isinstance(results.get(target), dict):
+        results[target]["bursa_peers"] = peers
+    return results
+
+
+def update_index(csv_path, index_path=INDEX_PATH):
+    """
+    Merge a CSV of listed companies into the index. Columns: name, aliases and
+    subsidiaries (both ";"-separated, optional). Rows replace existing entries
+    of the same name.
+    """
+    companies = {normalise_name(c["name"]): c for c in load_index(index_path)["companies"]}
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("name") or "").strip()
+            if not name:
+                continue
+            companies[normalise_name(name)] = {
+                "name": name,
+                "aliases": [a.strip() for a in (row.get("aliases") or "").split(";") if a.strip()],
+                "subsidiaries": [s.strip() for s in (row.get("subsidiaries") or "").split(";") if s.strip()],
+            }
+
+    index = {"updated": date.today().isoformat(),
+             "companies": sorted(companies.values(), key=lambda c: c["name"].lower())}
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=4, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+    print(f"Listed company index now has {len(index['companies'])} companies")
+
+
+if __name__ == "__main__":
+    # Usage: python listed_companies.py update <csv>
+    #        python listed_companies.py <abridged pdf> ...
+    if len(sys.argv) >= 3 and sys.argv[1] == "update":
+        update_index(sys.argv[2])
+        sys.exit(0)
+
+    for pdf_path in sys.argv[1:]:
+        print(pdf_path, json.dumps(extract_peers(pdf_path), indent=4, ensure_ascii=False))
@@ -0,0 +1,295 @@
+import fitz  # pymupdf is imported as fitz
+import os
+import sys
+import time
+import resource
+import tempfile
+import multiprocessing
+from queue import Empty
+import httpx
+
+import make_abridged_ipo
+import make_abridged_ipo_financial
+import running_headers
+from ocr_fallback import fill_missing_titles
+from pdf_writer import page_ranges
+from tracing import span
+
+# Which abridger's keywords to use for each mode
+ABRIDGERS = {
+    "ipo": make_abridged_ipo,
+    "financial": make_abridged_ipo_financial,
+}
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+FLUSH_EVERY_PAGES = 25  # Write the new document to disk after this many pages
+DEFAULT_CEILING_MB = 512
+
+
+class MemoryCeilingExceeded(Exception):
+    pass
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # No /proc (e.g. macOS), fall back to the peak which is the best we have
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    # ru_maxrss survives exec on Linux, so a spawned job would report the parent's size when it forked.
+    # VmHWM belongs to this process's own memory and starts fresh.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024  # KB
+    except (OSError, ValueError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)  # bytes on macOS
+    return peak / 1024  # KB on Linux
+
+
+def check_memory(ceiling_mb, stage):
+    if ceiling_mb is None:
+        return
+    rss = current_rss_mb()
+    if rss > ceiling_mb:
+        raise MemoryCeilingExceeded(f"{stage}: {rss:.0f} MB used, ceiling is {ceiling_mb} MB")
+
+
+def download_to_file(pdf_url, output_path, ceiling_mb=None):
+    """Stream a PDF to disk in chunks instead of holding the whole response in memory."""
+    with span("download", document=pdf_url) as attrs:
+        with httpx.stream("GET", pdf_url, follow_redirects=True) as response:
+            response.raise_for_status()
+            with open(output_path, "wb") as f:
+                for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    check_memory(ceiling_mb, "download")
+        attrs["bytes"] = os.path.getsize(output_path)
+    return output_path
+
+
+def abridge_low_memory(pdf_path, output_path=None, mode="ipo", ceiling_mb=DEFAULT_CEILING_MB, ocr=False):
+    """
+    Abridge a PDF without ever loading it, or the abridged copy, fully into memory.
+
+    The source is opened from its path, so MuPDF reads it from disk on demand
+    (the same footprint as a memory-mapped file, without copying it into a
+    Python buffer) and it is opened only once for both the title scan and the
+    copy. Selected pages are copied range by range with insert_pdf into a fresh
+    document that is flushed to disk with incremental saves and reopened every
+    FLUSH_EVERY_PAGES pages, so the copied objects do not pile up in memory.
+    No garbage collection pass over the full object graph is done. With ocr,
+    the titles of scanned pages are OCR'd one page at a time.
+
+    Raises MemoryCeilingExceeded if the process goes over ceiling_mb.
+
+    Returns:
+        list: The selected page numbers.
+    """
+    abridger = ABRIDGERS[mode]
+    if output_path is None:
+        suffix = "_abridged.pdf" if mode == "ipo" else "_financial.pdf"
+        output_path = pdf_path.replace('.pdf', suffix)
+
+    doc = fitz.open(pdf_path)
+    try:
+        pages_blocks = []
+        page_heights = []
+        for page_num in range(len(doc)):
+            # Only the header/footer bands and the first lines of each page are kept, not all its text
+            height = doc[page_num].rect.height
+            pages_blocks.append(running_headers.title_blocks(running_headers.page_blocks(doc[page_num]), height))
+            page_heights.append(height)
+            if page_num % FLUSH_EVERY_PAGES == 0:
+                check_memory(ceiling_mb, f"title scan page {page_num}")
+        # Titles without the document's running headers and footers, as in extract_titles_from_pdf
+        furniture = running_headers.detect_furniture(pages_blocks, page_heights)
+        titles = [abridger.title_from_lines(running_headers.page_lines(blocks, height, furniture))
+                  for blocks, height in zip(pages_blocks, page_heights)]
+        if ocr:
+            titles = fill_missing_titles(pdf_path, titles, abridger.title_from_lines, furniture, max_workers=1)
+            check_memory(ceiling_mb, "OCR")
+
+        page_numbers = abridger.split_into_sections(titles)
+        print(pdf_path)
+        print("Length of abridged pdf: ", len(page_numbers))
+
+        new_doc = fitz.open()
+        written = False
+        pending = 0
+        for from_page, to_page in page_ranges(page_numbers):
+            new_doc.insert_pdf(doc, from_page=from_page, to_page=to_page)
+            pending += to_page - from_page + 1
+
+            if pending >= FLUSH_EVERY_PAGES:
+                new_doc = flush(new_doc, output_path, written)
+                written = True
+                pending = 0
+                check_memory(ceiling_mb, f"writing page {to_page}")
+
+        new_doc.set_metadata({})  # Clear metadata
+        if written:
+            new_doc.saveIncr()
+        else:
+            new_doc.save(output_path, garbage=1, deflate=True)
+        new_doc.close()
+    finally:
+        doc.close()
+
+    return page_numbers
+
+
+def flush(new_doc, output_path, written):
+    """Write the pages copied so far and reopen the output so they leave memory."""
+    if written:
+        new_doc.saveIncr()
+    else:
+        new_doc.save(output_path, garbage=1, deflate=True)
+    new_doc.close()
+    return fitz.open(output_path)
+
+
+def abridge_url_low_memory(pdf_url, work_dir="pdf", mode="ipo", ceiling_mb=DEFAULT_CEILING_MB, ocr=False):
+    """Download a PDF straight to disk and abridge it in low-memory mode."""
+    os.makedirs(work_dir, exist_ok=True)
+    pdf_path = os.path.join(work_dir, os.path.basename(pdf_url))
+    download_to_file(pdf_url, pdf_path, ceiling_mb)
+    abridge_low_memory(pdf_path, mode=mode, ceiling_mb=ceiling_mb, ocr=ocr)
+    suffix = "_abridged.pdf" if mode == "ipo" else "_financial.pdf"
+    return pdf_path.replace('.pdf', suffix)
+
+
+def _job_wrapper(queue, func, args, ceiling_mb):
+    try:
+        if ceiling_mb is not None:
+            # Hard backstop on top of the RSS checks: MuPDF allocations fail past this
+            limit = int(ceiling_mb * 4 * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        result = func(*args)
+        queue.put(("ok", result, peak_rss_mb()))
+    except MemoryCeilingExceeded as e:
+        queue.put(("memory", str(e), peak_rss_mb()))
+    except MemoryError:
+        queue.put(("memory", "MemoryError", peak_rss_mb()))
+    except Exception as e:
+        queue.put(("error", str(e), peak_rss_mb()))
+
+
+def run_job(func, args=(), ceiling_mb=DEFAULT_CEILING_MB):
+    """
+    Run one job in its own process so its memory is returned when it finishes
+    and going over the ceiling only ends that job.
+
+    Returns:
+        tuple: (status, result, peak_rss_mb) where status is "ok", "memory" or "error".
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_job_wrapper, args=(queue, func, args, ceiling_mb))
+    process.start()
+    outcome = None
+    while outcome is None:
+        try:
+            outcome = queue.get(timeout=1)
+        except Empty:
+            if not process.is_alive():
+                process.join()
+                # SIGKILL without reporting back is what the kernel OOM killer does
+                status = "memory" if process.exitcode == -9 else "error"
+                outcome = (status, f"Job process died with exit code {process.exitcode}", None)
+    process.join()
+    return outcome
+
+
+def abridge_full_memory(pdf_path, output_path, mode="ipo"):
+    """The current abridging method (two opens, select and garbage=4), for comparison."""
+    abridger = ABRIDGERS[mode]
+    page_numbers = abridger.split_into_sections(abridger.extract_titles_from_pdf(pdf_path))
+    with open(pdf_path, "rb") as f:
+        pdf_data = f.read()  # what the extractors hold today
+    doc = fitz.open(stream=pdf_data, filetype="pdf")
+    doc.select(page_numbers)
+    doc.set_metadata({})
+    doc.save(output_path, garbage=4, deflate=True)
+    doc.close()
+    return page_numbers
+
+
+def make_synthetic_pdf(output_path, num_pages=400, image_kb=200):
+    """Write a large scanned-looking PDF: every page carries its own incompressible image."""
+    doc = fitz.open()
+    side = int((image_kb * 1024 / 3) ** 0.5)
+    for page_num in range(num_pages):
+        page = doc.new_page()
+        if page_num % 20 == 0:
+            page.insert_text((72, 80), "Financial Information")
+        else:
+            page.insert_text((72, 80), f"Page {page_num} of the prospectus")
+        pix = fitz.Pixmap(fitz.csRGB, side, side, os.urandom(side * side * 3), False)
+        page.insert_image(fitz.Rect(72, 100, 540, 700), pixmap=pix)
+    doc.save(output_path, deflate=True)
+    doc.close()
+    return output_path
+
+
+def measure_peak_rss(num_pages=400, image_kb=200):
+    """
+    Compare the peak RSS of the low-memory and the current abridging method
+    on a synthetic large file, each run in a fresh process.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = os.path.join(work_dir, "synthetic.pdf")
+        make_synthetic_pdf(pdf_path, num_pages, image_kb)
+        size_mb = os.path.getsize(pdf_path) / (1024 * 1024)
+        print(f"Synthetic PDF: {num_pages} pages, {size_mb:.1f} MB")
+
+        results = {}
+        for name, func, args in (
+            ("low_memory", abridge_low_memory, (pdf_path, os.path.join(work_dir, "low.pdf"), "financial", None)),
+            ("current", abridge_full_memory, (pdf_path, os.path.join(work_dir, "full.pdf"), "financial")),
+        ):
+            start = time.perf_counter()
+            status, _, peak = run_job(func, args, ceiling_mb=None)
+            results[name] = {"status": status, "peak_rss_mb": round(peak or 0, 1),
+                             "seconds": round(time.perf_counter() - start, 2)}
+            print(f"{name}: {results[name]}")
+
+        return results
+
+
+if __name__ == '__main__':
+    # Usage: python low_memory_abridge.py <pdf url or path> [ipo|financial] [--ocr]
+    #        python low_memory_abridge.py --measure
+    if len(sys.argv) > 1 and sys.argv[1] == "--measure":
+        # The same check as test_low_memory_abridge.py, on a bigger file
+        results = measure_peak_rss()
+        failed = [name for name, result in results.items() if result["status"] != "ok"]
+        if failed:
+            print(f"FAIL: {failed} did not finish")
+            sys.exit(1)
+        if results["low_memory"]["peak_rss_mb"] >= results["current"]["peak_rss_mb"]:
+            print("FAIL: low-memory mode did not lower peak RSS")
+            sys.exit(1)
+        print("OK: low-memory mode lowered peak RSS")
+    else:
+        ocr = "--ocr" in sys.argv
+        args = [arg for arg in sys.argv[1:] if arg != "--ocr"]
+        source = args[0] if len(args) > 0 else "https://anns.sgp1.cdn.digitaloceanspaces.com/3542085.pdf"
+        mode = args[1] if len(args) > 1 else "ipo"
+        if source.startswith("http"):
+            status, result, peak = run_job(abridge_url_low_memory, (source, "pdf", mode, DEFAULT_CEILING_MB, ocr))
+        else:
+            status, result, peak = run_job(abridge_low_memory, (source, None, mode, DEFAULT_CEILING_MB, ocr))
+        # peak is None when the job process died without reporting back
+        print(f"{status}: {result} (peak RSS {f'{peak:.0f} MB' if peak is not None else 'unknown'})")
@@ -1,5 +1,10 @@
 import fitz  # pymupdf is imported as fitz
 import os
+from pdf_writer import write_pages
+from ocr_fallback import fill_missing_titles
+import page_index
+import running_headers
+from tracing import span
 
 possible_keywords = [ # Financial Data for the audited years
                     "financial information",
@@ -21,6 +26,21 @@ exclude_keywords = ["sustainability report", "sustainability", "risk management"
                     "forward looking" , 
                     "definitions"]
 
+def title_from_lines(lines):
+    """Returns the potential title from the text lines of a page (see extract_titles_from_pdf)."""
+    potential_title = ""
+    # Heuristic: Take the first few lines as the potential title
+    num_title_lines = min(8, len(lines))  # Consider up to 8 lines
+
+    for i in range(num_title_lines):
+        line = lines[i].strip()  # Remove leading/trailing whitespace
+
+        if len(line) > 5 and len(line) < 150 : # Basic length checks
+            potential_title += line + " "
+
+    return potential_title.strip() #Remove extra space
+
+
 def extract_titles_from_pdf(pdf_path):
     """
     Extracts potential titles from each page of a PDF file.
@@ -41,30 +61,12 @@ def extract_titles_from_pdf(pdf_path):
     try:
         doc = fitz.open(pdf_path)  # Open the PDF using fitz
         num_pages = len(doc)
-        titles = []
-
-        for page_num in range(num_pages):
-            page = doc[page_num]
-
-            # Heuristic: Take the first few lines as the potential title, excluding the header
-            rect = page.rect  # Get the page rectangle
-            header_height = 40 # Define the height of the header to be removed
-            cropped_rect = fitz.Rect(rect.x0, rect.y0 + header_height, rect.x1, rect.y1)  # Define the crop box
-            text = page.get_text("text", clip=cropped_rect)  # Extract text using the crop box
-            lines = text.splitlines()  # Split the text into lines
-
-            potential_title = ""
-            # Heuristic: Take the first few lines as the potential title
-            num_title_lines = min(8, len(lines))  # Consider up to 6 lines
 
-            for i in range(num_title_lines):
-                line = lines[i].strip()  # Remove leading/trailing whitespace
-
-                if len(line) > 5 and len(line) < 150 : # Basic length checks
-                    potential_title += line + " "
-
-            potential_title = potential_title.strip() #Remove extra space
-            titles.append(potential_title)
+        with span("extract_titles", document=pdf_path, pages=num_pages) as attrs:
+            # One pass finds the document's running headers/footers and the page text without them
+            pages_lines, furniture = running_headers.document_lines(doc)
+            titles = [title_from_lines(lines) for lines in pages_lines]
+            attrs["repeated_blocks"] = len(furniture["keys"])
 
         doc.close()
         return titles
@@ -124,22 +126,44 @@ def get_tableofcontents(filename):
     print("Table of Contents : ", toc)
 
 
-def make_abridged_financial(pdf_name):
+def make_abridged_financial(pdf_name, writer="select", ocr=False, dedupe=False, image_dpi=None):
     pdf_file_path =  os.path.join("pdf", pdf_name)  # Replace with your PDF file path
     page_titles = extract_titles_from_pdf(pdf_file_path)
-    page_numbers = split_into_sections(page_titles)
+    if ocr:
+        page_titles = fill_missing_titles(pdf_file_path, page_titles, title_from_lines)  # OCR scanned pages
+    with span("split_into_sections", document=pdf_file_path, pages=len(page_titles)) as attrs:
+        page_numbers = split_into_sections(page_titles)
+        attrs["selected_pages"] = len(page_numbers)
     # get_tableofcontents(pdf_file_path)
 
+    dedupe_plan = None
+    if dedupe:
+        # Skip pages whose results are stored for an identical copy or an earlier version,
+        # page_index.extract_document merges them back
+        conn = page_index.open_index()
+        doc_id = os.path.splitext(pdf_name)[0]
+        dedupe_plan = page_index.plan_pages(conn, doc_id, pdf_file_path, page_numbers, mode="financial")
+        conn.close()
+        page_numbers = dedupe_plan["pages"]
+        print("Skipped already extracted pages: ", len(dedupe_plan["skipped"]))
+        if dedupe_plan["reuse"]:
+            print("Identical to already indexed document: ", dedupe_plan["reuse"])
+            return dedupe_plan
+        if not page_numbers:
+            print("No changed pages since: ", dedupe_plan["previous_version"])
+            return dedupe_plan
+
     print(pdf_file_path)
     print("Length of abridged pdf: ", len(page_numbers))
 
     # Open PDF and create a new one with selected pages
     doc = fitz.open(pdf_file_path)
     new_pdf_name = pdf_file_path.replace('.pdf', '_financial.pdf')
-    doc.select(page_numbers)  # Keep only selected pages
-    doc.set_metadata({})  # Clear metadata
-    doc.save(new_pdf_name, garbage=4, deflate=True)  # Optimize PDF
+    with span("write_pages", document=pdf_file_path, pages=len(page_numbers), writer=writer) as attrs:
+        write_pages(doc, page_numbers, new_pdf_name, writer, image_dpi)  # see pdf_writer.WRITERS
+        attrs["bytes"] = os.path.getsize(new_pdf_name)
     doc.close()
+    return dedupe_plan
 
 
 # Example usage:
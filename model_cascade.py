@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+
+import extraction_planner
+import validation
+from output_store import store_results
+from tracing import span
+
+FAST_MODEL = "gemini-2.0-flash"
+# gemini-2.5-pro-exp-03-25 can get pretty accurate results, but is slower and costs more
+SLOW_MODEL = "gemini-2.5-pro-exp-03-25"
+
+
+def issues_by_target(results, issues):
+    """
+    {target: list of issue messages} for every target in results. Unit
+    conversions the validator fixed itself are not issues.
+    """
+    by_target = {target: [] for target in results}
+    for item in issues:
+        if item["rule"] != "unit_normalised":
+            by_target[item["target"]].append(f"{item['path']}: {item['message']}")
+    return by_target
+
+
+def extract_with_cascade(source, targets=("financials", "proceeds")):
+    """
+    Extract with the fast model, then re-extract only the failing fields on the slow model.
+
+    A field fails when validation.py finds issues with it (required fields
+    null, percentages not summing to ~100, PAT or margins inconsistent,
+    proceeds not matching the amount raised). Only those fields go to the
+    slow model (validation.reextract), and its answers are kept for a target
+    only if they leave fewer issues.
+
+    Returns:
+        tuple: (results, report) where report says which model produced each
+               target, the fields the slow model re-extracted and the issues left.
+    """
+    pdf_data = extraction_planner.load_pdf(source)
+    prompts = {target: extraction_planner.read_target_prompt(target) for target in targets}
+    document_id = os.path.splitext(os.path.basename(source))[0]
+
+    plan = extraction_planner.plan_extraction(extraction_planner.count_pages(pdf_data), targets, prompts, document_id)
+    with span("cascade_fast", document_id=document_id, model=FAST_MODEL):
+        results = extraction_planner.run_plan(pdf_data, plan, prompts, model=FAST_MODEL)
+    results, issues = validation.validate_document(results)
+    by_target = issues_by_target(results, issues)
+    report = {target: {"model": FAST_MODEL, "issues": by_target[target]} for target in targets}
+
+    fields = validation.failing_fields(issues)
+    if fields:
+        print(f"Re-extracting {fields} on {SLOW_MODEL}")
+        with span("cascade_slow", document_id=document_id, model=SLOW_MODEL, fields=json.dumps(fields)):
+            retried, retried_issues = validation.reextract(pdf_data, results, issues, prompts, model=SLOW_MODEL)
+        retried_by_target = issues_by_target(retried, retried_issues)
+        for target in fields:
+            if len(retried_by_target[target]) < len(by_target[target]):
+                results[target] = retried[target]
+                report[target] = {"model": SLOW_MODEL, "fields": fields[target], "issues": retried_by_target[target]}
+
+    return results, report
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "https://anns.sgp1.cdn.digitaloceanspaces.com/3542085.pdf"
+
+    print(f"Processing PDF: {source}")
+    results, report = extract_with_cascade(source)
+    print(json.dumps(report, indent=4))
+
+    filename = os.path.splitext(os.path.basename(source))[0]
+    store_results(filename, financials=results.get("financials"), business=results.get("proceeds"))
+    output_path = os.path.join("json", f"{filename}_ipo.json")
+    try:
+        os.makedirs("json", exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        print(f"✅ Extraction complete! Data saved to {output_path}")
+    except Exception as e:
+        print(f"ERROR: Failed to write JSON: {e}")
@@ -0,0 +1,168 @@
+import fitz  # pymupdf is imported as fitz
+import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import running_headers
+
+OCR_CACHE = os.path.join("json", "ocr_cache.json")
+OCR_LANGUAGE = "eng"
+OCR_DPI = 200
+# OCR only the top of the page: the running header band and the title under it
+TITLE_REGION = running_headers.HEADER_BAND + 0.25
+
+# Part of the cache key, change it when the OCR settings above (or what is cached) change
+OCR_SETTINGS = f"{OCR_LANGUAGE}-{OCR_DPI}-{TITLE_REGION}-blocks"
+
+
+def is_image_only(page):
+    """True if the page has no text layer but does have images, i.e. it is scanned."""
+    return not page.get_text("text").strip() and bool(page.get_images(full=False))
+
+
+def page_hash(doc, page):
+    """Hash of a page's content streams and image data, independent of the file it is in."""
+    digest = hashlib.sha256(OCR_SETTINGS.encode())
+    digest.update(page.read_contents())
+    for image in page.get_images(full=False):
+        digest.update(doc.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+def load_cache(cache_path=OCR_CACHE):
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"ERROR: Failed to read OCR cache {cache_path}: {e}")
+        return {}
+
+
+def save_cache(cache, cache_path=OCR_CACHE):
+    try:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"ERROR: Failed to write OCR cache {cache_path}: {e}")
+
+
+def ocr_page_header(pdf_path, page_num):
+    """
+    OCR the title region of one page with Tesseract. Runs in a worker process.
+
+    The region is rendered to a pixmap and turned into a one-page OCR'd PDF,
+    whose text blocks are read back in the page's own coordinates, so the
+    running headers can be told apart from the title as on text pages.
+
+    Returns:
+        list: running_headers.page_blocks() of the OCR'd region.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        page = doc[page_num]
+        rect = page.rect
+        clip = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height * TITLE_REGION)
+        pix = page.get_pixmap(dpi=OCR_DPI, clip=clip)
+        ocr_pdf = fitz.open("pdf", pix.pdfocr_tobytes(language=OCR_LANGUAGE))
+        scale = clip.height / ocr_pdf[0].rect.height
+        blocks = [(clip.y0 + y0 * scale, clip.y0 + y1 * scale, text)
+                  for y0, y1, text in running_headers.page_blocks(ocr_pdf[0])]
+        ocr_pdf.close()
+        return blocks
+    finally:
+        doc.close()
+
+
+def fill_missing_titles(pdf_path, titles, title_from_lines, furniture=None, max_workers=None, cache_path=OCR_CACHE):
+    """
+    OCR the titles of scanned pages that extract_titles_from_pdf left empty.
+
+    Only pages without a text layer are OCR'd, and each page's OCR'd blocks
+    are cached under its page hash so the same page is never OCR'd twice,
+    even when it shows up in another file. Running headers are dropped with
+    running_headers, matched against the text pages' and the other scanned
+    pages' repeated blocks, before the abridger's title heuristic is applied.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        titles (list): Titles from extract_titles_from_pdf, one per page.
+        title_from_lines (function): The abridger's title heuristic.
+        furniture (dict): running_headers.detect_furniture() of the text pages, found here if not given.
+        max_workers (int): Size of the OCR process pool, defaults to the CPU count.
+
+    Returns:
+        list: The titles with the scanned pages filled in.
+    """
+    titles = list(titles)
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return titles
+
+    cache = load_cache(cache_path)
+    scanned = {}  # page number -> OCR'd blocks
+    heights = {}
+    to_ocr = {}
+    for page_num, title in enumerate(titles):
+        if title:
+            continue
+        page = doc[page_num]
+        if not is_image_only(page):
+            continue
+        heights[page_num] = page.rect.height
+        key = page_hash(doc, page)
+        if key in cache:
+            scanned[page_num] = cache[key]
+        else:
+            to_ocr[page_num] = key
+
+    if heights and furniture is None:
+        furniture = running_headers.detect_furniture(
+            [running_headers.title_blocks(running_headers.page_blocks(page), page.rect.height) for page in doc],
+            [page.rect.height for page in doc])
+    doc.close()
+
+    if to_ocr:
+        print(f"OCR: {len(to_ocr)} scanned pages in {pdf_path}")
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {page_num: executor.submit(ocr_page_header, pdf_path, page_num) for page_num in to_ocr}
+                for page_num, future in futures.items():
+                    scanned[page_num] = future.result()
+                    cache[to_ocr[page_num]] = scanned[page_num]
+        except Exception as e:
+            # Tesseract is optional, without it scanned pages simply keep empty titles
+            print(f"ERROR: OCR failed: {e}")
+        save_cache(cache, cache_path)
+
+    if not scanned:
+        return titles
+
+    # A wholly scanned document has no text pages to learn its headers from, so the scanned pages count too
+    ocr_furniture = running_headers.detect_furniture(list(scanned.values()), [heights[page_num] for page_num in scanned])
+    ocr_furniture = {"keys": furniture["keys"] | ocr_furniture["keys"],
+                     "top": furniture["top"], "bottom": furniture["bottom"]}
+    for page_num, blocks in scanned.items():
+        lines = running_headers.page_lines([tuple(block) for block in blocks], heights[page_num], ocr_furniture)
+        titles[page_num] = title_from_lines(lines)
+    return titles
+
+
+if __name__ == '__main__':
+    import make_abridged_ipo
+
+    pdf_file_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("pdf", "panda.pdf")
+
+    doc = fitz.open(pdf_file_path)
+    empty_titles = [""] * len(doc)
+    doc.close()
+
+    for page_num, title in enumerate(fill_missing_titles(pdf_file_path, empty_titles, make_abridged_ipo.title_from_lines)):
+        if title:
+            print("Page:", page_num, " -   ", title)
@@ -0,0 +1,329 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+from datetime import datetime
+
+STORE_PATH = os.path.join("json", "ipo_store.sqlite")
+
+TABLES = ["documents", "financial_years", "segments", "proceeds_allocations", "competitors"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    ticker TEXT,
+    name TEXT,
+    market_type TEXT,
+    listing_date TEXT,
+    listing_price REAL,
+    latest_fye INTEGER,
+    pat_latest REAL,
+    pe_reported REAL,
+    enlarged_shares_m REAL,
+    sector TEXT,
+    sub_sector TEXT,
+    unbilled_order_book REAL,
+    stored_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS financial_years (
+    doc_id TEXT NOT NULL,
+    ticker TEXT,
+    period TEXT NOT NULL,
+    period_type TEXT NOT NULL,
+    year INTEGER,
+    revenue REAL,
+    pat REAL,
+    pat_margin REAL,
+    cash_equivalent REAL,
+    PRIMARY KEY (doc_id, period)
+);
+CREATE TABLE IF NOT EXISTS segments (
+    doc_id TEXT NOT NULL,
+    ticker TEXT,
+    kind TEXT NOT NULL,
+    name TEXT,
+    revenue REAL,
+    percentage REAL
+);
+CREATE TABLE IF NOT EXISTS proceeds_allocations (
+    doc_id TEXT NOT NULL,
+    ticker TEXT,
+    category TEXT,
+    purpose TEXT,
+    amount REAL,
+    percentage REAL,
+    time_frame_months INTEGER
+);
+CREATE TABLE IF NOT EXISTS competitors (
+    doc_id TEXT NOT NULL,
+    ticker TEXT,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_ticker ON documents (ticker);
+CREATE INDEX IF NOT EXISTS documents_latest_fye ON documents (latest_fye);
+CREATE INDEX IF NOT EXISTS financial_years_ticker ON financial_years (ticker);
+CREATE INDEX IF NOT EXISTS financial_years_fye ON financial_years (period_type, year);
+CREATE INDEX IF NOT EXISTS segments_ticker ON segments (ticker);
+CREATE INDEX IF NOT EXISTS proceeds_allocations_ticker ON proceeds_allocations (ticker);
+CREATE INDEX IF NOT EXISTS competitors_ticker ON competitors (ticker);
+CREATE INDEX IF NOT EXISTS competitors_name ON competitors (name);
+"""
+
+PERIOD_PATTERN = re.compile(r"\b(FYE|FPE)\b.*?((?:19|20)\d{2})", re.IGNORECASE)
+# The first number of a value, "(1,234)" is an accounting negative; "RM'000" is a unit, not a number
+NUMBER = re.compile(r"(\()?(-?\d[\d,]*(?:\.\d+)?|-?\.\d+)(\))?")
+THOUSANDS = re.compile(r"['’]000")
+
+
+def open_store(store_path=STORE_PATH):
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(store_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def to_number(value):
+    """Turn 1234, "1,234", "90.00%", "RM 1.5" or "(1,234)" (-1234) into a float, anything else into None."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = NUMBER.search(THOUSANDS.sub("", value))
+        if not match:
+            return None
+        number = float(match.group(2).replace(",", ""))
+        return -abs(number) if match.group(1) and match.group(3) else number
+    return None
+
+
+def parse_period(period):
+    """"FYE 2023" -> ("FYE", 2023), "FPE 9M 2024" -> ("FPE", 2024)."""
+    match = PERIOD_PATTERN.search(period)
+    if not match:
+        return None, None
+    return match.group(1).upper(), int(match.group(2))
+
+
+def as_list(value):
+    # The prompts ask for '{}' when a list is empty, so accept dicts too
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, dict) or isinstance(item, str)]
+    return []
+
+
+def as_dict(value):
+    return value if isinstance(value, dict) else {}
+
+
+def get_any(data, *keys):
+    """Value of the first key present in data, the prompts are not consistent about key names."""
+    for key in keys:
+        if key in data:
+            return data[key]
+    return None
+
+
+def normalise(doc_id, ticker=None, financials=None, business=None):
+    """
+    Turn the extracted JSON into rows for each table.
+
+    Args:
+        doc_id (str): The announcement ID, e.g. "3542085".
+        ticker (str): The stock ticker if known.
+        financials (dict): Output of the ipo_financials prompt.
+        business (dict): Output of the ipo_proceeds / ipo_x_pdf prompt.
+
+    Returns:
+        dict: {table name: list of row dicts}
+    """
+    financials = as_dict(financials)
+    business = as_dict(business)
+    rows = {table: [] for table in TABLES}
+
+    # Financial years, merged over the per-period lists
+    periods = {}
+    period_lists = (
+        ("revenue", "REVENUE (FYE) List ['000, comma-separated]"),
+        ("revenue", "REVENUE (FPE) List ['000, comma-separated]"),
+        ("pat", "PAT (FYE) List ['000, comma-separated]"),
+        ("pat", "PAT (FPE) List ['000, comma-separated]"),
+        ("pat_margin", "PAT Margin (FYE) [%]"),
+        ("pat_margin", "PAT Margin (FPE) [%]"),
+        ("cash_equivalent", "Total Cash and Cash Equivalent at the end of financial year/period ['000]"),
+    )
+    for column, key in period_lists:
+        for period, value in as_dict(financials.get(key)).items():
+            period_type, year = parse_period(period)
+            if period_type is None:
+                continue
+            row = periods.setdefault(period.strip(), {
+                "doc_id": doc_id, "ticker": ticker, "period": period.strip(),
+                "period_type": period_type, "year": year,
+                "revenue": None, "pat": None, "pat_margin": None, "cash_equivalent": None,
+            })
+            row[column] = to_number(value)
+    rows["financial_years"] = list(periods.values())
+
+    fye_years = [row["year"] for row in rows["financial_years"] if row["period_type"] == "FYE"]
+    sector = as_dict(business.get("sector"))
+    rows["documents"].append({
+        "doc_id": doc_id,
+        "ticker": ticker,
+        "name": financials.get("Name"),
+        "market_type": financials.get("Market Type"),
+        "listing_date": financials.get("Listing Date"),
+        "listing_price": to_number(financials.get("Listing Price")),
+        "latest_fye": max(fye_years) if fye_years else None,
+        "pat_latest": to_number(financials.get("Profit After Tax (PAT) ['000]")),
+        "pe_reported": to_number(financials.get("PE (reported)")),
+        "enlarged_shares_m": to_number(financials.get("Num of Shares (Enlarged) [M]")),
+        "sector": sector.get("sector"),
+        "sub_sector": sector.get("sub_sector"),
+        "unbilled_order_book": to_number(business.get("unbilled_order_book")),
+        "stored_at": datetime.now().isoformat(timespec="seconds"),
+    })
+
+    for kind, key in (("geographical", "geo_segments"), ("business", "business_segments"),
+                      ("customer", "major_customers")):
+        for item in as_list(business.get(key)):
+            if not isinstance(item, dict):
+                continue
+            rows["segments"].append({
+                "doc_id": doc_id, "ticker": ticker, "kind": kind,
+                "name": get_any(item, "name", "Name", "segment"),
+                "revenue": to_number(get_any(item, "revenue", "Total Revenue (RM'000)")),
+                "percentage": to_number(get_any(item, "percentage", "Percentage (%)")),
+            })
+
+    for item in as_list(financials.get("use_of_proceeds")):
+        if not isinstance(item, dict):
+            continue
+        time_frame = to_number(get_any(item, "Time Frame in numbers", "time_frame"))
+        rows["proceeds_allocations"].append({
+            "doc_id": doc_id, "ticker": ticker,
+            "category": get_any(item, "Category", "category"),
+            "purpose": get_any(item, "Purpose", "purpose"),
+            "amount": to_number(get_any(item, "Amount (RM'000)", "amount")),
+            "percentage": to_number(get_any(item, "Percentage (%)", "percentage")),
+            "time_frame_months": int(time_frame) if time_frame is not None else None,
+        })
+
+    for name in as_list(business.get("bursa_peers")):
+        if isinstance(name, str) and name.strip():
+            rows["competitors"].append({"doc_id": doc_id, "ticker": ticker, "name": name.strip()})
+
+    return rows
+
+
+def store_results(doc_id, ticker=None, financials=None, business=None, conn=None):
+    """
+    Normalise and append a document's extraction results to the store.
+
+    Re-storing a document replaces its earlier rows. Only the results given
+    are replaced, so financials and business data can be stored separately.
+    An empty result ({} from a failed extraction) leaves the stored rows as
+    they are, and a ticker stored earlier is kept when none is given.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = open_store()
+
+    rows = normalise(doc_id, ticker, financials, business)
+    try:
+        with conn:
+            existing = conn.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if existing:
+                # Keep the columns the other prompt filled in earlier
+                columns = [d[0] for d in conn.execute("SELECT * FROM documents LIMIT 0").description]
+                previous = dict(zip(columns, existing))
+                for column, value in rows["documents"][0].items():
+                    if value is None:
+                        rows["documents"][0][column] = previous[column]
+            for table in TABLES:
+                for row in rows[table]:
+                    row["ticker"] = rows["documents"][0]["ticker"]
+
+            replaced = ["documents"]
+            if as_dict(financials):
+                replaced += ["financial_years", "proceeds_allocations"]
+            if as_dict(business):
+                replaced += ["segments", "competitors"]
+
+            for table in replaced:
+                conn.execute(f"DELETE FROM {table} WHERE doc_id = ?", (doc_id,))
+                if rows[table]:
+                    columns = list(rows[table][0].keys())
+                    conn.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                        [tuple(row[column] for column in columns) for row in rows[table]],
+                    )
+        print(f"✅ Stored {doc_id} in the IPO store")
+    except Exception as e:
+        print(f"ERROR: Failed to store results for {doc_id}: {e}")
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def export_parquet(output_dir="parquet", conn=None):
+    """Write every table to <output_dir>/<table>.parquet. Needs pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("ERROR: Parquet export needs pyarrow (pip install pyarrow)")
+        return
+
+    own_conn = conn is None
+    if own_conn:
+        conn = open_store()
+    os.makedirs(output_dir, exist_ok=True)
+    for table in TABLES:
+        cursor = conn.execute(f"SELECT * FROM {table}")
+        columns = [d[0] for d in cursor.description]
+        data = list(zip(*cursor.fetchall())) or [[] for _ in columns]
+        pq.write_table(pa.table({column: list(values) for column, values in zip(columns, data)}),
+                       os.path.join(output_dir, f"{table}.parquet"))
+    if own_conn:
+        conn.close()
+    print(f"✅ Exported {len(TABLES)} tables to {output_dir}")
+
+
+def import_json_dir(json_dir="json", conn=None):
+    """Load existing json/<id>_financial.json, <id>_ipo.json and <id>_extracted.json files."""
+    own_conn = conn is None
+    if own_conn:
+        conn = open_store()
+
+    for file_name in sorted(os.listdir(json_dir)):
+        match = re.match(r"(.+)_(financial|ipo|extracted)\.json$", file_name)
+        if not match:
+            continue
+        doc_id, kind = match.groups()
+        with open(os.path.join(json_dir, file_name), "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if kind == "financial":
+            store_results(doc_id, financials=data, conn=conn)
+        elif kind == "extracted":
+            store_results(doc_id, business=data, conn=conn)
+        else:
+            store_results(doc_id, financials=data.get("financials"), business=data.get("proceeds"), conn=conn)
+
+    if own_conn:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Usage: python output_store.py import [json dir]   - load existing per-document JSON
+    #        python output_store.py parquet [out dir]   - export the tables to Parquet
+    command = sys.argv[1] if len(sys.argv) > 1 else "import"
+    if command == "import":
+        import_json_dir(sys.argv[2] if len(sys.argv) > 2 else "json")
+    elif command == "parquet":
+        export_parquet(sys.argv[2] if len(sys.argv) > 2 else "parquet")
+    else:
+        print(f"Error: Unknown command '{command}'")
+        sys.exit(1)
@@ -0,0 +1,387 @@
+import fitz  # pymupdf is imported as fitz
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+from datetime import datetime
+
+from validation import is_missing, item_key
+
+INDEX_PATH = os.path.join("json", "page_index.sqlite")
+
+# Perceptual hash: difference hash over a 9x8 grayscale thumbnail (64 bits)
+PHASH_WIDTH = 9
+PHASH_HEIGHT = 8
+PHASH_OVERSAMPLE = 4  # render 4x larger and average, so thin text strokes are not lost
+PHASH_MAX_DISTANCE = 6  # bits that may differ for two pages to look the same
+# Two hashes within PHASH_MAX_DISTANCE bits agree exactly on at least one of this many bands,
+# so image-only pages are looked up by band in SQL instead of comparing against every page
+PHASH_BANDS = PHASH_MAX_DISTANCE + 1
+
+# A re-filing shares at least this fraction of its pages with the earlier version
+MIN_REFILING_OVERLAP = 0.6
+# A page seen in this many other documents is boilerplate (definitions, glossary, ...)
+MIN_BOILERPLATE_DOCUMENTS = 2
+
+# What each abridger's PDF is extracted for
+MODE_TARGETS = {"ipo": ("financials", "proceeds"), "financial": ("financials",)}
+
+# Pages without a text layer all share this text hash and are compared by image instead
+EMPTY_TEXT_HASH = hashlib.sha1(b"").hexdigest()
+
+PAGE_NUMBER_LINE = re.compile(r"^\s*(page\s*)?([0-9]+|[ivxlc]+)\s*$", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    document_hash TEXT NOT NULL,
+    num_pages INTEGER NOT NULL,
+    indexed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    doc_id TEXT NOT NULL,
+    page_num INTEGER NOT NULL,
+    text_hash TEXT NOT NULL,
+    phash TEXT NOT NULL,
+    PRIMARY KEY (doc_id, page_num)
+);
+CREATE INDEX IF NOT EXISTS pages_text_hash ON pages (text_hash);
+CREATE TABLE IF NOT EXISTS image_bands (
+    doc_id TEXT NOT NULL,
+    page_num INTEGER NOT NULL,
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS image_bands_value ON image_bands (band, value);
+CREATE INDEX IF NOT EXISTS image_bands_doc ON image_bands (doc_id);
+CREATE INDEX IF NOT EXISTS documents_hash ON documents (document_hash);
+CREATE TABLE IF NOT EXISTS results (
+    result_key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    stored_at TEXT NOT NULL
+);
+"""
+
+
+def normalise_text(text):
+    """Lowercase, drop page-number lines and punctuation, collapse whitespace."""
+    lines = [line for line in text.splitlines() if not PAGE_NUMBER_LINE.match(line)]
+    text = " ".join(lines).lower()
+    text = re.sub(r"[^a-z0-9%.]+", " ", text)
+    return text.strip()
+
+
+def text_hash(page):
+    return hashlib.sha1(normalise_text(page.get_text("text")).encode()).hexdigest()
+
+
+def perceptual_hash(page):
+    """64-bit difference hash of the rendered page, stable across re-saves and small shifts."""
+    width = PHASH_WIDTH * PHASH_OVERSAMPLE
+    height = PHASH_HEIGHT * PHASH_OVERSAMPLE
+    matrix = fitz.Matrix(width / page.rect.width, height / page.rect.height)
+    pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+    samples = pix.samples
+
+    # Average PHASH_OVERSAMPLE x PHASH_OVERSAMPLE blocks down to the 9x8 thumbnail
+    cells = [[0] * PHASH_WIDTH for _ in range(PHASH_HEIGHT)]
+    counts = [[0] * PHASH_WIDTH for _ in range(PHASH_HEIGHT)]
+    for y in range(pix.height):
+        row = min(y * PHASH_HEIGHT // pix.height, PHASH_HEIGHT - 1)
+        offset = y * pix.stride
+        for x in range(pix.width):
+            col = min(x * PHASH_WIDTH // pix.width, PHASH_WIDTH - 1)
+            cells[row][col] += samples[offset + x]
+            counts[row][col] += 1
+
+    bits = 0
+    for row in range(PHASH_HEIGHT):
+        for col in range(PHASH_WIDTH - 1):
+            left = cells[row][col] / max(counts[row][col], 1)
+            right = cells[row][col + 1] / max(counts[row][col + 1], 1)
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def phash_bands(phash):
+    """(band, value) of each of the PHASH_BANDS slices of a perceptual hash."""
+    num_bits = (PHASH_WIDTH - 1) * PHASH_HEIGHT
+    bounds = [num_bits * band // PHASH_BANDS for band in range(PHASH_BANDS + 1)]
+    return [(band, (phash >> bounds[band]) & ((1 << (bounds[band + 1] - bounds[band])) - 1))
+            for band in range(PHASH_BANDS)]
+
+
+def fingerprint_document(pdf_path):
+    """
+    Fingerprint every page of a PDF.
+
+    Returns:
+        list: One (text_hash, phash) tuple per page.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        return [(text_hash(page), perceptual_hash(page)) for page in doc]
+    finally:
+        doc.close()
+
+
+def document_hash(fingerprints):
+    """Hash of the page texts in order, equal for byte-different copies of the same document."""
+    digest = hashlib.sha1()
+    for page_text_hash, _ in fingerprints:
+        digest.update(page_text_hash.encode())
+    return digest.hexdigest()
+
+
+def open_index(index_path=INDEX_PATH):
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    if not conn.execute("SELECT 1 FROM image_bands LIMIT 1").fetchone():
+        # Index written before image_bands existed
+        rows = conn.execute("SELECT doc_id, page_num, phash FROM pages WHERE text_hash = ?", (EMPTY_TEXT_HASH,))
+        with conn:
+            conn.executemany("INSERT INTO image_bands VALUES (?, ?, ?, ?)",
+                             [(doc_id, page_num, band, value) for doc_id, page_num, phash in rows.fetchall()
+                              for band, value in phash_bands(int(phash, 16))])
+    return conn
+
+
+def index_document(conn, doc_id, fingerprints):
+    """Store (or replace) a document's page fingerprints."""
+    with conn:
+        conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM image_bands WHERE doc_id = ?", (doc_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+            (doc_id, document_hash(fingerprints), len(fingerprints), datetime.now().isoformat(timespec="seconds")),
+        )
+        conn.executemany(
+            "INSERT INTO pages VALUES (?, ?, ?, ?)",
+            [(doc_id, page_num, th, f"{ph:016x}") for page_num, (th, ph) in enumerate(fingerprints)],
+        )
+        conn.executemany(
+            "INSERT INTO image_bands VALUES (?, ?, ?, ?)",
+            [(doc_id, page_num, band, value) for page_num, (th, ph) in enumerate(fingerprints)
+             if th == EMPTY_TEXT_HASH for band, value in phash_bands(ph)],
+        )
+
+
+def is_unchanged(conn, doc_id, fingerprints):
+    """True if doc_id is already indexed with these same pages, i.e. this is a re-run."""
+    row = conn.execute("SELECT document_hash FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+    return row is not None and row[0] == document_hash(fingerprints)
+
+
+def find_identical_document(conn, fingerprints, exclude_doc_id=None):
+    """Return the doc_id of an already indexed copy of this document, or None."""
+    row = conn.execute(
+        "SELECT doc_id FROM documents WHERE document_hash = ? AND doc_id != ? LIMIT 1",
+        (document_hash(fingerprints), exclude_doc_id or ""),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _page_seen_in(conn, fingerprint, exclude_doc_id):
+    """doc_ids of other documents containing this page, matched by text hash or perceptual hash."""
+    page_text_hash, phash = fingerprint
+    if page_text_hash == EMPTY_TEXT_HASH:
+        # Only pages sharing a band can be within PHASH_MAX_DISTANCE, the index finds them
+        bands = phash_bands(phash)
+        rows = conn.execute(
+            "SELECT DISTINCT pages.doc_id, pages.phash FROM image_bands JOIN pages"
+            " ON pages.doc_id = image_bands.doc_id AND pages.page_num = image_bands.page_num"
+            " WHERE image_bands.doc_id != ? AND (" + " OR ".join(["(band = ? AND value = ?)"] * len(bands)) + ")",
+            [exclude_doc_id or ""] + [number for band in bands for number in band],
+        )
+        return {row[0] for row in rows if hamming(int(row[1], 16), phash) <= PHASH_MAX_DISTANCE}
+
+    rows = conn.execute("SELECT doc_id FROM pages WHERE text_hash = ? AND doc_id != ?",
+                        (page_text_hash, exclude_doc_id or ""))
+    return {row[0] for row in rows}
+
+
+def find_previous_version(conn, fingerprints, exclude_doc_id=None):
+    """
+    Find the indexed document this one is most likely an amended re-filing of.
+
+    Returns:
+        str or None: The doc_id sharing the most pages, if it shares at least
+                     MIN_REFILING_OVERLAP of them.
+    """
+    shared = {}
+    for fingerprint in fingerprints:
+        for doc_id in _page_seen_in(conn, fingerprint, exclude_doc_id):
+            shared[doc_id] = shared.get(doc_id, 0) + 1
+
+    if not shared:
+        return None
+    doc_id, count = max(shared.items(), key=lambda item: (item[1], item[0]))
+    if count < MIN_REFILING_OVERLAP * len(fingerprints):
+        return None
+    return doc_id
+
+
+def changed_pages(conn, previous_doc_id, fingerprints):
+    """Page numbers whose content does not appear anywhere in the previous version."""
+    previous = conn.execute("SELECT text_hash, phash FROM pages WHERE doc_id = ?", (previous_doc_id,)).fetchall()
+    previous_text = {row[0] for row in previous if row[0] != EMPTY_TEXT_HASH}
+    previous_images = [int(row[1], 16) for row in previous if row[0] == EMPTY_TEXT_HASH]
+
+    changed = []
+    for page_num, (page_text_hash, phash) in enumerate(fingerprints):
+        if page_text_hash != EMPTY_TEXT_HASH:
+            if page_text_hash not in previous_text:
+                changed.append(page_num)
+        elif not any(hamming(phash, other) <= PHASH_MAX_DISTANCE for other in previous_images):
+            changed.append(page_num)
+    return changed
+
+
+def boilerplate_pages(conn, fingerprints, exclude_doc_id=None):
+    """Page numbers seen in at least MIN_BOILERPLATE_DOCUMENTS other documents."""
+    return [page_num for page_num, fingerprint in enumerate(fingerprints)
+            if len(_page_seen_in(conn, fingerprint, exclude_doc_id)) >= MIN_BOILERPLATE_DOCUMENTS]
+
+
+def store_result(conn, result_key, data):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+            (result_key, json.dumps(data, ensure_ascii=False), datetime.now().isoformat(timespec="seconds")),
+        )
+
+
+def get_result(conn, result_key):
+    row = conn.execute("SELECT data FROM results WHERE result_key = ?", (result_key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def result_key(doc_id, mode):
+    return f"{doc_id}:{mode}"
+
+
+def merge_results(previous, results):
+    """
+    The earlier version's results updated with those from the changed pages.
+    Anything the changed pages did not give is kept from the earlier version,
+    list items are matched by name so the items of unchanged pages stay.
+    """
+    if isinstance(previous, dict) and isinstance(results, dict):
+        merged = dict(previous)
+        for key, value in results.items():
+            merged[key] = merge_results(previous.get(key), value)
+        return merged
+    if isinstance(previous, list) and isinstance(results, list):
+        merged = {item_key(item): item for item in previous}
+        for item in results:
+            merged[item_key(item)] = merge_results(merged.get(item_key(item)), item)
+        return list(merged.values())
+    return previous if is_missing(results) else results
+
+
+def expand_pages(page_numbers, num_pages, neighbours=1):
+    """Add the neighbours of each page, tables often run over two pages."""
+    expanded = set()
+    for page_num in page_numbers:
+        for other in range(page_num - neighbours, page_num + neighbours + 1):
+            if 0 <= other < num_pages:
+                expanded.add(other)
+    return sorted(expanded)
+
+
+def plan_pages(conn, doc_id, pdf_path, page_numbers, mode="ipo"):
+    """
+    Work out which of the selected pages still need extracting, and index the document.
+
+    Pages are only skipped when the results they gave are stored (see
+    extract_document): all of them for an identical copy, the unchanged
+    ones for a re-filing. Boilerplate pages are reported but always kept,
+    what they hold belongs to this document.
+
+    Returns:
+        dict: {"reuse": doc_id of an identical copy (or of this document, re-run unchanged)
+                        whose results stand in (nothing to extract) or None,
+               "previous_version": doc_id this re-files or None,
+               "results": the stored results to merge the new ones into, or None,
+               "pages": the selected pages to extract,
+               "skipped": selected pages whose results are taken from "results",
+               "boilerplate": selected pages seen in several other documents}
+    """
+    fingerprints = fingerprint_document(pdf_path)
+    selected = set(page_numbers)
+    plan = {"reuse": None, "previous_version": None, "results": None, "pages": list(page_numbers), "skipped": [],
+            "boilerplate": [page_num for page_num in boilerplate_pages(conn, fingerprints, doc_id)
+                            if page_num in selected]}
+
+    if is_unchanged(conn, doc_id, fingerprints) and get_result(conn, result_key(doc_id, mode)) is not None:
+        identical = doc_id
+    else:
+        identical = find_identical_document(conn, fingerprints, doc_id)
+    previous = None if identical else find_previous_version(conn, fingerprints, doc_id)
+    if identical and get_result(conn, result_key(identical, mode)) is not None:
+        plan["reuse"] = identical
+        plan["results"] = get_result(conn, result_key(identical, mode))
+        plan["pages"] = []
+        plan["skipped"] = list(page_numbers)
+    elif previous and get_result(conn, result_key(previous, mode)) is not None:
+        plan["previous_version"] = previous
+        plan["results"] = get_result(conn, result_key(previous, mode))
+        wanted = set(expand_pages(changed_pages(conn, previous, fingerprints), len(fingerprints)))
+        plan["pages"] = [page_num for page_num in page_numbers if page_num in wanted]
+        plan["skipped"] = [page_num for page_num in page_numbers if page_num not in wanted]
+
+    index_document(conn, doc_id, fingerprints)
+    return plan
+
+
+def extract_document(pdf_name, mode="ipo"):
+    """
+    Abridge pdf/<pdf_name> with dedupe, extract only the pages the plan kept
+    and merge the results into the stored ones, then store them for the next
+    copy or re-filing.
+    """
+    import extraction_planner  # builds the model client, only needed here
+    from low_memory_abridge import ABRIDGERS
+
+    abridger = ABRIDGERS[mode]
+    if mode == "ipo":
+        plan = abridger.make_abridged_ipo(pdf_name, dedupe=True)
+        abridged_path = os.path.join("pdf", pdf_name).replace(".pdf", "_abridged.pdf")
+    else:
+        plan = abridger.make_abridged_financial(pdf_name, dedupe=True)
+        abridged_path = os.path.join("pdf", pdf_name).replace(".pdf", "_financial.pdf")
+
+    if plan["pages"]:
+        results = extraction_planner.extract_targets(abridged_path, targets=MODE_TARGETS[mode])
+        if plan["results"] is not None:
+            results = merge_results(plan["results"], results)
+    else:
+        results = plan["results"]
+
+    conn = open_index()
+    store_result(conn, result_key(os.path.splitext(pdf_name)[0], mode), results)
+    conn.close()
+    return results
+
+
+if __name__ == '__main__':
+    # Usage: python page_index.py <pdf path> [<pdf path> ...]
+    conn = open_index()
+    for pdf_file_path in sys.argv[1:]:
+        doc_id = os.path.splitext(os.path.basename(pdf_file_path))[0]
+        doc = fitz.open(pdf_file_path)
+        all_pages = list(range(len(doc)))
+        doc.close()
+
+        plan = plan_pages(conn, doc_id, pdf_file_path, all_pages)
+        print(doc_id, "- reuse:", plan["reuse"], " previous version:", plan["previous_version"],
+              " pages to extract:", len(plan["pages"]), " skipped:", len(plan["skipped"]),
+              " boilerplate:", len(plan["boilerplate"]))
+    conn.close()
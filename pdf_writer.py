@@ -0,0 +1,174 @@
+import fitz  # pymupdf is imported as fitz
+import os
+import sys
+import time
+import tempfile
+
+# How the abridged PDF gets written:
+#   "select" - doc.select() on the full document, then garbage=4 (dedupe and rebuild
+#              the whole object graph). Smallest output, slowest.
+#   "insert" - copy contiguous page ranges into a fresh document with insert_pdf and
+#              save with garbage=1. Streams that are already compressed are copied
+#              as they are, only uncompressed ones get deflated.
+WRITERS = ["select", "insert"]
+
+# Optional image downsampling of the written pages (image_dpi). The model reads scanned pages
+# fine at 150 DPI, prospectus scans are often 300+ DPI.
+IMAGE_DPI = 150
+JPEG_QUALITY = 75
+DPI_MARGIN = 1.25  # images only a little above the target are left alone
+
+
+def page_ranges(page_numbers):
+    """Group sorted page numbers into contiguous (from_page, to_page) ranges."""
+    ranges = []
+    for page_num in sorted(set(page_numbers)):
+        if ranges and page_num == ranges[-1][1] + 1:
+            ranges[-1][1] = page_num
+        else:
+            ranges.append([page_num, page_num])
+    return [tuple(r) for r in ranges]
+
+
+def optimize_images(doc, page_numbers=None, dpi=IMAGE_DPI, quality=JPEG_QUALITY):
+    """
+    Downsample the images of the given pages (all by default) to dpi at the
+    size they are shown, and recompress them as JPEG. Text and vector
+    drawings are not touched. An image is only replaced when the JPEG is
+    smaller; masked, 1-bit and already small images are left as they are.
+
+    Returns:
+        dict: images seen, images rewritten, and their bytes before and after.
+    """
+    stats = {"images": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+    seen = set()
+    for page_num in range(len(doc)) if page_numbers is None else page_numbers:
+        page = doc[page_num]
+        for info in page.get_image_info(xrefs=True):
+            xref = info["xref"]
+            if not xref or xref in seen:
+                continue  # inline image, or shared and already handled
+            seen.add(xref)
+            size = len(doc.xref_stream_raw(xref))
+            stats["images"] += 1
+            stats["bytes_before"] += size
+            stats["bytes_after"] += size
+
+            bbox = fitz.Rect(info["bbox"])
+            if bbox.is_empty or info["bpc"] == 1 or doc.xref_get_key(xref, "SMask")[0] != "null":
+                continue
+            # The lower of the two, so rotated or stretched images keep enough pixels
+            shown_dpi = min(info["width"] / (bbox.width / 72), info["height"] / (bbox.height / 72))
+            if shown_dpi <= dpi * DPI_MARGIN:
+                continue
+
+            pix = fitz.Pixmap(doc, xref)
+            if pix.alpha or pix.colorspace is None:
+                continue
+            if pix.colorspace.n not in (1, 3):
+                pix = fitz.Pixmap(fitz.csRGB, pix)  # JPEG here is gray or RGB only
+            factor = dpi / shown_dpi
+            pix = fitz.Pixmap(pix, max(1, round(pix.width * factor)), max(1, round(pix.height * factor)), None)
+            jpeg = pix.tobytes("jpeg", jpg_quality=quality)
+            if len(jpeg) >= size:
+                continue
+            page.replace_image(xref, stream=jpeg)
+            stats["rewritten"] += 1
+            stats["bytes_after"] += len(jpeg) - size
+    return stats
+
+
+def write_pages(doc, page_numbers, output_path=None, writer="select", image_dpi=None):
+    """
+    Write the selected pages of an open document.
+
+    Args:
+        doc (fitz.Document): The source document. The "select" writer modifies it.
+        page_numbers (list): 0-based page numbers to keep.
+        output_path (str): Where to save. If None the PDF is returned as bytes,
+                           for when it goes straight to the model.
+        writer (str): One of WRITERS.
+        image_dpi (int): If given, images on the written pages are downsampled
+                         to this DPI with optimize_images.
+
+    Returns:
+        bytes or None: The PDF bytes if output_path is None.
+    """
+    if writer == "select":
+        doc.select(page_numbers)  # Keep only selected pages
+        doc.set_metadata({})  # Clear metadata
+        if image_dpi:
+            report_images(optimize_images(doc, dpi=image_dpi))
+        return save(doc, output_path, garbage=4)
+
+    if writer == "insert":
+        new_doc = fitz.open()
+        for from_page, to_page in page_ranges(page_numbers):
+            new_doc.insert_pdf(doc, from_page=from_page, to_page=to_page)
+        new_doc.set_metadata({})  # Clear metadata
+        try:
+            if image_dpi:
+                report_images(optimize_images(new_doc, dpi=image_dpi))
+                # replace_image leaves every page pointing at the new JPEG through two xrefs with the
+                # same stream, garbage=4 drops the old images and merges the duplicates
+                return save(new_doc, output_path, garbage=4)
+            return save(new_doc, output_path, garbage=1)
+        finally:
+            new_doc.close()
+
+    raise ValueError(f"Unknown writer '{writer}', expected one of {WRITERS}")
+
+
+def report_images(stats):
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    print(f"Images: rewrote {stats['rewritten']} of {stats['images']}, "
+          f"{stats['bytes_before'] / 1024:.0f} KB -> {stats['bytes_after'] / 1024:.0f} KB "
+          f"({saved / max(stats['bytes_before'], 1):.0%} smaller)")
+
+
+def save(doc, output_path, garbage):
+    # deflate only compresses streams that are not compressed yet
+    if output_path is None:
+        return doc.tobytes(garbage=garbage, deflate=True)
+    doc.save(output_path, garbage=garbage, deflate=True)
+    return None
+
+
+def benchmark_writers(pdf_path, page_numbers, runs=3):
+    """Time every writer on the same page selection and compare the output sizes."""
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for writer in WRITERS:
+            output_path = os.path.join(work_dir, f"{writer}.pdf")
+            times = []
+            for _ in range(runs):
+                doc = fitz.open(pdf_path)
+                start = time.perf_counter()
+                write_pages(doc, page_numbers, output_path, writer)
+                times.append(time.perf_counter() - start)
+                doc.close()
+
+            results[writer] = {
+                "seconds": round(min(times), 3),
+                "size_kb": round(os.path.getsize(output_path) / 1024, 1),
+            }
+            print(f"{writer}: {results[writer]}")
+
+    return results
+
+
+if __name__ == '__main__':
+    # Usage: python pdf_writer.py [pdf path] [financial|ipo]
+    import low_memory_abridge
+
+    if len(sys.argv) > 1:
+        pdf_file_path = sys.argv[1]
+    else:
+        pdf_file_path = os.path.join(tempfile.mkdtemp(), "synthetic.pdf")
+        low_memory_abridge.make_synthetic_pdf(pdf_file_path, num_pages=300, image_kb=50)
+
+    mode = sys.argv[2] if len(sys.argv) > 2 else "financial"
+    abridger = low_memory_abridge.ABRIDGERS[mode]
+    page_numbers = abridger.split_into_sections(abridger.extract_titles_from_pdf(pdf_file_path))
+    print(f"Writing {len(page_numbers)} pages of {pdf_file_path}")
+    benchmark_writers(pdf_file_path, page_numbers)
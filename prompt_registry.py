@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Prompts sit next to the scripts, or in a prompts/ folder beside or above them (the extractor/ layout)
+SEARCH_DIRS = [BASE_DIR, os.path.join(BASE_DIR, "prompts"), os.path.join(BASE_DIR, "..", "prompts")]
+
+PROMPT_FILES = {
+    "financials": "ipo_financials.txt",
+    "proceeds": "ipo_proceeds.txt",
+    "business": "ipo_x_pdf.txt",
+}
+
+# Fragments the composed prompts are built from
+MERGED_HEADER = (
+    "Please extract the following information from the IPO document. "
+    "Respond with a single JSON object containing these main keys: {keys}.\n\n"
+    "---\n\n"
+)
+MERGED_SECTION = "[{label} PROMPT]\n{text}\n\n"
+
+_prompts = {}
+_composed = {}
+_lock = threading.Lock()
+
+
+def content_hash(text):
+    """Stable short hash of a prompt's text, for response and cache keys."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def find_prompt_file(file_name):
+    for directory in SEARCH_DIRS:
+        path = os.path.normpath(os.path.join(directory, file_name))
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def validate_prompt(name, text):
+    """A prompt must have text and ask for JSON, everything downstream parses the answer as JSON."""
+    if not text.strip():
+        return f"prompt '{name}' is empty"
+    if "json" not in text.lower():
+        return f"prompt '{name}' does not ask for JSON output"
+    return None
+
+
+def load(name):
+    """
+    The registry entry of a prompt, read and validated on first use and kept
+    for the rest of the process.
+
+    Returns:
+        dict: name, path, text, hash and loaded_at.
+    """
+    with _lock:
+        if name in _prompts:
+            return _prompts[name]
+
+        if name not in PROMPT_FILES:
+            print(f"ERROR: Unknown prompt '{name}', expected one of {sorted(PROMPT_FILES)}")
+            sys.exit(1)
+        path = find_prompt_file(PROMPT_FILES[name])
+        if path is None:
+            print(f"ERROR: Prompt file '{PROMPT_FILES[name]}' not found in {SEARCH_DIRS}")
+            sys.exit(1)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except Exception as e:
+            print(f"ERROR: Failed to read prompt file '{path}': {e}")
+            sys.exit(1)
+
+        error = validate_prompt(name, text)
+        if error:
+            print(f"ERROR: Invalid prompt file '{path}': {error}")
+            sys.exit(1)
+
+        _prompts[name] = {
+            "name": name,
+            "path": path,
+            "text": text,
+            "hash": content_hash(text),
+            "loaded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        return _prompts[name]
+
+
+def get_prompt(name):
+    return load(name)["text"]
+
+
+def prompt_hash(name):
+    return load(name)["hash"]
+
+
+def compose(names, prompts=None):
+    """
+    One prompt asking for one JSON key per name, built from the named prompts.
+
+    prompts overrides the registry text of some names, e.g. with sections
+    already answered locally removed. Compositions of unchanged registry
+    prompts are built once.
+    """
+    names = tuple(names)
+    overridden = prompts is not None and any(prompts.get(name) != get_prompt(name) for name in names)
+    if not overridden and names in _composed:
+        return _composed[names]
+
+    texts = {name: (prompts or {}).get(name) or get_prompt(name) for name in names}
+    composed = MERGED_HEADER.format(keys=", ".join(f"`{name}`" for name in names))
+    for name in names:
+        composed += MERGED_SECTION.format(label=name.upper(), text=texts[name])
+
+    if not overridden:
+        _composed[names] = composed
+    return composed
+
+
+def versions():
+    """{prompt name: content hash} of every registered prompt."""
+    return {name: prompt_hash(name) for name in PROMPT_FILES}
+
+
+def reload():
+    """Forget the loaded prompts, the next use reads them from disk again."""
+    with _lock:
+        _prompts.clear()
+        _composed.clear()
+
+
+if __name__ == "__main__":
+    manifest = {name: {key: value for key, value in load(name).items() if key != "text"} for name in PROMPT_FILES}
+    manifest["financials+proceeds"] = {"hash": content_hash(compose(["financials", "proceeds"]))}
+    print(json.dumps(manifest, indent=4))
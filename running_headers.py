@@ -0,0 +1,142 @@
+import re
+import sys
+import json
+from collections import Counter
+import fitz  # pymupdf is imported as fitz
+
+# Running headers and footers sit in these bands of the page
+HEADER_BAND = 0.15
+FOOTER_BAND = 0.15
+# A block is boilerplate when the same text at the same height is on this share of the pages
+MIN_SHARE = 0.3
+# Section headings repeat too ("7. BUSINESS OVERVIEW (Cont'd)" runs over most of an abridged
+# document) but they are what the page titles are matched on, so they are never boilerplate
+SECTION_HEADING = re.compile(r"^\s*(?:\d+(?:\.\d+)*\.?\s+[A-Z]|[A-Z][A-Z ,&'’\-]+\(cont(?:'|’)?d|continued)", re.IGNORECASE)
+MIN_PAGES = 3
+POSITION_BUCKET = 4  # points, blocks drift a little from page to page
+# Too few pages to tell what repeats, crop the top as before
+DEFAULT_HEADER_HEIGHT = 40
+# Lines kept per page by title_blocks, enough for either abridger's title
+TITLE_LINES = 8
+
+
+def block_key(y0, text):
+    """Height and text of a block, with numbers masked so "Page 12" and "Page 13" match."""
+    return round(y0 / POSITION_BUCKET), re.sub(r"\d+", "#", " ".join(text.split()).lower())
+
+
+def page_blocks(page):
+    """(y0, y1, text) of the text blocks of a page, in reading order."""
+    return [(block[1], block[3], block[4]) for block in page.get_text("blocks") if block[6] == 0 and block[4].strip()]
+
+
+def in_bands(y0, y1, height):
+    return y1 <= height * HEADER_BAND or y0 >= height * (1 - FOOTER_BAND)
+
+
+def title_blocks(blocks, height, max_lines=TITLE_LINES):
+    """
+    The blocks of a page that detect_furniture and the page title need: every
+    block in the header and footer bands, and the others up to max_lines lines.
+    Keeps the title scan of a long document from holding all of its text.
+    """
+    kept = []
+    lines = 0
+    for y0, y1, text in blocks:
+        if in_bands(y0, y1, height):
+            kept.append((y0, y1, text))
+        elif lines < max_lines:
+            kept.append((y0, y1, text))
+            lines += len(text.splitlines())
+    return kept
+
+
+def detect_furniture(pages_blocks, page_heights):
+    """
+    Find the header and footer blocks repeated across the document.
+
+    Args:
+        pages_blocks (list): page_blocks() (or title_blocks()) of every page.
+        page_heights (list): Height of every page.
+
+    Returns:
+        dict: keys (the repeated blocks), top and bottom (crops from the top and
+              bottom of every page, only used when the document is too short
+              to tell what repeats).
+    """
+    num_pages = len(pages_blocks)
+    if num_pages < MIN_PAGES:
+        return {"keys": set(), "top": DEFAULT_HEADER_HEIGHT, "bottom": 0}
+
+    counts = Counter()
+    for blocks, height in zip(pages_blocks, page_heights):
+        seen = set()
+        for y0, y1, text in blocks:
+            if in_bands(y0, y1, height) and not SECTION_HEADING.match(text):
+                seen.add(block_key(y0, text))
+        counts.update(seen)  # once per page
+
+    threshold = max(MIN_PAGES, num_pages * MIN_SHARE)
+    keys = {key for key, count in counts.items() if count >= threshold}
+    return {"keys": keys, "top": 0, "bottom": 0}
+
+
+def edge_blocks(blocks, keys):
+    """
+    Indexes of the repeated blocks that hug the top or bottom of the page:
+    only other repeated blocks sit between them and the edge. A repeated
+    table header under the page's own title is body text, not a header.
+    """
+    repeated = [block_key(y0, text) in keys for y0, _, text in blocks]
+    edge = set()
+    for order in (sorted(range(len(blocks)), key=lambda i: blocks[i][0]),
+                  sorted(range(len(blocks)), key=lambda i: -blocks[i][1])):
+        for i in order:
+            if not repeated[i]:
+                break
+            edge.add(i)
+    return edge
+
+
+def strip_blocks(blocks, height, furniture):
+    """The blocks of a page that are not running headers or footers, nor entirely inside the fallback crops."""
+    edge = edge_blocks(blocks, furniture["keys"])
+    return [(y0, y1, text) for i, (y0, y1, text) in enumerate(blocks)
+            if i not in edge and y1 > furniture["top"] + 1 and y0 < height - furniture["bottom"] - 1]
+
+
+def page_lines(blocks, height, furniture):
+    """Text lines of a page's remaining blocks."""
+    lines = []
+    for _, _, text in strip_blocks(blocks, height, furniture):
+        lines += text.splitlines()
+    return lines
+
+
+def document_lines(doc):
+    """
+    One pass over the document: the text lines of every page without the
+    running headers and footers.
+
+    Returns:
+        tuple: (list of lines per page, furniture from detect_furniture)
+    """
+    pages_blocks = [page_blocks(page) for page in doc]
+    page_heights = [page.rect.height for page in doc]
+    furniture = detect_furniture(pages_blocks, page_heights)
+
+    pages_lines = [page_lines(blocks, height, furniture) for blocks, height in zip(pages_blocks, page_heights)]
+    return pages_lines, furniture
+
+
+if __name__ == "__main__":
+    # Usage: python running_headers.py <pdf>
+    doc = fitz.open(sys.argv[1])
+    pages_lines, furniture = document_lines(doc)
+    print(json.dumps({
+        "pages": len(doc),
+        "top": round(furniture["top"], 1),
+        "bottom": round(furniture["bottom"], 1),
+        "repeated_blocks": sorted(text for _, text in furniture["keys"]),
+    }, indent=4, ensure_ascii=False))
+    doc.close()
@@ -0,0 +1,278 @@
+import re
+import sys
+import math
+import json
+from collections import Counter
+import fitz  # pymupdf is imported as fitz
+
+import prompt_registry
+import running_headers
+from tracing import span
+
+# The Bursa Malaysia sector table in section 5 of the business prompt is the taxonomy
+TAXONOMY_PROMPT = "proceeds"
+
+# Below this the model classifies the sector as before
+CONFIDENCE_THRESHOLD = 0.35
+MIN_SCORE = 0.05
+
+# Pages describing what the company does, plus the pages following them (as in split_into_sections)
+BUSINESS_KEYWORDS = ["business overview", "principal activities", "business model", "our business",
+                     "prospectus summary", "information on our group"]
+FOLLOWING_PAGES = 2
+TITLE_LINES = 6
+
+# The table's definitions are a line or two, these add the words prospectuses actually use
+EXTRA_KEYWORDS = {
+    "1.1": "contractor contractors civil engineering earthworks piling building works mechanical electrical",
+    "2.1": "poultry eggs aquaculture fishery livestock feed",
+    "2.4": "food beverage beverages bakery snacks noodles sauces halal",
+    "2.5": "furniture mattress kitchenware appliances home",
+    "2.6": "apparel garments textiles footwear jewellery cosmetics skincare",
+    "2.7": "retail outlets stores supermarket convenience",
+    "2.8": "hotel hotels restaurant restaurants tourism travel",
+    "3.1": "oil gas offshore drilling upstream vessels fabrication",
+    "3.4": "solar photovoltaic renewable epcc",
+    "5.1": "medical devices diagnostic laboratory",
+    "5.2": "hospital clinics clinic specialist",
+    "6.2": "cement concrete tiles bricks paint",
+    "6.3": "chemical chemicals plastic plastics resin polymer adhesive coatings",
+    "6.5": "machinery engineering fabrication",
+    "6.6": "automation precision machining components moulds machine",
+    "6.8": "steel aluminium metal metals copper",
+    "6.9": "packaging cartons corrugated boxes labels",
+    "6.10": "timber wood plywood sawn",
+    "7.1": "oil palm plantation estates fresh fruit bunches",
+    "8.1": "property development township residential properties",
+    "10.1": "digital e-commerce platform payment online internet",
+    "10.2": "semiconductor wafer test equipment osat",
+    "10.3": "software saas erp application applications cloud subscription licence",
+    "10.4": "computers servers hardware printers smartcards",
+    "11.1": "advertising media marketing publishing broadcasting",
+    "12.1": "logistics freight forwarding warehousing courier haulage shipping",
+    "13.1": "electricity power plant",
+}
+
+STOPWORDS = set("""
+a an and are as at be by companies company engaged for from in includes including into is of on or other
+our providers provider such that the their these this those to which with we us its also which not
+""".split())
+
+# The table was copied from a PDF, some capitals came through as Greek letters (ΒΑΝΚING)
+GREEK_CAPITALS = str.maketrans("ΑΒΕΗΙΚΜΝΟΡΤΧΥΖ", "ABEHIKMNOPTXYZ")
+
+
+def tokenize(text):
+    words = re.findall(r"[a-z][a-z\-]+", text.lower())
+    return [word[:-1] if word.endswith("s") and len(word) > 4 else word  # crude plural folding
+            for word in words if word not in STOPWORDS]
+
+
+def parse_taxonomy(prompt_text):
+    """
+    Parse the fixed-width "Sector / Sub Sector / Definition" tables of the prompt.
+
+    Sector names are taken by sector number, not by row, because the table
+    rows do not always line up (7 PLANTATION sits next to 6.7).
+
+    Returns:
+        list: {"code", "sector", "sub_sector", "definition"} per sub sector.
+    """
+    sector_names = {}
+    subsectors = []
+    columns = None
+    current_sector = None
+    current = None
+
+    for line in prompt_text.translate(GREEK_CAPITALS).splitlines():
+        header = re.search(r"Sector\s+Sub Sector\s+Definition", line)
+        if header:
+            # The columns of the first header, one later header is spaced differently from its rows
+            columns = columns or (header.start(), line.index("Sub Sector"), line.index("Definition"))
+            continue
+        if columns is None:
+            continue
+        if re.match(r"\s*\d+\.\s+\*\*", line):
+            break  # the next numbered section of the prompt, the table is over
+        if not line.strip() or line.strip().startswith("---"):
+            continue
+
+        sector_cell = line[columns[0]:columns[1]].strip()
+        sub_cell = line[columns[1]:columns[2]].strip()
+        definition_cell = line[columns[2]:].strip()
+
+        if re.fullmatch(r"\d+", sector_cell):
+            current_sector = sector_cell
+            sector_names[current_sector] = []
+        elif sector_cell and current_sector:
+            sector_names[current_sector].append(sector_cell)
+
+        if re.fullmatch(r"\d+\.\d+", sub_cell):
+            current = {"code": sub_cell, "sub_sector": [], "definition": [definition_cell]}
+            subsectors.append(current)
+        elif current is not None:
+            if sub_cell:
+                current["sub_sector"].append(sub_cell)
+            if definition_cell:
+                current["definition"].append(definition_cell)
+
+    taxonomy = []
+    for subsector in subsectors:
+        sector_number = subsector["code"].split(".")[0]
+        taxonomy.append({
+            "code": subsector["code"],
+            "sector": " ".join(sector_names.get(sector_number, [])),
+            "sub_sector": " ".join(subsector["sub_sector"]),
+            "definition": " ".join(subsector["definition"]),
+        })
+    return taxonomy
+
+
+class SectorIndex:
+    """TF-IDF index over the sub sectors, each described by its name, definition and extra keywords."""
+
+    def __init__(self, taxonomy):
+        self.taxonomy = taxonomy
+        documents = []
+        for entry in taxonomy:
+            # The sub sector name is the strongest signal, count it three times
+            text = " ".join([entry["sub_sector"]] * 3 + [entry["definition"], EXTRA_KEYWORDS.get(entry["code"], "")])
+            documents.append(Counter(tokenize(text)))
+
+        document_frequency = Counter(term for document in documents for term in document)
+        self.idf = {term: math.log(len(documents) / count) + 1 for term, count in document_frequency.items()}
+        self.vectors = [self.weigh(document) for document in documents]
+
+    def weigh(self, counts):
+        vector = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {term: value / norm for term, value in vector.items()}
+
+    def classify(self, text):
+        """
+        Returns the best sub sector for the text, with a confidence in [0, 1]
+        from how far it is ahead of the runner-up.
+        """
+        query = self.weigh(Counter(tokenize(text)))
+        scores = []
+        for entry, vector in zip(self.taxonomy, self.vectors):
+            score = sum(weight * vector[term] for term, weight in query.items() if term in vector)
+            scores.append((score, entry, vector))
+        scores.sort(key=lambda item: -item[0])
+
+        best_score, best, vector = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        confidence = (best_score - runner_up) / best_score if best_score >= MIN_SCORE else 0.0
+        keywords = sorted((term for term in query if term in vector), key=lambda term: -query[term] * vector[term])[:5]
+
+        return {
+            "sector": best["sector"],
+            "sub_sector": best["sub_sector"],
+            "code": best["code"],
+            "confidence": round(confidence, 3),
+            "score": round(best_score, 4),
+            "runner_up": scores[1][1]["sub_sector"] if len(scores) > 1 else None,
+            "explanation": f"Classified locally from the business overview, matching keywords: {', '.join(keywords)}.",
+        }
+
+
+_index = None
+
+
+def get_index():
+    """The index is built once per process from the prompt's taxonomy table."""
+    global _index
+    if _index is None:
+        taxonomy = parse_taxonomy(prompt_registry.get_prompt(TAXONOMY_PROMPT))
+        if not taxonomy:
+            print(f"ERROR: No sector table found in the '{TAXONOMY_PROMPT}' prompt")
+            sys.exit(1)
+        _index = SectorIndex(taxonomy)
+    return _index
+
+
+def business_overview_text(doc):
+    """Text of the business overview pages, or of the whole document if none are titled so. Running headers are left out."""
+    pages_lines, _ = running_headers.document_lines(doc)
+    selected = []
+    following = 0
+    for page_num, lines in enumerate(pages_lines):
+        title = " ".join(lines[:TITLE_LINES]).lower()
+        if any(keyword in title for keyword in BUSINESS_KEYWORDS):
+            selected.append(page_num)
+            following = FOLLOWING_PAGES
+        elif following:
+            selected.append(page_num)
+            following -= 1
+    pages = selected or range(len(pages_lines))
+    return "\n".join("\n".join(pages_lines[page_num]) for page_num in pages)
+
+
+def classify_pdf(source):
+    """
+    Classify the sector of an abridged PDF (path or bytes).
+
+    Returns:
+        dict: sector, sub_sector, explanation (as the model would answer), plus
+              the sub sector code, the confidence and whether it is "confident".
+    """
+    with span("classify_sector", document=source if isinstance(source, str) else "bytes") as attrs:
+        doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+        try:
+            text = business_overview_text(doc)
+        finally:
+            doc.close()
+        classification = get_index().classify(text)
+        classification["confident"] = classification["confidence"] >= CONFIDENCE_THRESHOLD
+        attrs["sub_sector"] = classification["sub_sector"]
+        attrs["confidence"] = classification["confidence"]
+    return classification
+
+
+def strip_taxonomy(prompt):
+    """
+    Replace the Sector section (and its long taxonomy table) of a prompt with a
+    note that the sector is already known, so the model does not spend tokens on it.
+    """
+    return re.sub(
+        r"(5\.\s+\*\*Sector:\*\*).*?(?=\n\s*6\.\s+\*\*Additional Sector\*\*)",
+        r"\1\n    * Already classified, return null for this field.\n",
+        prompt, count=1, flags=re.DOTALL,
+    )
+
+
+def sector_answer(classification):
+    """The classification in the shape of the model's "sector" field."""
+    return {key: classification[key] for key in ("sector", "sub_sector", "explanation")}
+
+
+def prepare_prompts(pdf_data, prompts, target="proceeds"):
+    """
+    Classify the document locally and, when confident, drop the taxonomy from
+    the target's prompt. Returns (prompts, classification or None).
+    """
+    if target not in prompts:
+        return prompts, None
+    classification = classify_pdf(pdf_data)
+    print(f"Sector: {classification['sub_sector']} ({classification['confidence']:.2f})")
+    if not classification["confident"]:
+        return prompts, classification
+    return dict(prompts, **{target: strip_taxonomy(prompts[target])}), classification
+
+
+def apply_classification(results, classification, target="proceeds"):
+    """Put a confident local classification in place of the model's sector answer."""
+    if classification and classification["confident"] and isinstance(results.get(target), dict):
+        results[target]["sector"] = sector_answer(classification)
+    return results
+
+
+if __name__ == "__main__":
+    # Usage: python sector_classifier.py <abridged pdf> ...
+    if len(sys.argv) < 2:
+        for entry in get_index().taxonomy:
+            print(f"{entry['code']:6} {entry['sector']:40} {entry['sub_sector']}")
+        sys.exit(0)
+
+    for pdf_path in sys.argv[1:]:
+        print(pdf_path, json.dumps(classify_pdf(pdf_path), indent=4, ensure_ascii=False))
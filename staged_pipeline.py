@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # pymupdf is imported as fitz
+import httpx
+from google.genai import types
+
+import extraction_planner
+import sector_classifier
+import listed_companies
+from low_memory_abridge import ABRIDGERS, DOWNLOAD_CHUNK_SIZE
+from ocr_fallback import fill_missing_titles
+from output_store import store_results
+from pdf_writer import write_pages
+import running_headers
+from tracing import span
+
+TARGETS = ("financials", "proceeds")
+STAGES = ["download", "abridge", "extract", "write"]
+
+
+def abridge_to_bytes(pdf_path, mode="ipo", image_dpi=None, ocr=False):
+    """Title scan and abridge in a worker process. Returns (abridged PDF bytes, page count)."""
+    abridger = ABRIDGERS[mode]
+    doc = fitz.open(pdf_path)
+    try:
+        pages_lines, furniture = running_headers.document_lines(doc)
+        titles = [abridger.title_from_lines(lines) for lines in pages_lines]
+        if ocr:
+            # One OCR process, the abridge stage already runs a process per CPU
+            titles = fill_missing_titles(pdf_path, titles, abridger.title_from_lines, furniture, max_workers=1)
+        page_numbers = abridger.split_into_sections(titles)
+        return write_pages(doc, page_numbers, None, writer="insert", image_dpi=image_dpi), len(page_numbers)
+    finally:
+        doc.close()
+
+
+class StagedPipeline:
+    """
+    Download -> abridge -> extract -> write, each stage with its own workers.
+
+    Downloads and model calls are I/O waits and run as tasks on the event
+    loop, abridging is CPU work and runs in a process pool. Stages are joined
+    by bounded queues, so a slow stage makes the one before it wait instead of
+    piling up PDFs in memory. queue_depths() shows where work is backing up.
+    """
+
+    def __init__(self, download_workers=4, abridge_workers=None, model_workers=4,
+                 queue_size=8, work_dir="pdf", mode="ipo", targets=TARGETS, image_dpi=None, ocr=False):
+        self.download_workers = download_workers
+        self.abridge_workers = abridge_workers or os.cpu_count()
+        self.model_workers = model_workers
+        self.work_dir = work_dir
+        self.mode = mode
+        self.image_dpi = image_dpi  # downsample images before upload, see pdf_writer.optimize_images
+        self.ocr = ocr  # OCR the titles of scanned pages, see ocr_fallback
+        self.targets = targets
+        self.prompts = {target: extraction_planner.read_target_prompt(target) for target in targets}
+        self.queues = {stage: asyncio.Queue(maxsize=queue_size) for stage in STAGES}
+        self.done = {stage: 0 for stage in STAGES}
+        self.busy_seconds = {stage: 0.0 for stage in STAGES}
+        self.failed = []
+
+    def queue_depths(self):
+        return {stage: queue.qsize() for stage, queue in self.queues.items()}
+
+    def stats(self):
+        return {
+            "queued": self.queue_depths(),
+            "done": dict(self.done),
+            "busy_seconds": {stage: round(seconds, 2) for stage, seconds in self.busy_seconds.items()},
+            "failed": list(self.failed),
+        }
+
+    async def download(self, http, pdf_url):
+        os.makedirs(self.work_dir, exist_ok=True)
+        pdf_path = os.path.join(self.work_dir, os.path.basename(pdf_url))
+        async with http.stream("GET", pdf_url) as response:
+            response.raise_for_status()
+            with open(pdf_path, "wb") as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        return pdf_path
+
+    async def generate(self, pdf_data, prompt):
+        response = await extraction_planner.client.aio.models.generate_content(
+            model=extraction_planner.MODEL,
+            config=types.GenerateContentConfig(temperature=0.5),
+            contents=[types.Part.from_bytes(data=pdf_data, mime_type='application/pdf'), prompt],
+        )
+        print(response.usage_metadata)
+        return extraction_planner.parse_json_response(response.text)
+
+    async def extract(self, document_id, pdf_data, num_pages):
+        loop = asyncio.get_running_loop()
+        prompts, classification = await loop.run_in_executor(None, sector_classifier.prepare_prompts, pdf_data, self.prompts)
+        prompts, peers = await loop.run_in_executor(None, listed_companies.prepare_prompts, pdf_data, prompts)
+        plan = extraction_planner.plan_extraction(num_pages, self.targets, prompts, document_id)
+        if plan["strategy"] == "merged":
+            data = await self.generate(pdf_data, extraction_planner.merged_prompt(self.targets, prompts))
+            results = {target: data.get(target, {}) for target in self.targets}
+        else:
+            outputs = await asyncio.gather(*(self.generate(pdf_data, prompts[target]) for target in self.targets))
+            results = dict(zip(self.targets, outputs))
+        results = sector_classifier.apply_classification(results, classification)
+        return listed_companies.apply_peers(results, peers)
+
+    def write(self, document_id, results):
+        store_results(document_id, financials=results.get("financials"), business=results.get("proceeds"))
+        output_path = os.path.join("json", f"{document_id}_ipo.json")
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+
+    async def worker(self, stage, handle):
+        """Take items off a stage's queue forever, handle them, pass results on."""
+        queue = self.queues[stage]
+        next_queue = self.queues[STAGES[STAGES.index(stage) + 1]] if stage != STAGES[-1] else None
+        while True:
+            document_id, item = await queue.get()
+            try:
+                start = time.perf_counter()
+                try:
+                    with span(stage, document_id=document_id):
+                        result = await handle(document_id, item)
+                    self.done[stage] += 1
+                except Exception as e:
+                    print(f"ERROR: {stage} failed for {document_id}: {e}")
+                    self.failed.append((document_id, stage))
+                    result = None
+                self.busy_seconds[stage] += time.perf_counter() - start
+
+                if result is not None and next_queue is not None:
+                    await next_queue.put((document_id, result))  # waits while the next stage is full
+            finally:
+                # Only after the hand-off, so joining the queues in order never misses an item
+                queue.task_done()
+
+    async def run(self, pdf_urls, report_every=10):
+        loop = asyncio.get_running_loop()
+        process_pool = ProcessPoolExecutor(max_workers=self.abridge_workers)
+        http = httpx.AsyncClient(follow_redirects=True, timeout=120)
+
+        async def handle_download(document_id, pdf_url):
+            return await self.download(http, pdf_url)
+
+        async def handle_abridge(document_id, pdf_path):
+            return await loop.run_in_executor(process_pool, abridge_to_bytes, pdf_path, self.mode, self.image_dpi,
+                                              self.ocr)
+
+        async def handle_extract(document_id, abridged):
+            pdf_data, num_pages = abridged
+            return await self.extract(document_id, pdf_data, num_pages)
+
+        async def handle_write(document_id, results):
+            await loop.run_in_executor(None, self.write, document_id, results)
+            return results
+
+        handlers = {"download": handle_download, "abridge": handle_abridge,
+                    "extract": handle_extract, "write": handle_write}
+        counts = {"download": self.download_workers, "abridge": self.abridge_workers,
+                  "extract": self.model_workers, "write": 1}
+        workers = [asyncio.create_task(self.worker(stage, handlers[stage]))
+                   for stage in STAGES for _ in range(counts[stage])]
+
+        async def report():
+            while True:
+                await asyncio.sleep(report_every)
+                print(f"Pipeline: {self.stats()}")
+
+        reporter = asyncio.create_task(report())
+        try:
+            for pdf_url in pdf_urls:
+                document_id = os.path.splitext(os.path.basename(pdf_url))[0]
+                await self.queues["download"].put((document_id, pdf_url))
+            for stage in STAGES:
+                await self.queues[stage].join()
+        finally:
+            reporter.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            await http.aclose()
+            process_pool.shutdown()
+
+        return self.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract many IPO PDFs with overlapping stages.")
+    parser.add_argument("pdf_urls", nargs="+", help="Announcement PDF URLs")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--abridge-workers", type=int, default=None, help="Defaults to the CPU count")
+    parser.add_argument("--model-workers", type=int, default=4, help="Concurrent model calls, match the API quota")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--image-dpi", type=int, default=None, help="Downsample images to this DPI before upload")
+    parser.add_argument("--ocr", action="store_true", help="OCR the titles of scanned pages (needs Tesseract)")
+    args = parser.parse_args()
+
+    pipeline = StagedPipeline(args.download_workers, args.abridge_workers, args.model_workers, args.queue_size,
+                               image_dpi=args.image_dpi, ocr=args.ocr)
+    stats = asyncio.run(pipeline.run(args.pdf_urls))
+    print(json.dumps(stats, indent=4))
+    if stats["failed"]:
+        sys.exit(1)
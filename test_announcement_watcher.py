@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-test")  # process is replaced, the API is never called
+
+import announcement_watcher
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(directory)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def wait_idle(watcher, timeout=10):
+    deadline = time.time() + timeout
+    while watcher.in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    assert not watcher.in_flight
+
+
+def test_poll_dedupes_and_advances_the_high_water_mark(tmp_path):
+    (tmp_path / "listing.html").write_text(
+        '<a href="100.pdf">old</a> <a href="101.pdf">A</a> <a href="/x/102.pdf">B</a> '
+        '<a href="https://cdn.example/103.pdf">C</a> <a href="101.pdf">A again</a>')
+    state_path = str(tmp_path / "state.json")
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump({"high_water_mark": 100}, f)
+
+    release = threading.Event()
+    processed = []
+
+    def process(announcement_id, pdf_url):
+        release.wait(10)
+        processed.append((announcement_id, pdf_url))
+        if announcement_id == 102:
+            raise ValueError("no financials")
+
+    server = serve(tmp_path)
+    listing_url = f"http://127.0.0.1:{server.server_address[1]}/listing.html"
+    try:
+        watcher = announcement_watcher.AnnouncementWatcher(listing_url, state_path, max_workers=2,
+                                                           max_in_flight=2, process=process)
+        assert watcher.poll() == [101, 102]
+        assert watcher.poll() == []  # in flight, and 103 waits for a free slot
+        release.set()
+        wait_idle(watcher)
+
+        assert watcher.poll() == [103]
+        wait_idle(watcher)
+        watcher.executor.shutdown(wait=True)
+    finally:
+        server.shutdown()
+
+    assert sorted(processed) == [(101, announcement_watcher.PDF_URL_TEMPLATE.format(101)),
+                                 (102, announcement_watcher.PDF_URL_TEMPLATE.format(102)),
+                                 (103, "https://cdn.example/103.pdf")]
+    state = announcement_watcher.load_state(state_path)
+    assert state == {"high_water_mark": 103, "done_above": [], "failed": [102]}
+
+    # A restarted watcher picks up where the last one stopped
+    restarted = announcement_watcher.AnnouncementWatcher(listing_url, state_path, process=process)
+    assert restarted.is_done(101) and restarted.is_done(103) and not restarted.is_done(104)
+    restarted.executor.shutdown(wait=True)
+
+
+def test_finish_out_of_order_keeps_ids_above_the_oldest_in_flight(tmp_path):
+    watcher = announcement_watcher.AnnouncementWatcher("http://127.0.0.1:1/", str(tmp_path / "state.json"))
+    watcher.in_flight = {5, 6, 7}
+    watcher.finish(7, failed=False)
+    assert watcher.state["high_water_mark"] == 0 and watcher.state["done_above"] == [7]
+    watcher.finish(5, failed=False)
+    assert watcher.state["high_water_mark"] == 5 and watcher.state["done_above"] == [7]
+    watcher.finish(6, failed=True)
+    assert watcher.state == {"high_water_mark": 7, "done_above": [], "failed": [6]}
+    watcher.executor.shutdown(wait=True)
@@ -0,0 +1,59 @@
+import os
+import json
+import fitz  # pymupdf is imported as fitz
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-test")  # the local client never calls the API
+
+import batch_extract
+import output_store
+
+
+def make_pdfs(pdf_dir, count):
+    documents = {}
+    for i in range(count):
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), f"Document {i}")
+        documents[f"D{i}"] = str(pdf_dir / f"D{i}_financial.pdf")
+        doc.save(documents[f"D{i}"])
+    return documents
+
+
+def test_local_batch_submits_every_job_then_writes_financial_json(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(batch_extract, "MAX_REQUESTS_PER_JOB", 2)
+    documents = make_pdfs(tmp_path, 3)
+    prompts_seen = []
+
+    def generate(model, pdf_path, prompt):
+        prompts_seen.append(pdf_path)
+        return json.dumps({"financials": {"Name": os.path.basename(pdf_path), "PE (reported)": "12.5"}})
+
+    client = batch_extract.LocalBatchClient(generate, work_dir=str(tmp_path / "batches"))
+    calls = []
+    create, get = client.batches.create, client.batches.get
+    client.batches.create = lambda **kwargs: calls.append("create") or create(**kwargs)
+    client.batches.get = lambda name: calls.append("get") or get(name)
+
+    written = batch_extract.run_batch(documents, targets=("financials",), client=client, poll_interval=0,
+                                      batch_dir=str(tmp_path / "batches"), tickers={"D0": "DZERO"})
+
+    assert calls == ["create", "create", "get", "get"]
+    assert sorted(written) == [os.path.join("json", f"D{i}_financial.json") for i in range(3)]
+    with open(os.path.join("json", "D1_financial.json"), encoding="utf-8") as f:
+        assert json.load(f)["Name"] == "D1_financial.pdf"
+    assert len(prompts_seen) == 3
+    conn = output_store.open_store()
+    assert conn.execute("SELECT ticker FROM documents WHERE doc_id = 'D0'").fetchone()[0] == "DZERO"
+    conn.close()
+
+
+def test_resume_from_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    documents = make_pdfs(tmp_path, 1)
+    client = batch_extract.LocalBatchClient(lambda model, pdf_path, prompt: '{"financials": {}, "proceeds": {}}',
+                                            work_dir=str(tmp_path / "batches"))
+    batch_extract.run_batch(documents, client=client, poll_interval=0, batch_dir=str(tmp_path / "batches"))
+
+    manifest_path = next(str(tmp_path / "batches" / name) for name in os.listdir(tmp_path / "batches")
+                         if name.endswith("_manifest.json"))
+    assert batch_extract.resume(manifest_path, client, poll_interval=0) == [os.path.join("json", "D0_ipo.json")]
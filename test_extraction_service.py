@@ -0,0 +1,82 @@
+import os
+import threading
+import http.client
+
+import httpx
+
+os.environ.setdefault("GOOGLE_API_KEY", "offline-test")  # process is replaced, the API is never called
+
+import extraction_service
+
+
+def start(tmp_path):
+    service = extraction_service.ExtractionService(
+        work_dir=str(tmp_path), process=lambda job: {"document_id": job.document_id, "pdf_path": job.pdf_path})
+    handler = type("Handler", (extraction_service.ServiceHandler,), {"service": service})
+    server = extraction_service.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return service, server
+
+
+def stop(service, server):
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def test_bad_requests_get_400(tmp_path):
+    service, server = start(tmp_path)
+    url = f"http://127.0.0.1:{server.server_port}/jobs"
+    try:
+        for body, error in [([1, 2], "object"),
+                            ({"url": "http://x/a.pdf", "document_id": "../../etc/x"}, "document_id"),
+                            ({"url": "http://x/a.pdf", "targets": 5}, "targets"),
+                            ({"url": "http://x/a.pdf", "targets": ["nope"]}, "unknown targets"),
+                            ({"url": 7}, "url"),
+                            ({}, "url")]:
+            response = httpx.post(url, json=body)
+            assert response.status_code == 400, body
+            assert error in response.json()["error"], body
+
+        for length in ["abc", "-1", "1.5"]:
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+            conn.putrequest("POST", "/jobs")
+            conn.putheader("Content-Length", length)
+            conn.endheaders()
+            response = conn.getresponse()
+            assert response.status == 400, length
+            conn.close()
+        assert service.counts["submitted"] == 0
+    finally:
+        stop(service, server)
+
+
+def test_url_and_upload_jobs(tmp_path):
+    service, server = start(tmp_path)
+    url = f"http://127.0.0.1:{server.server_port}/jobs"
+    try:
+        response = httpx.post(url, json={"url": "http://x/a.pdf", "document_id": "ABC-1", "wait": 5})
+        assert response.status_code == 200
+        assert response.json()["result"]["document_id"] == "ABC-1"
+
+        # An identical request is answered from the finished job
+        response = httpx.post(url, json={"url": "http://x/a.pdf", "document_id": "ABC-1", "wait": 5})
+        assert response.json()["how"] == "cached"
+
+        response = httpx.post(url + "?wait=5&document_id=..%2Fx", content=b"%PDF-1.7",
+                              headers={"Content-Type": "application/pdf"})
+        assert response.status_code == 400
+
+        # An upload without a document_id is named by its job key
+        response = httpx.post(url + "?wait=5&targets=financials", content=b"%PDF-1.7",
+                              headers={"Content-Type": "application/pdf"})
+        job = response.json()
+        assert response.status_code == 200
+        assert job["targets"] == ["financials"]
+        assert job["document_id"] == job["job_id"]
+        assert os.path.dirname(job["result"]["pdf_path"]) == str(tmp_path)
+
+        assert httpx.get(f"http://127.0.0.1:{server.server_port}/jobs/{job['job_id']}").json()["status"] == "done"
+        assert httpx.get(f"http://127.0.0.1:{server.server_port}/jobs/unknown").status_code == 404
+    finally:
+        stop(service, server)
@@ -0,0 +1,28 @@
+import os
+import sys
+import subprocess
+
+import golden_set
+
+
+def test_imports_without_an_api_key():
+    env = {key: value for key, value in os.environ.items() if key != "GOOGLE_API_KEY"}
+    completed = subprocess.run([sys.executable, "-c", "import golden_set, cassette"], env=env,
+                               cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+
+
+def test_string_lists_compare_as_sets():
+    expected = {"bursa_peers": ["ABC Berhad", "DEF Berhad"],
+                "use_of_proceeds": [{"Purpose": "Capex", "Amount (RM'000)": "1,200"}]}
+    actual = {"bursa_peers": ["DEF  Berhad", "ABC Berhad", "GHI Berhad"],
+              "use_of_proceeds": [{"Purpose": "capex", "Amount (RM'000)": 1200}]}
+
+    score = golden_set.score_fields(expected, actual)
+    assert score["wrong"] == []
+    assert score["fields"] == 4
+
+    score = golden_set.score_fields(expected, {"bursa_peers": ["ABC Berhad"]})
+    assert [wrong["field"] for wrong in score["wrong"]] == ["bursa_peers[def berhad]",
+                                                            "use_of_proceeds[capex].Purpose",
+                                                            "use_of_proceeds[capex].Amount (RM'000)"]
@@ -0,0 +1,29 @@
+import listed_companies
+
+INDEX = listed_companies.CompanyIndex([
+    {"name": "Tenaga Nasional Berhad", "aliases": ["TNB"], "subsidiaries": []},
+    {"name": "Dialog Group Berhad", "aliases": [], "subsidiaries": ["Dialog Energy Sdn Bhd"]},
+])
+
+
+def test_names_joined_by_and_are_two_peers():
+    peers = listed_companies.find_peers("Competitors include ABC Berhad and DEF Holdings Berhad.", INDEX)
+    assert peers == ["ABC Berhad", "DEF Holdings Berhad"]
+
+
+def test_names_are_trimmed_and_the_issuer_left_out():
+    text = "Our Group (XYZ Holdings Berhad)  100\nKumpulan Jaya Bhd  200\nCables Sdn Bhd  50\n" \
+           "Note: a subsidiary of Dialog Group Berhad"
+    issuer = listed_companies.normalise_name("XYZ Holdings Berhad")
+    assert listed_companies.find_peers(text, INDEX, issuer) == ["Kumpulan Jaya Bhd", "Dialog Group Berhad"]
+
+
+def test_only_the_competitor_table_is_read():
+    pages_lines = [
+        ["6.2 Major customers", "Our major customer is TNB."],
+        ["7.3 Competitive overview", "Company Revenue", "ABC Berhad 10", "7.4 Industry outlook", "DEF Berhad grows"],
+        ["8. RISK FACTORS", "GHI Berhad lends to us."],
+    ]
+    text = listed_companies.competitor_text(pages_lines)
+    assert listed_companies.find_peers(text, INDEX) == ["ABC Berhad"]
+    assert listed_companies.competitor_text(pages_lines[:1]) == ""
@@ -0,0 +1,10 @@
+import low_memory_abridge
+
+
+def test_low_memory_abridge_lowers_peak_rss():
+    """Both methods abridge the same synthetic scanned PDF, each in a fresh process."""
+    results = low_memory_abridge.measure_peak_rss(num_pages=200, image_kb=200)
+
+    assert results["low_memory"]["status"] == "ok", results
+    assert results["current"]["status"] == "ok", results
+    assert results["low_memory"]["peak_rss_mb"] < results["current"]["peak_rss_mb"], results
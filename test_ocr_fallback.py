@@ -0,0 +1,46 @@
+import os
+
+import fitz  # pymupdf is imported as fitz
+
+import make_abridged_ipo
+import ocr_fallback
+
+SECTIONS = ["BUSINESS OVERVIEW", "USE OF PROCEEDS", "RISK FACTORS", "FINANCIAL INFORMATION"]
+
+
+def make_scanned_pdf(path):
+    """Image-only pages, each with its own image so each has its own page hash."""
+    doc = fitz.open()
+    for page_num in range(len(SECTIONS)):
+        page = doc.new_page()
+        pix = fitz.Pixmap(fitz.csRGB, 16, 16, os.urandom(16 * 16 * 3), False)
+        page.insert_image(fitz.Rect(72, 100, 540, 700), pixmap=pix)
+    doc.save(path)
+    doc.close()
+
+
+def cache_ocr_blocks(pdf_path, cache_path):
+    """What ocr_page_header would return: the running header at y 30 and the title at y 80."""
+    doc = fitz.open(pdf_path)
+    cache = {ocr_fallback.page_hash(doc, page): [[28, 40, "ABC HOLDINGS BERHAD"],
+                                                 [75, 90, section],
+                                                 [95, 105, "Registration No. 201901012345 (1234567-X)"]]
+             for page, section in zip(doc, SECTIONS)}
+    doc.close()
+    ocr_fallback.save_cache(cache, cache_path)
+
+
+def test_scanned_titles_drop_the_running_header(tmp_path):
+    pdf_path = str(tmp_path / "scanned.pdf")
+    cache_path = str(tmp_path / "ocr_cache.json")
+    make_scanned_pdf(pdf_path)
+    cache_ocr_blocks(pdf_path, cache_path)
+
+    titles = make_abridged_ipo.extract_titles_from_pdf(pdf_path)
+    assert titles == [""] * len(SECTIONS)
+
+    titles = ocr_fallback.fill_missing_titles(pdf_path, titles, make_abridged_ipo.title_from_lines,
+                                              cache_path=cache_path)
+    assert [title.split(" Registration")[0] for title in titles] == SECTIONS
+    assert not any("ABC HOLDINGS" in title for title in titles)
+
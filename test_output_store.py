@@ -0,0 +1,34 @@
+import output_store
+
+FINANCIALS = {
+    "Name": "ABC Holdings Berhad",
+    "PAT (FYE) List ['000, comma-separated]": {"FYE 2022": "(1,234)", "FYE 2023": "5,678"},
+    "use_of_proceeds": [{"Purpose": "Capex", "Amount (RM'000)": 600, "Percentage (%)": "100%"}],
+}
+
+
+def count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_to_number():
+    assert output_store.to_number("(1,234)") == -1234.0
+    assert output_store.to_number("RM 1.5") == 1.5
+    assert output_store.to_number("90.00%") == 90.0
+    assert output_store.to_number("1,234 (RM'000)") == 1234.0
+    assert output_store.to_number("n/a") is None
+
+
+def test_failed_rerun_keeps_rows_and_ticker(tmp_path):
+    conn = output_store.open_store(str(tmp_path / "store.sqlite"))
+    output_store.store_results("1", ticker="ABC", financials=FINANCIALS, conn=conn)
+    assert count(conn, "financial_years") == 2
+    assert conn.execute("SELECT pat FROM financial_years WHERE period = 'FYE 2022'").fetchone()[0] == -1234.0
+
+    output_store.store_results("1", financials={}, conn=conn)
+    assert count(conn, "financial_years") == 2
+    assert count(conn, "proceeds_allocations") == 1
+
+    output_store.store_results("1", financials=FINANCIALS, conn=conn)
+    assert {row[0] for row in conn.execute("SELECT ticker FROM financial_years")} == {"ABC"}
+    assert conn.execute("SELECT ticker FROM documents").fetchone()[0] == "ABC"
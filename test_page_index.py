@@ -0,0 +1,47 @@
+import fitz  # pymupdf is imported as fitz
+
+import page_index
+
+
+def make_pdf(path, texts):
+    doc = fitz.open()
+    for text in texts:
+        doc.new_page().insert_text((72, 80), text)
+    doc.save(path)
+    doc.close()
+
+
+def test_merge_results_matches_list_items():
+    previous = {"use_of_proceeds": [{"Purpose": "Capex", "Amount (RM'000)": 600},
+                                    {"Purpose": "Working capital", "Amount (RM'000)": 400}],
+                "bursa_peers": ["ABC Berhad", "DEF Berhad"]}
+    results = {"use_of_proceeds": [{"Purpose": "Working Capital", "Amount (RM'000)": 450}],
+               "bursa_peers": ["GHI Berhad"]}
+
+    merged = page_index.merge_results(previous, results)
+
+    assert merged["use_of_proceeds"] == [{"Purpose": "Capex", "Amount (RM'000)": 600},
+                                         {"Purpose": "Working Capital", "Amount (RM'000)": 450}]
+    assert merged["bursa_peers"] == ["ABC Berhad", "DEF Berhad", "GHI Berhad"]
+
+
+def test_rerun_reuses_its_own_results(tmp_path):
+    pdf_path = str(tmp_path / "100.pdf")
+    make_pdf(pdf_path, [f"Page {page_num} of the prospectus" for page_num in range(5)])
+    conn = page_index.open_index(str(tmp_path / "index.sqlite"))
+
+    plan = page_index.plan_pages(conn, "100", pdf_path, [0, 1, 2], mode="financial")
+    assert plan["reuse"] is None and plan["pages"] == [0, 1, 2]
+
+    # Nothing stored for the first run yet, so the re-run extracts again
+    assert page_index.plan_pages(conn, "100", pdf_path, [0, 1, 2], mode="financial")["pages"] == [0, 1, 2]
+
+    page_index.store_result(conn, page_index.result_key("100", "financial"), {"Name": "ABC Berhad"})
+    plan = page_index.plan_pages(conn, "100", pdf_path, [0, 1, 2], mode="financial")
+    assert plan["reuse"] == "100"
+    assert plan["pages"] == []
+    assert plan["results"] == {"Name": "ABC Berhad"}
+
+    # Another mode's results are not reused
+    assert page_index.plan_pages(conn, "100", pdf_path, [0, 1, 2], mode="ipo")["reuse"] is None
+    conn.close()
@@ -0,0 +1,44 @@
+import fitz  # pymupdf is imported as fitz
+
+import make_abridged_ipo
+import running_headers
+
+SECTIONS = ["BUSINESS OVERVIEW", "USE OF PROCEEDS", "RISK FACTORS", "FINANCIAL INFORMATION", "MAJOR CUSTOMERS",
+            "PROSPECTUS SUMMARY", "DIRECTORS", "INDUSTRY OVERVIEW", "CORPORATE STRUCTURE", "PRO FORMA"]
+
+
+def make_pdf(path, repeated_line, repeated_y, every=3):
+    """10 pages with a running header and footer, their own title at y 80 and a line repeated on every third page."""
+    doc = fitz.open()
+    for page_num, section in enumerate(SECTIONS):
+        page = doc.new_page()
+        page.insert_text((72, 30), "ABC HOLDINGS BERHAD", fontsize=8)
+        page.insert_text((72, 80), section, fontsize=12)
+        if page_num % every == 0:
+            page.insert_text((72, repeated_y), repeated_line, fontsize=9)
+        page.insert_text((72, 300), f"Body text {page_num}", fontsize=9)
+        page.insert_text((280, 820), f"Page {page_num + 1}", fontsize=8)
+    doc.save(path)
+
+
+def test_repeated_table_header_keeps_titles(tmp_path):
+    pdf_path = str(tmp_path / "table_header.pdf")
+    make_pdf(pdf_path, "FYE 2021 FYE 2022 FYE 2023", 115)
+
+    titles = make_abridged_ipo.extract_titles_from_pdf(pdf_path)
+
+    assert [title.split(" FYE")[0].split(" Body")[0] for title in titles] == SECTIONS
+    assert not any("ABC HOLDINGS" in title or "Page" in title for title in titles)
+
+
+def test_repeated_body_line_keeps_titles(tmp_path):
+    pdf_path = str(tmp_path / "body_line.pdf")
+    make_pdf(pdf_path, "All amounts are in RM'000 unless stated otherwise", 110)
+
+    doc = fitz.open(pdf_path)
+    pages_lines, furniture = running_headers.document_lines(doc)
+    doc.close()
+
+    assert [lines[0] for lines in pages_lines] == SECTIONS
+    assert "All amounts are in RM'000 unless stated otherwise" in pages_lines[0]
+    assert not any("ABC HOLDINGS BERHAD" in lines or "Page 1" in lines for lines in pages_lines)
@@ -0,0 +1,59 @@
+import validation
+
+PAT = "PAT (FYE) List ['000, comma-separated]"
+PAT_LATEST = "Profit After Tax (PAT) ['000]"
+
+
+def rules(issues):
+    return sorted(item["rule"] for item in issues)
+
+
+def test_normalise_money():
+    assert validation.normalise_money(1234) == (1234, False)
+    assert validation.normalise_money("RM1.5 million") == (1500.0, True)
+    assert validation.normalise_money("RM 1,234") == (1234.0, False)
+    assert validation.normalise_money("RM0.25") == (0.25, False)
+    assert validation.normalise_money("(1,234)") == (-1234.0, False)
+    assert validation.normalise_money(None) == (None, False)
+
+
+def test_thousands_unit_is_not_a_conversion():
+    assert validation.normalise_money("RM'000 1,234") == (1234.0, False)
+    assert validation.normalise_money("1,234 (RM'000)") == (1234.0, False)
+
+    data = {PAT_LATEST: "1,234 (RM'000)"}
+    issues = validation.validate_financials(data)
+    assert data[PAT_LATEST] == 1234.0
+    assert "unit_normalised" not in rules(issues)
+
+
+def test_unit_jump_converted_when_the_other_years_agree():
+    values = {"FYE 2021": 1200, "FYE 2022": 1300, "FYE 2023": 1250000}
+    issues = []
+    validation.fix_unit_jumps(values, "financials", PAT, issues)
+    assert values == {"FYE 2021": 1200, "FYE 2022": 1300, "FYE 2023": 1250.0}
+    assert rules(issues) == ["unit_normalised"]
+
+
+def test_real_jump_from_a_small_year_is_kept():
+    data = {PAT_LATEST: 8000, PAT: {"FYE 2021": 5, "FYE 2022": 3000, "FYE 2023": 8000}}
+    issues = validation.validate_financials(data)
+    assert data[PAT] == {"FYE 2021": 5, "FYE 2022": 3000, "FYE 2023": 8000}
+    assert "unit_normalised" not in rules(issues)
+    assert "pat_consistency" not in rules(issues)
+
+
+def test_two_year_jump_is_flagged_not_converted():
+    values = {"FYE 2022": 8, "FYE 2023": 7619}
+    issues = []
+    validation.fix_unit_jumps(values, "financials", PAT, issues)
+    assert values == {"FYE 2022": 8, "FYE 2023": 7619}
+    assert rules(issues) == ["unit_jump"]
+
+
+def test_proceeds_percentages_and_failing_fields():
+    data = {"use_of_proceeds": [{"Purpose": "Capex", "Amount (RM'000)": 600, "Percentage (%)": 60},
+                                {"Purpose": "Working capital", "Amount (RM'000)": 400, "Percentage (%)": 30}]}
+    _, issues = validation.validate_document({"financials": data})
+    assert "percent_sum" in rules(issues)
+    assert "use_of_proceeds" in validation.failing_fields(issues)["financials"]
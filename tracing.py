@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import random
+import threading
+import cProfile
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Spans are kept in memory until exported, the oldest are dropped past this
+MAX_SPANS = 100000
+
+_spans = deque(maxlen=MAX_SPANS)
+_lock = threading.Lock()
+# A context variable rather than a thread-local, so spans nest correctly in asyncio tasks too
+_current_span = contextvars.ContextVar("current_span", default=None)
+_trace_id = "%032x" % random.getrandbits(128)
+_epoch_ns = time.time_ns() - time.perf_counter_ns()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a stage. Attributes such as document ID, page counts or byte sizes
+    can be passed in or added to the yielded dict while the stage runs.
+
+        with span("download", document_id=doc_id) as attrs:
+            data = httpx.get(url).content
+            attrs["bytes"] = len(data)
+    """
+    parent = _current_span.get()
+    span_id = "%016x" % random.getrandbits(64)
+    token = _current_span.set(span_id)
+    start = time.perf_counter_ns()
+    try:
+        yield attributes
+    finally:
+        end = time.perf_counter_ns()
+        _current_span.reset(token)
+        with _lock:
+            _spans.append({
+                "name": name,
+                "span_id": span_id,
+                "parent_id": parent,
+                "start_ns": start + _epoch_ns,
+                "end_ns": end + _epoch_ns,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "attributes": dict(attributes),
+            })
+
+
+def spans():
+    with _lock:
+        return list(_spans)
+
+
+def clear():
+    with _lock:
+        _spans.clear()
+
+
+def summary():
+    """Total seconds and count per span name, slowest first."""
+    totals = {}
+    for s in spans():
+        total = totals.setdefault(s["name"], {"seconds": 0.0, "count": 0})
+        total["seconds"] += (s["end_ns"] - s["start_ns"]) / 1e9
+        total["count"] += 1
+    return dict(sorted(totals.items(), key=lambda item: -item[1]["seconds"]))
+
+
+def add_token_counts(attrs, response):
+    """Add a model response's token counts to a span's attributes, if the response has usage metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    attrs["prompt_tokens"] = usage.prompt_token_count
+    attrs["output_tokens"] = usage.candidates_token_count
+
+
+def export_chrome_trace(output_path):
+    """Write the spans as Chrome trace-event JSON (chrome://tracing, Perfetto, speedscope)."""
+    events = [{
+        "name": s["name"],
+        "ph": "X",
+        "ts": s["start_ns"] / 1000,
+        "dur": (s["end_ns"] - s["start_ns"]) / 1000,
+        "pid": s["pid"],
+        "tid": s["tid"],
+        "args": s["attributes"],
+    } for s in spans()]
+    _write_json({"traceEvents": events, "displayTimeUnit": "ms"}, output_path)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def export_otlp_json(output_path, service_name="ipo-pdf-extractor"):
+    """Write the spans in the OpenTelemetry OTLP/JSON format, as the file exporter would."""
+    otlp_spans = [{
+        "traceId": _trace_id,
+        "spanId": s["span_id"],
+        "parentSpanId": s["parent_id"] or "",
+        "name": s["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(s["start_ns"]),
+        "endTimeUnixNano": str(s["end_ns"]),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in s["attributes"].items()],
+    } for s in spans()]
+    _write_json({
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+        }]
+    }, output_path)
+
+
+def _write_json(data, output_path):
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(f"Trace saved to {output_path}")
+    except Exception as e:
+        print(f"ERROR: Failed to write trace {output_path}: {e}")
+
+
+def run_profiled(func, *args, output_base, otlp=False):
+    """
+    Run func under a profiler and save the profile and the trace next to the output JSON.
+
+    pyinstrument is used when installed (<output_base>_profile.html), otherwise
+    cProfile (<output_base>_profile.prof, open with snakeviz or flameprof).
+    The spans are saved as <output_base>_trace.json in Chrome trace format,
+    and with otlp also as <output_base>_otlp.json for OpenTelemetry tools.
+    """
+    os.makedirs(os.path.dirname(output_base) or ".", exist_ok=True)
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            result = func(*args)
+        finally:
+            profiler.stop()
+            profile_path = f"{output_base}_profile.html"
+            with open(profile_path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+    else:
+        profiler = cProfile.Profile()
+        try:
+            result = profiler.runcall(func, *args)
+        finally:
+            profile_path = f"{output_base}_profile.prof"
+            profiler.dump_stats(profile_path)
+
+    print(f"Profile saved to {profile_path}")
+    export_chrome_trace(f"{output_base}_trace.json")
+    if otlp:
+        export_otlp_json(f"{output_base}_otlp.json")
+    for name, total in summary().items():
+        print(f"  {name}: {total['seconds']:.2f}s over {total['count']} calls")
+    return result
@@ -0,0 +1,409 @@
+import os
+import re
+import sys
+import json
+import time
+
+from output_store import to_number, parse_period
+
+PERCENT_TOLERANCE = 1.0  # percentages may sum to 99-101 because of rounding
+MARGIN_TOLERANCE = 0.5  # percentage points between a stated and a computed PAT margin
+AMOUNT_TOLERANCE = 0.02  # relative, for totals checked against their parts
+UNIT_JUMP = 500  # a value this many times the others of its list was reported in RM, not RM'000
+MIN_AGREEING_VALUES = 2  # a jump is only converted when at least this many other values agree on the scale
+SAME_SCALE = 10  # values within this factor of each other agree on the scale
+
+# Fields in RM'000, a number or a {period or pro forma column: number} dict
+FINANCIALS_MONEY = [
+    "Profit After Tax (PAT) ['000]",
+    "PAT (FYE) List ['000, comma-separated]",
+    "PAT (FPE) List ['000, comma-separated]",
+    "REVENUE (FYE) List ['000, comma-separated]",
+    "REVENUE (FPE) List ['000, comma-separated]",
+    "Total Asset (Pro Forma) ['000]",
+    "Total Liabilities (Pro Forma III) ['000]",
+    "Pro Forma Current Assets ['000]",
+    "Total Current Liabilities (Pro Forma III) ['000]",
+    "Total Cash and Bank Balances (Pro Forma)['000]",
+    "Total Cash and Cash Equivalent at the end of financial year/period ['000]",
+    "Total Interest-Bearing Borrowings ['000]",
+    "Utilisation of Proceeds - Debt Funding ['000]",
+]
+FINANCIALS_PERCENT = [
+    "PAT Margin (FYE) [%]",
+    "PAT Margin (FPE) [%]",
+    "Utilisation of Proceeds - Debt Funding [%]",
+]
+FINANCIALS_REQUIRED = [
+    "Name",
+    "Profit After Tax (PAT) ['000]",
+    "PAT (FYE) List ['000, comma-separated]",
+    "REVENUE (FYE) List ['000, comma-separated]",
+    "use_of_proceeds",
+]
+
+PROCEEDS_SEGMENTS = ["geo_segments", "business_segments", "major_customers"]
+PROCEEDS_REQUIRED = ["business_segments", "sector"]
+
+# Where each business field is described in the prompt, for targeted re-extraction
+FIELD_LABELS = {
+    "geo_segments": "Geographical Segments",
+    "business_segments": "Business Segments",
+    "major_customers": "Major Customers",
+    "corporate_structure": "Corporate Structure",
+    "sector": "Sector:",
+    "additional_sectors": "Additional Sector",
+    "imr_sectors": "IMR Sectors",
+    "bursa_peers": "Bursa Peers",
+    "market_share": "Market Share",
+    "utilisation_rate": "Utilisation Rate",
+    "unbilled_order_book": "Unbilled/Outstanding Order Book",
+    "use_of_proceeds": "Use of Proceeds",
+    "executive_directors": "Executive Directors",
+}
+
+# Keys themselves contain brackets ("PAT (FYE) List ['000, comma-separated]"), only list indexes are split off
+FIELD_PATH = re.compile(r"\.|\[\d+\]")
+# Numbered sections, bullets and bold headings of the prompt files
+PROMPT_BLOCK = re.compile(r"\n(?=\d+\.\s+|\*\s+\*\*|\*\*)")
+MULTIPLIER = re.compile(r"\d\s*(billion|bil|million|mil|mn|m|k)\b", re.IGNORECASE)
+MULTIPLIERS = {"billion": 1000000, "bil": 1000000, "million": 1000, "mil": 1000, "mn": 1000, "m": 1000, "k": 1}
+THOUSANDS = re.compile(r"['’]000")
+NUMBER = re.compile(r"\(?-?\d[\d,]*(?:\.\d+)?\)?")
+# Fields that name a list item, for matching list items across answers
+ITEM_NAME_KEYS = ["name", "Name", "Purpose", "Category", "title"]
+
+
+def issue(target, path, rule, message):
+    return {"target": target, "path": path, "rule": rule, "message": message}
+
+
+def normalise_money(value):
+    """
+    Turn a money value into a number in RM'000.
+
+    Numbers are assumed to already be in RM'000. Strings are converted only
+    when they name a multiplier: "RM1.5 million" -> 1500. "RM'000 1,234" and a
+    plain "RM 1,234" are taken as RM'000 like a number, the prompts ask for RM'000.
+
+    Returns:
+        tuple: (number or None, True if the unit was converted)
+    """
+    if value is None or isinstance(value, bool):
+        return None, False
+    if isinstance(value, (int, float)):
+        return value, False
+    if not isinstance(value, str):
+        return None, False
+
+    cleaned = THOUSANDS.sub("", value)
+    match = NUMBER.search(cleaned)
+    if not match:
+        return None, False
+    number = to_number(match.group(0))  # (1,234) is an accounting negative
+
+    multiplier = MULTIPLIER.search(cleaned)
+    if multiplier:
+        return number * MULTIPLIERS[multiplier.group(1).lower()], True
+    return number, False
+
+
+def normalise_percent(value):
+    """25.5 or "25.5%" -> 25.5. Returns (number or None, False), percentages have no unit to convert."""
+    return to_number(value), False
+
+
+def fix_unit_jumps(values, target, path, issues):
+    """
+    Within one list of periods, a value ~1000x the others may have been
+    reported in RM instead of RM'000. It is only scaled down when all the
+    other values (at least MIN_AGREEING_VALUES) agree on the scale and the
+    scaled value fits among them. A jump the others do not agree on could be
+    real (a small first year), so it is flagged as an issue and left as it is.
+    """
+    numbers = {key: value for key, value in values.items() if isinstance(value, (int, float)) and value}
+    for key, value in numbers.items():
+        others = sorted(abs(other) for other_key, other in numbers.items() if other_key != key)
+        if not others or abs(value) <= others[-1] * UNIT_JUMP:
+            continue
+        scaled = value / 1000
+        agree = len(others) >= MIN_AGREEING_VALUES and others[-1] <= others[0] * SAME_SCALE
+        if agree and others[0] / SAME_SCALE <= abs(scaled) <= others[-1] * SAME_SCALE:
+            values[key] = scaled
+            issues.append(issue(target, f"{path}.{key}", "unit_normalised",
+                                f"{value} looks like RM, converted to {scaled} RM'000"))
+        else:
+            issues.append(issue(target, f"{path}.{key}", "unit_jump",
+                                f"{value} is over {UNIT_JUMP}x the other periods, RM instead of RM'000?"))
+
+
+def normalise_field(data, key, normaliser, target, issues, path=None):
+    """Replace the value (or every value of a dict) with a number, flagging unit conversions."""
+    value = data.get(key)
+    path = path or key
+    if isinstance(value, dict):
+        for sub_key, sub_value in list(value.items()):
+            number, converted = normaliser(sub_value)
+            if number is not None and number != sub_value:
+                value[sub_key] = number
+            if converted:
+                issues.append(issue(target, f"{path}.{sub_key}", "unit_normalised", f"{sub_value!r} -> {number}"))
+        if normaliser is normalise_money:
+            fix_unit_jumps(value, target, path, issues)
+    elif value is not None:
+        number, converted = normaliser(value)
+        if number is not None and number != value:
+            data[key] = number
+        if converted:
+            issues.append(issue(target, path, "unit_normalised", f"{value!r} -> {number}"))
+
+
+def is_missing(value):
+    return value is None or value == {} or value == [] or value == ""
+
+
+def item_key(item):
+    """What identifies a list item across answers: its name field, or the whole item."""
+    if isinstance(item, dict):
+        for key in ITEM_NAME_KEYS:
+            if isinstance(item.get(key), str) and item[key].strip():
+                return key, re.sub(r"\s+", " ", item[key]).strip().lower()
+        return json.dumps(item, sort_keys=True)
+    return re.sub(r"\s+", " ", str(item)).strip().lower()
+
+
+def latest_fye(values):
+    """The value of the latest FYE in a {period: value} dict, or None."""
+    if not isinstance(values, dict):
+        return None, None
+    latest = None
+    for period, value in values.items():
+        period_type, year = parse_period(period)
+        if period_type == "FYE" and (latest is None or year > latest[0]):
+            latest = (year, period, value)
+    if latest is None:
+        return None, None
+    return latest[1], to_number(latest[2])
+
+
+def check_items_sum(items, path, target, issues, percentage_key, amount_key):
+    """Percentages of a list add up to ~100 and each one matches its share of the total amount."""
+    if not isinstance(items, list) or not items:
+        return
+    rows = [(index, to_number(item.get(percentage_key)), normalise_money(item.get(amount_key))[0])
+            for index, item in enumerate(items) if isinstance(item, dict)]
+
+    percentages = [p for _, p, _ in rows if p is not None]
+    if percentages and all(0 <= p <= 1 for p in percentages) and abs(sum(percentages) - 1) <= PERCENT_TOLERANCE / 100:
+        # 0.9883 instead of 98.83%, keep the field's own format
+        for index, percentage, _ in rows:
+            if percentage is not None:
+                original = items[index][percentage_key]
+                items[index][percentage_key] = f"{percentage * 100:.2f}%" if isinstance(original, str) else percentage * 100
+        issues.append(issue(target, path, "unit_normalised", "percentages given as fractions, multiplied by 100"))
+        rows = [(index, p * 100 if p is not None else None, a) for index, p, a in rows]
+        percentages = [p * 100 for p in percentages]
+
+    if percentages and abs(sum(percentages) - 100) > PERCENT_TOLERANCE:
+        issues.append(issue(target, path, "percent_sum", f"percentages sum to {sum(percentages):.2f}, not 100"))
+
+    total = sum(a for _, _, a in rows if a is not None)
+    if total:
+        for index, percentage, amount in rows:
+            if percentage is not None and amount is not None and abs(amount / total * 100 - percentage) > PERCENT_TOLERANCE:
+                issues.append(issue(target, f"{path}[{index}].{percentage_key}", "percent_of_total",
+                                    f"{amount} is {amount / total * 100:.2f}% of {total}, stated {percentage}%"))
+
+
+def validate_financials(data, target="financials"):
+    issues = []
+    for key in FINANCIALS_MONEY:
+        normalise_field(data, key, normalise_money, target, issues)
+    for key in FINANCIALS_PERCENT:
+        normalise_field(data, key, normalise_percent, target, issues)
+
+    for key in FINANCIALS_REQUIRED:
+        if is_missing(data.get(key)):
+            issues.append(issue(target, key, "required", "missing"))
+
+    # The latest PAT is the latest entry of the PAT list
+    pat = to_number(data.get("Profit After Tax (PAT) ['000]"))
+    period, latest_pat = latest_fye(data.get("PAT (FYE) List ['000, comma-separated]"))
+    if pat is not None and latest_pat is not None and abs(pat - latest_pat) > max(1, abs(latest_pat) * 0.001):
+        issues.append(issue(target, "Profit After Tax (PAT) ['000]", "pat_consistency",
+                            f"{pat} does not match {period} PAT {latest_pat}"))
+
+    # PAT margins match PAT / revenue
+    pats = data.get("PAT (FYE) List ['000, comma-separated]")
+    revenues = data.get("REVENUE (FYE) List ['000, comma-separated]")
+    margins = data.get("PAT Margin (FYE) [%]")
+    if isinstance(pats, dict) and isinstance(revenues, dict) and isinstance(margins, dict):
+        for period, margin in margins.items():
+            pat_value, revenue = to_number(pats.get(period)), to_number(revenues.get(period))
+            margin = to_number(margin)
+            if None not in (pat_value, revenue, margin) and revenue:
+                computed = pat_value / revenue * 100
+                if abs(computed - margin) > MARGIN_TOLERANCE:
+                    issues.append(issue(target, f"PAT Margin (FYE) [%].{period}", "margin_consistency",
+                                        f"stated {margin}%, PAT/revenue gives {computed:.2f}%"))
+
+    # Proceeds allocations add up, match the debt funding figure and the amount raised
+    proceeds = data.get("use_of_proceeds")
+    if isinstance(proceeds, list):
+        for index, item in enumerate(proceeds):
+            if isinstance(item, dict):
+                normalise_field(item, "Amount (RM'000)", normalise_money, target, issues,
+                                f"use_of_proceeds[{index}].Amount (RM'000)")
+                normalise_field(item, "Percentage (%)", normalise_percent, target, issues,
+                                f"use_of_proceeds[{index}].Percentage (%)")
+    check_items_sum(proceeds, "use_of_proceeds", target, issues, "Percentage (%)", "Amount (RM'000)")
+    if isinstance(proceeds, list) and proceeds:
+        total = sum(to_number(item.get("Amount (RM'000)")) or 0 for item in proceeds if isinstance(item, dict))
+
+        debt = to_number(data.get("Utilisation of Proceeds - Debt Funding ['000]"))
+        repayments = [to_number(item.get("Amount (RM'000)")) or 0 for item in proceeds
+                      if isinstance(item, dict) and item.get("Category") == "Debt Repayment"]
+        if debt is not None and repayments and abs(sum(repayments) - debt) > max(1, debt * AMOUNT_TOLERANCE):
+            issues.append(issue(target, "Utilisation of Proceeds - Debt Funding ['000]", "debt_funding",
+                                f"{debt} does not match Debt Repayment allocations {sum(repayments)}"))
+
+        new_shares = to_number(data.get("New Shares Issued [M]"))
+        price = to_number(data.get("Listing Price"))
+        if total and new_shares and price:
+            raised = new_shares * price * 1000  # millions of shares x RM -> RM'000
+            if abs(raised - total) > raised * AMOUNT_TOLERANCE:
+                issues.append(issue(target, "use_of_proceeds", "proceeds_total",
+                                    f"allocations total {total}, {new_shares}M new shares at RM{price} raise {raised:.0f}"))
+    return issues
+
+
+def validate_proceeds(data, target="proceeds"):
+    issues = []
+    for key in PROCEEDS_REQUIRED:
+        if is_missing(data.get(key)):
+            issues.append(issue(target, key, "required", "missing"))
+    for key in PROCEEDS_SEGMENTS:
+        if key != "major_customers":  # major customers are only part of the revenue
+            check_items_sum(data.get(key), key, target, issues, "percentage", "revenue")
+    return issues
+
+
+VALIDATORS = {
+    "financials": validate_financials,
+    "proceeds": validate_proceeds,
+}
+
+
+def validate_document(results):
+    """
+    Validate and normalise the extraction results of one document.
+
+    Args:
+        results (dict): {target: extracted JSON}, e.g. {"financials": ..., "proceeds": ...}.
+
+    Returns:
+        tuple: (normalised copy of results, list of issues). Each issue has the
+               target, the offending field path, the rule and a message. Issues
+               with rule "unit_normalised" were fixed in the copy.
+    """
+    # Results come from JSON, a JSON round trip copies them faster than deepcopy
+    normalised = json.loads(json.dumps(results))
+    issues = []
+    for target, data in normalised.items():
+        if target in VALIDATORS:
+            if not isinstance(data, dict):
+                normalised[target] = data = {}
+            issues += VALIDATORS[target](data, target)
+    return normalised, issues
+
+
+def failing_fields(issues):
+    """{target: top-level fields to re-extract}, leaving out the issues already fixed."""
+    fields = {}
+    for item in issues:
+        if item["rule"] == "unit_normalised":
+            continue
+        field = FIELD_PATH.split(item["path"], maxsplit=1)[0]
+        fields.setdefault(item["target"], [])
+        if field not in fields[item["target"]]:
+            fields[item["target"]].append(field)
+    return fields
+
+
+def prompt_section(prompt_text, field):
+    """The numbered section or bullet of a prompt describing a field, matched on its heading line."""
+    blocks = [block.strip() for block in PROMPT_BLOCK.split(prompt_text)]
+    headings = [block.split("\n", 1)[0].lower() for block in blocks]
+    # The exact key first, then without its unit ("PAT Margin (FYE) [%]" is "PAT Margin (FYE) List [%]" in the prompt)
+    for label in (FIELD_LABELS.get(field, field), re.sub(r"\s*\[.*$", "", field)):
+        for block, heading in zip(blocks, headings):
+            if label.lower() in heading:
+                return block
+    return f"**{field}**"
+
+
+def reextraction_prompt(target, fields, prompt_text, issues=()):
+    """A prompt asking for only the given fields, with their instructions and what was wrong."""
+    sections = "\n\n".join(prompt_section(prompt_text, field) for field in fields)
+    problems = "\n".join(f"*   {item['path']}: {item['message']}" for item in issues
+                         if item["target"] == target and item["rule"] != "unit_normalised")
+    keys = ", ".join(f'"{field}"' for field in fields)
+    return (
+        "You are an expert financial analyst extracting data from an IPO prospectus.\n"
+        f"A previous extraction got these fields wrong:\n{problems}\n\n"
+        f"Extract ONLY these fields again, following the instructions below:\n\n{sections}\n\n"
+        f"Respond with a single valid JSON object with exactly these keys: {keys}. "
+        "All money values in RM'000 as numbers, percentages as numbers (25.0 for 25%)."
+    )
+
+
+def reextract(pdf_data, results, issues, prompts, model=None):
+    """
+    Re-extract only the failing fields and merge them into the results.
+
+    Returns:
+        tuple: (merged results, issues after the re-extraction)
+    """
+    import extraction_planner  # needs the API key, only import when actually calling the model
+
+    merged = json.loads(json.dumps(results))
+    for target, fields in failing_fields(issues).items():
+        prompt = reextraction_prompt(target, fields, prompts[target], issues)
+        data, _ = extraction_planner.generate_json(pdf_data, prompt, model or extraction_planner.MODEL)
+        for field in fields:
+            if field in data:
+                merged.setdefault(target, {})[field] = data[field]
+    return validate_document(merged)
+
+
+if __name__ == "__main__":
+    # Usage: python validation.py <json file or dir> ...
+    paths = sys.argv[1:] or ["json"]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".json")]
+        else:
+            files.append(path)
+
+    total_seconds = 0.0
+    for file_path in files:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if file_path.endswith("_financial.json"):
+            data = {"financials": data}
+        elif file_path.endswith("_extracted.json"):
+            data = {"proceeds": data}
+
+        start = time.perf_counter()
+        _, issues = validate_document(data)
+        total_seconds += time.perf_counter() - start
+
+        print(f"{file_path}: {len(issues)} issues")
+        for item in issues:
+            print(f"  [{item['target']}] {item['path']} ({item['rule']}): {item['message']}")
+        if issues:
+            print(f"  re-extract: {failing_fields(issues)}")
+
+    if files:
+        print(f"Validated {len(files)} documents, {total_seconds / len(files) * 1e6:.0f} µs per document")
@@ -0,0 +1,178 @@
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+import fitz  # pymupdf is imported as fitz
+
+import extraction_planner
+from output_store import parse_period
+from pdf_writer import write_pages
+from tracing import span
+from validation import is_missing, item_key
+
+# Past this many pages one request fails or gets sloppy, the document goes out in windows
+MAX_PAGES_PER_REQUEST = 120
+WINDOW_PAGES = 60
+# Tables running over a window edge are seen whole by one of the two windows
+WINDOW_OVERLAP = 5
+MAX_WINDOW_WORKERS = 4
+
+
+def windows(num_pages, window_pages=WINDOW_PAGES, overlap=WINDOW_OVERLAP):
+    """Overlapping (start, end) page ranges covering the document, end exclusive."""
+    if num_pages <= window_pages:
+        return [(0, num_pages)]
+    step = max(1, window_pages - overlap)
+    ranges = []
+    start = 0
+    while True:
+        end = min(start + window_pages, num_pages)
+        ranges.append((start, end))
+        if end == num_pages:
+            return ranges
+        start += step
+
+
+def latest_year(value):
+    """The latest FYE/FPE year mentioned in the keys of any dict in the value, 0 if none."""
+    if isinstance(value, dict):
+        years = [parse_period(key)[1] or 0 for key in value if isinstance(key, str)]
+        return max(years + [latest_year(item) for item in value.values()], default=0)
+    if isinstance(value, list):
+        return max((latest_year(item) for item in value), default=0)
+    return 0
+
+
+def merge_values(values):
+    """
+    Merge the answers of several windows for one field, most preferred first.
+
+    Dicts are merged key by key (so FYE lists get every year any window saw,
+    in order), lists are joined without duplicates (an item seen by two
+    windows is taken from the preferred one), anything else is the preferred
+    window's answer.
+    """
+    present = [value for value in values if not is_missing(value)]
+    if not present:
+        return values[0] if values else None
+    first = present[0]
+
+    if isinstance(first, dict):
+        dicts = [value for value in present if isinstance(value, dict)]
+        keys = []
+        for value in dicts:
+            keys += [key for key in value if key not in keys]
+        if all(parse_period(str(key))[1] for key in keys):
+            # FYE 2022, FYE 2023, FPE 2023, FYE 2024: by year, the full year before the part-year period
+            keys.sort(key=lambda key: (parse_period(key)[1], parse_period(key)[0] != "FYE"))
+        return {key: merge_values([value.get(key) for value in dicts]) for key in keys}
+
+    if isinstance(first, list):
+        merged = {}
+        for value in present:
+            if isinstance(value, list):
+                for item in value:
+                    merged.setdefault(item_key(item), item)
+        return list(merged.values())
+
+    return first
+
+
+def merge_windows(window_results, targets, page_numbers=None):
+    """
+    Merge the per-window results into one answer per target, deterministically.
+
+    Windows that saw a later financial year are preferred, then earlier
+    windows, so the merge does not depend on which window finished first.
+
+    Args:
+        window_results (list): ((start, end), {target: data}) per window.
+        page_numbers (list): Page of the source PDF for every page of the
+                             windowed PDF (e.g. the abridger's selection), so
+                             provenance points at the original document.
+
+    Returns:
+        tuple: (results, provenance) where provenance is {target: {field: [[first page, last page], ...]}}
+               with 1-based pages of the windows that the field's value came from.
+               The model does not say which page it read a value on, so this
+               is the window's page range, not the page of the value.
+    """
+    def pages(window):
+        start, end = window
+        if page_numbers:
+            return [page_numbers[start] + 1, page_numbers[end - 1] + 1]
+        return [start + 1, end]
+
+    results = {}
+    provenance = {}
+    for target in targets:
+        answers = [(window, data.get(target) if isinstance(data.get(target), dict) else {})
+                   for window, data in window_results]
+        answers.sort(key=lambda answer: (-latest_year(answer[1]), answer[0]))
+
+        fields = []
+        for _, data in answers:
+            fields += [field for field in data if field not in fields]
+
+        results[target] = {}
+        provenance[target] = {}
+        for field in fields:
+            values = [(window, data.get(field)) for window, data in answers]
+            merged = merge_values([value for _, value in values])
+            results[target][field] = merged
+            contributing = [window for window, value in values if not is_missing(value)]
+            if not isinstance(merged, (dict, list)):
+                contributing = contributing[:1]
+            provenance[target][field] = [pages(window) for window in sorted(contributing)]
+    return results, provenance
+
+
+def extract_window(pdf_data, window, targets, prompts, document_id=None, model=extraction_planner.MODEL):
+    """Extract the targets from the PDF of one window's pages."""
+    start, end = window
+    with span("extract_window", document_id=document_id, first_page=start + 1, last_page=end, bytes=len(pdf_data)):
+        plan = extraction_planner.plan_extraction(end - start, targets, prompts, document_id, log=False)
+        results = extraction_planner.run_plan(pdf_data, plan, prompts, model)
+    if not any(results.values()):
+        print(f"ERROR: No data from pages {start + 1}-{end} of {document_id}")
+    return results
+
+
+def extract_windowed(pdf_data, targets, prompts, document_id=None, page_numbers=None,
+                     window_pages=WINDOW_PAGES, overlap=WINDOW_OVERLAP, max_workers=MAX_WINDOW_WORKERS,
+                     model=extraction_planner.MODEL):
+    """
+    Map-reduce extraction for documents too long for one request: every
+    overlapping window of pages is extracted against the same prompts at the
+    same time, then the answers are merged with merge_windows.
+
+    Returns:
+        tuple: (results, provenance) as merge_windows.
+    """
+    doc = fitz.open(stream=pdf_data, filetype="pdf")
+    try:
+        ranges = windows(len(doc), window_pages, overlap)
+        print(f"Extracting {document_id} in {len(ranges)} windows of up to {window_pages} pages")
+        with span("extract_windowed", document_id=document_id, pages=len(doc), windows=len(ranges)):
+            # The windows are cut one after the other (a fitz document is not shared across threads),
+            # the model calls run concurrently
+            window_pdfs = {window: write_pages(doc, list(range(*window)), None, writer="insert") for window in ranges}
+    finally:
+        doc.close()
+
+    def run(window):
+        return window, extract_window(window_pdfs[window], window, targets, prompts, document_id, model)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        window_results = list(executor.map(run, ranges))
+    return merge_windows(window_results, targets, page_numbers)
+
+
+if __name__ == "__main__":
+    # Usage: python windowed_extract.py <abridged pdf> [window pages]
+    pdf_path = sys.argv[1]
+    window_pages = int(sys.argv[2]) if len(sys.argv) > 2 else WINDOW_PAGES
+    targets = ("financials", "proceeds")
+    prompts = {target: extraction_planner.read_target_prompt(target) for target in targets}
+    results, provenance = extract_windowed(extraction_planner.load_pdf(pdf_path), targets, prompts,
+                                           pdf_path, window_pages=window_pages)
+    print(json.dumps({"results": results, "provenance": provenance}, indent=4, ensure_ascii=False))